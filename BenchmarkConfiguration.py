@@ -1,4 +1,11 @@
+import time
+
 from ProgramConfiguration import *
+from Executor import *
+from Fingerprint import *
+from InputTier import *
+from JobMonitor import *
+from Tracing import *
 
 
 class PairedBenchmarkConfiguration:
@@ -6,6 +13,8 @@ class PairedBenchmarkConfiguration:
     A class to store configurations to benchmark programs that require paired input files (e.g. normal treated).
     """
 
+    cache_dirname = 'cache'
+
     def __init__(self, file, out):
         """
         Initialise a BenchmarkConfiguration object.
@@ -15,6 +24,7 @@ class PairedBenchmarkConfiguration:
         self.file = file
         self.configurations = {}
         self.out = out
+        self.tier = None # Set by self.make_dir_structure()
         self.parse_tsv()
 
     def parse_tsv(self):
@@ -24,11 +34,12 @@ class PairedBenchmarkConfiguration:
         """
         logging.info("Parse configuration file: {0}".format(self.file))
         count_config = 0
-        with open(self.file) as stream:
+        with tracer.span('parse_tsv', 'parse', file=self.file) as span, open(self.file) as stream:
             tmp_line_index = 0
             for tmp_line in stream:
                 tmp_line_index += 1
                 count_config += self.add_configuration(tmp_line.strip())
+            span.set('n_configurations', count_config)
         logging.info("{0} lines parsed in {1}.".format(tmp_line_index, self.file))
         logging.info("{0} configurations imported.".format(count_config))
         return None
@@ -43,7 +54,12 @@ class PairedBenchmarkConfiguration:
             return 0
         config_split = config_line.split('\t')
         config_num_fields = len(config_split)
-        if config_num_fields == 2:
+        resources = None
+        if config_num_fields == 3:
+            (program, params, resources) = config_split
+            parsed_params = self.parse_params(params) if params else {}
+            resources = Resources.parse(resources)
+        elif config_num_fields == 2:
             (program, params) = config_split
             parsed_params = self.parse_params(params)
         elif config_num_fields == 1:
@@ -52,17 +68,17 @@ class PairedBenchmarkConfiguration:
         else:
             raise ValueError("Invalid number of TAB-separated fields in config line: {0}".format(config_num_fields))
         if program in self.configurations.keys():
-            self.configurations[program].add_configuration(parsed_params)
-        else:
-            self.configurations[program] = self.select_program_config(parsed_params, program)
-        return 1
+            return self.configurations[program].add_configuration(parsed_params, resources)
+        self.configurations[program] = self.select_program_config(parsed_params, program, resources)
+        return self.configurations[program].n_configurations
 
     @staticmethod
     def parse_params(params):
         """
         Parse benchmark parameters. Expected format: '--flag1=value1;-flag2=value2;flag3;flag4=value4'.
+        Values may specify lists or ranges of values to sweep (see ParamSweep), expanded later.
         :param params: Parameters to supply to the program.
-        :return: None
+        :return: Dictionary of parameter flags and value specifications (or None for toggle flags).
         """
         parsed_params = {}
         keys_values = params.split(';')
@@ -76,74 +92,176 @@ class PairedBenchmarkConfiguration:
         return parsed_params
 
     @staticmethod
-    def select_program_config(params, program):
+    def select_program_config(params, program, resources=None):
         """
         Create a ProgramConfiguration object adapted to a given program.
         :param params: Dictionary of flag/value pairs. Toggle flags are assigned None value.
         :param program: Name of the program to benchmark.
+        :param resources: Resources object of the configuration (optional).
         :return: An object that extends the ProgramConfiguration class.
         """
         if program == "MuTect2":
-            return MuTect2PairedConfiguration(params, program)
+            return MuTect2PairedConfiguration(params, program, resources)
         elif program == "Strelka":
-            return StrelkaPairedConfiguration(params, program)
+            return StrelkaPairedConfiguration(params, program, resources)
         elif program == "Virmid":
-            return VirmidPairedConfiguration(params, program)
+            return VirmidPairedConfiguration(params, program, resources)
         elif program == "EBCall":
-            return EBCallPairedConfiguration(params, program)
+            return EBCallPairedConfiguration(params, program, resources)
         elif program == "VarScan":
-            return VarScanPairedConfiguration(params, program)
+            return VarScanPairedConfiguration(params, program, resources)
         elif program == "CaVEMan":
-            return CaVEManPairedConfiguration(params, program)
+            return CaVEManPairedConfiguration(params, program, resources)
         else:
             raise ValueError('Invalid program keyword: {0}'.format(program))
 
-    def make_dir_structure(self):
+    def set_resources(self, resources):
+        """
+        Override the default resources of programs. Resources change the commands of configurations (threads,
+        JVM heap) and thus their fingerprints: they must be set before folders are created.
+        :param resources: Dictionary of Resources objects by program name.
+        :return: None
+        """
+        for (program_name, program_resources) in resources.items():
+            if program_name not in self.configurations.keys():
+                logging.warning("No configuration of program {0}: resources ignored.".format(program_name))
+                continue
+            self.configurations[program_name].set_resources(program_resources)
+        return None
+
+    def make_dir_structure(self, ref, file1, file2, tier=None):
         """
         Create the directory structure for the benchmark.
+        If the root folder exists, the benchmark is resumed: configurations already completed are not run again.
         Side-effect: update configurations to define the individual output folder for each configuration.
+        :param ref: Reference genome Fasta file.
+        :param file1: Input file for reference group (e.g. normal).
+        :param file2: Input file for target group (e.g. tumour).
+        :param tier: If not None, run configurations on a tier of the input files: contigs (e.g. 'chr22')
+        or a fraction of reads (e.g. '0.05'); see InputTier.
         :return: None
         """
-        self.make_output_dir()
-        self.make_program_dirs()
+        with tracer.span('make_dir_structure', 'make_dir'):
+            reference = ReferenceIndex.get("{0}.fai".format(ref))
+            logging.info("Reference genome: {0} contigs, {1} bp".format(len(reference), reference.genome_size))
+            self.make_output_dir()
+            inputs = {
+                'ref': Fingerprint.file_identity(ref),
+                'ref_fai': Fingerprint.file_identity("{0}.fai".format(ref)),
+                'file1': Fingerprint.file_identity(file1),
+                'file2': Fingerprint.file_identity(file2)
+            }
+            if tier is not None:
+                self.tier = InputTier(tier)
+                self.tier.make_tier_dir(self.out, os.path.join(self.out, self.cache_dirname), ref, inputs)
+                # Configurations run on the tier are cached apart from those run on the whole input files
+                inputs['tier'] = self.tier.fingerprint
+            self.make_program_dirs(inputs)
         return None
 
     def make_output_dir(self):
         """
-        Create the root folder for all outputs of this benchmark run.
+        Create the root folder for all outputs of this benchmark run, and the cache of configuration outputs.
         :return: None
         """
         logging.info("Create benchmark output folder: {0}".format(self.out))
-        os.makedirs(self.out)
+        os.makedirs(os.path.join(self.out, self.cache_dirname), exist_ok=True)
         return None
 
-    def make_program_dirs(self):
+    def make_program_dirs(self, inputs):
         """
         Create a folder for each program tested; delegate creation of folders for each configuration tested.
+        Identical configurations (same program, parameters, tools and inputs) share a single cache folder.
         Side-effect: update configurations to define the individual output folder for each configuration.
+        :param inputs: Dictionary of identities of input files (see Fingerprint.file_identity()).
         :return: None
         """
+        cache_dir = os.path.join(self.out, self.cache_dirname)
+        claimed = set()
+        start = time.monotonic()
         for program in self.configurations.values():
-            program.make_dir_structure(self.out)
+            with tracer.span('program', 'make_dir', program=program.out, n_configurations=program.n_configurations):
+                program.make_dir_structure(self.out, cache_dir, inputs, claimed)
+        self.log_throughput(
+            'Created folders', start, sum([program.n_configurations for program in self.configurations.values()])
+        )
+        return None
+
+    def log_throughput(self, action, start, n_configurations):
+        """
+        Log the count of configurations processed per second by a phase of script generation.
+        :param action: Description of the phase.
+        :param start: Value of time.monotonic() at the start of the phase.
+        :param n_configurations: Count of configurations processed.
+        :return: None
+        """
+        elapsed = time.monotonic() - start
+        logging.info("{0} of {1} configurations in {2:.2f} s ({3:.0f} configurations/s, {4} threads)".format(
+            action, n_configurations, elapsed, n_configurations / elapsed if elapsed > 0 else 0, io_threads
+        ))
         return None
 
-    def write_scripts(self, ref, file1, file2):
+    def write_scripts(
+            self, ref, file1, file2, sample_interval=None, sample_budget=0.01, split_size=None, split_tasks=None,
+            scatter=False, truth=None, confident_regions=None):
         """
         Write a shell script for each configuration.
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
         :param file2: Input file for target group (e.g. tumour).
+        :param sample_interval: If not None, sample resource usage of each command at this interval (seconds).
+        :param sample_budget: Maximal fraction of one core used by the sampler.
+        :param split_size: Target size of genome regions processed by each array task (bp).
+        :param split_tasks: Target count of array tasks (ignored if split_size is given).
+        :param scatter: Run each configuration of MuTect2, VarScan and Virmid as one array task per chunk of the genome.
+        :param truth: VCF file of true variants to score the calls of each configuration (optional).
+        :param confident_regions: BED file of confident regions of the truth set (optional).
         :return: None
         """
-        for program in self.configurations.values():
-            program.write_scripts(self.out, ref, file1, file2)
+        if self.tier is not None:
+            if self.tier.status == 'pending':
+                self.tier.write_tier_script(file1, file2)
+            (file1, file2) = self.tier.bam_files()
+        start = time.monotonic()
+        with tracer.span('write_scripts', 'write'):
+            for (program_name, program) in self.configurations.items():
+                program.set_splitting(split_size, split_tasks, scatter)
+                if sample_interval is not None:
+                    program.set_sampling(sample_interval, sample_budget)
+                if truth is not None:
+                    program.set_evaluation(truth, confident_regions)
+                if self.tier is not None:
+                    program.set_tier(self.tier)
+                with tracer.span('program', 'write', program=program_name, n_pending=len(program.pending)):
+                    program.write_scripts(self.out, ref, file1, file2)
+                    program.write_postprocess_scripts(self.out, ref)
+        n_pending = sum([len(program.pending) for program in self.configurations.values()])
+        self.log_throughput('Wrote scripts', start, n_pending)
         return None
 
-    def submit_scripts(self):
+    def submit_scripts(self, executor, array_jobs=False, array_limit=None):
         """
-        Run all benchmark scripts.
-        :return:
+        Run all benchmark scripts: the stages of all programs form a single graph (see StageGraph), so that
+        independent branches are submitted concurrently. The first jobs of all programs depend on the tier, if it must
+        be created.
+        :param executor: Executor object that runs jobs (e.g. SGEExecutor, LocalExecutor).
+        :param array_jobs: Submit the configurations of each program as a single array job, where possible.
+        :param array_limit: Maximal count of configurations of each program that run concurrently (array jobs).
+        :return: None
         """
-        for program in self.configurations.values():
-            program.submit_scripts(self.out)
+        executor.set_manifest(JobManifest(self.out))
+        with tracer.span('submit_scripts', 'submit'):
+            graph = StageGraph()
+            depends = None
+            if self.tier is not None and self.tier.status == 'pending':
+                if any([program.pending for program in self.configurations.values()]):
+                    depends = [self.tier.add_tier_stage(graph)]
+            for program in self.configurations.values():
+                program.set_array_jobs(array_jobs, array_limit)
+                with tracer.span('program', 'submit', program=program.out, array_jobs=array_jobs):
+                    program.add_stages(self.out, graph, depends)
+            with tracer.span('stage_graph', 'submit', n_stages=len(graph)):
+                graph.submit(executor, submit_threads)
+            with tracer.span('wait', 'submit', executor=type(executor).__name__):
+                executor.wait()
         return None
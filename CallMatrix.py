@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import fcntl
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import sys
+
+# Custom
+from CallParsers import *
+
+
+def popcount(bits):
+    """
+    :param bits: Bit set (non-negative int).
+    :return: Count of bits set.
+    """
+    return bin(bits).count('1')
+
+
+class CallMatrix:
+    """
+    A class to store which configurations call which variants, as a variants x configurations bit matrix.
+    Variants get an identifier in order of discovery (append-only), so that the matrix grows incrementally:
+    - 'variants.sqlite': identifier of each variant by key (contig index, position, reference, alternate), stored in
+      key order, so that an update only looks up the calls it adds, and queries read variants sorted by key
+    - 'columns.bin': bit set of the calls of each configuration (bit i set if variant i is called), memory-mapped
+    - 'columns.json': name, cache folder, offset and size of each column, count of variants, size of the file above,
+      names of contigs, and configurations whose calls could not be parsed
+    Columns are identified by the cache folder of the configuration: a column whose configuration links to another
+    cache folder (e.g. after resuming a benchmark with another configuration file) is replaced.
+    Each post-processing job updates the matrix: configurations that are already columns (or failed) are skipped by
+    reading their links only, without the lock, which is only taken when there is something to add or replace.
+    Queries combine whole columns with bitwise operations on integers (one operation per configuration).
+    """
+
+    version = 2  # Format of the matrix; a matrix of another format is built again
+    obsolete_filenames = ('variants.txt', 'order.bin')  # Files of the first format, removed when built again
+    variants_filename = 'variants.sqlite'
+    columns_filename = 'columns.bin'
+    index_filename = 'columns.json'
+    lock_filename = 'matrix.lock'
+    completed_filename = 'benchmark_completed'  # Marker of completed configurations (see SinglePairedConfiguration)
+    pattern_config = re.compile(r'^config_(\d+)$')
+
+    def __init__(self, matrix_dir):
+        """
+        Initialise a CallMatrix object.
+        :param matrix_dir: Folder of the matrix (e.g. '<out>/matrix').
+        """
+        self.matrix_dir = matrix_dir
+        self.columns = []
+        self.n_variants = 0
+        self.columns_size = 0
+        self.all_calls = None
+        self.contigs = []
+        self.failed = {} # Cache folders of configurations whose calls could not be parsed, by name
+        self.load()
+
+    def path(self, filename):
+        """
+        :param filename: Name of a file of the matrix.
+        :return: Path to the file.
+        """
+        return os.path.join(self.matrix_dir, filename)
+
+    def load(self):
+        """
+        Load the index of the matrix, if any.
+        :return: None
+        """
+        if not os.path.exists(self.path(self.index_filename)):
+            return None
+        with open(self.path(self.index_filename)) as stream:
+            index = json.load(stream)
+        if index.get('version') != self.version:
+            logging.warning("Matrix {0} has another format: it is built again".format(self.matrix_dir))
+            for filename in self.obsolete_filenames:
+                if os.path.exists(self.path(filename)):
+                    os.remove(self.path(filename))
+            return None
+        self.columns = index['columns']
+        self.n_variants = index['n_variants']
+        self.columns_size = index['columns_size']
+        self.all_calls = index['all_calls']
+        self.contigs = index['contigs']
+        self.failed = index['failed']
+        return None
+
+    def names(self):
+        """
+        :return: Names of the configurations (columns), e.g. 'MuTect2/config_1'.
+        """
+        return [column['name'] for column in self.columns]
+
+    @staticmethod
+    def target(config_dir):
+        """
+        :param config_dir: Folder of a configuration (link to its cache folder).
+        :return: Name of the cache folder of the configuration (one system call for a link).
+        """
+        try:
+            return os.path.basename(os.readlink(config_dir))
+        except OSError:
+            return os.path.basename(os.path.realpath(config_dir))
+
+    def configurations(self, out):
+        """
+        :param out: Folder of the outputs of the benchmark.
+        :return: List of (name, program, folder, cache folder) of configurations, by program and index.
+        """
+        configs = []
+        for program in sorted(parsers.keys()):
+            program_folder = os.path.join(out, program)
+            if not os.path.isdir(program_folder):
+                continue
+            indices = []
+            for entry in os.listdir(program_folder):
+                match = self.pattern_config.match(entry)
+                if match is not None:
+                    indices.append(int(match.group(1)))
+            for index in sorted(indices):
+                config_dir = os.path.join(program_folder, "config_{0}".format(index))
+                configs.append(("{0}/config_{1}".format(program, index), program, config_dir, self.target(config_dir)))
+        return configs
+
+    def changes(self, configs):
+        """
+        :param configs: List of configurations (see self.configurations()).
+        :return: Tuple of the columns that are not stale (their configuration links to the same cache folder), and
+        the list of completed configurations that are neither columns nor failed.
+        """
+        targets = {name: target for (name, _, _, target) in configs}
+        columns = [column for column in self.columns if targets.get(column['name']) == column['target']]
+        known = set([column['name'] for column in columns])
+        new = [
+            config for config in configs if config[0] not in known and self.failed.get(config[0]) != config[3] and
+            os.path.exists(os.path.join(config[2], self.completed_filename))
+        ]
+        return columns, new
+
+    def connect(self):
+        """
+        :return: Connection to the variant database (created if needed).
+        """
+        db = sqlite3.connect(self.path(self.variants_filename))
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS variants (contig INTEGER, pos INTEGER, ref TEXT, alt TEXT, id INTEGER, '
+            'PRIMARY KEY (contig, pos, ref, alt)) WITHOUT ROWID'
+        )
+        return db
+
+    def update(self, out, ref_index, all_calls=False):
+        """
+        Add the calls of the configurations completed since the last update, and replace the columns of configurations
+        that link to another cache folder (under a lock: several jobs may update the matrix concurrently).
+        Configurations whose calls cannot be parsed are logged and skipped, until they link to another cache folder.
+        :param out: Folder of the outputs of the benchmark.
+        :param ref_index: ReferenceIndex object of the reference genome.
+        :param all_calls: If True, add all calls; otherwise, only calls that passed the filters of the program.
+        :return: Count of configurations added.
+        """
+        os.makedirs(self.matrix_dir, exist_ok=True)
+        configs = self.configurations(out)
+        (columns, new) = self.changes(configs)
+        if not new and len(columns) == len(self.columns):
+            return 0
+        with open(self.path(self.lock_filename), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another job may have updated the matrix while waiting for the lock
+            self.load()
+            if self.all_calls is not None and self.all_calls != all_calls:
+                raise ValueError("Matrix {0} was built with all_calls={1}".format(self.matrix_dir, self.all_calls))
+            self.all_calls = all_calls
+            self.contigs = ref_index.names
+            n_columns = len(self.columns)
+            (self.columns, configs) = self.changes(configs)
+            if not configs and len(self.columns) == n_columns:
+                return 0
+            added = 0
+            db = self.connect()
+            try:
+                # Discard data added by an update that did not complete
+                db.execute('DELETE FROM variants WHERE id >= ?', (self.n_variants,))
+                with open(self.path(self.columns_filename), 'ab') as columns_stream:
+                    columns_stream.truncate(self.columns_size)
+                    for (name, program, config_dir, target) in configs:
+                        logging.info("Add calls of {0}".format(name))
+                        try:
+                            calls = self.parse_calls(CallParser.get(program, ref_index), config_dir, all_calls)
+                        except ValueError as err:
+                            logging.error("Calls of {0} not added: {1}".format(name, err))
+                            self.failed[name] = target
+                            continue
+                        except OSError as err:
+                            logging.error("Calls of {0} not added (retried at the next update): {1}".format(name, err))
+                            continue
+                        self.failed.pop(name, None)
+                        column = self.make_column(db, calls)
+                        columns_stream.write(column)
+                        self.columns.append({
+                            'name': name, 'target': target, 'offset': self.columns_size, 'size': len(column),
+                            'calls': len(calls)
+                        })
+                        self.columns_size += len(column)
+                        added += 1
+                db.commit()
+            finally:
+                db.close()
+            self.write_index()
+        return added
+
+    @staticmethod
+    def parse_calls(call_parser, config_dir, all_calls=False):
+        """
+        Parse all calls of a configuration before any is added, so that a parse error leaves the matrix unchanged.
+        :param call_parser: CallParser object of the program.
+        :param config_dir: Folder of the configuration.
+        :param all_calls: If True, keep all calls; otherwise, only calls that passed the filters of the program.
+        :return: Set of variant keys (contig index, position, reference, alternate).
+        """
+        calls = set()
+        for variant in call_parser.parse(config_dir):
+            if all_calls or call_parser.passed(variant):
+                calls.add(tuple(variant[:4]))
+        return calls
+
+    def make_column(self, db, calls):
+        """
+        Look up the identifiers of calls in one query (calls are joined against the variants from a temporary table),
+        giving new identifiers to variants not seen before, in key order.
+        :param db: Connection to the variant database.
+        :param calls: Set of variant keys.
+        :return: Bit set of the calls (bytearray).
+        """
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS calls (contig INTEGER, pos INTEGER, ref TEXT, alt TEXT)')
+        db.execute('DELETE FROM temp.calls')
+        db.executemany('INSERT INTO temp.calls VALUES (?, ?, ?, ?)', calls)
+        column = bytearray()
+        new_variants = []
+        for (contig, pos, ref, alt, variant_id) in db.execute(
+                'SELECT contig, pos, ref, alt, id FROM temp.calls LEFT JOIN variants USING (contig, pos, ref, alt) '
+                'ORDER BY contig, pos, ref, alt'):
+            if variant_id is None:
+                variant_id = self.n_variants
+                self.n_variants += 1
+                new_variants.append((contig, pos, ref, alt, variant_id))
+            if variant_id >> 3 >= len(column):
+                column.extend(bytes((variant_id >> 3) + 1 - len(column)))
+            column[variant_id >> 3] |= 1 << (variant_id & 7)
+        db.executemany('INSERT INTO variants VALUES (?, ?, ?, ?, ?)', new_variants)
+        return column
+
+    def write_index(self):
+        """
+        Write the index of the matrix (atomically: it commits the data added to the other files).
+        :return: None
+        """
+        tmp_file = "{0}.tmp.{1}".format(self.path(self.index_filename), os.getpid())
+        with open(tmp_file, 'w') as stream:
+            json.dump({
+                'version': self.version, 'columns': self.columns, 'n_variants': self.n_variants,
+                'columns_size': self.columns_size, 'all_calls': self.all_calls, 'contigs': self.contigs,
+                'failed': self.failed
+            }, stream, indent=1)
+        os.replace(tmp_file, self.path(self.index_filename))
+        return None
+
+    def column(self, name):
+        """
+        :param name: Name of a configuration.
+        :return: Bit set of the calls of the configuration (int).
+        """
+        for column in self.columns:
+            if column['name'] == name:
+                break
+        else:
+            raise ValueError("Configuration not found in {0}: {1}".format(self.matrix_dir, name))
+        if not column['size']:
+            return 0
+        with open(self.path(self.columns_filename), 'rb') as stream:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return int.from_bytes(data[column['offset']:column['offset'] + column['size']], 'little')
+
+    def jaccard(self, names):
+        """
+        :param names: Names of configurations.
+        :return: Generator of (name1, name2, shared calls, Jaccard index) for each pair of configurations.
+        """
+        columns = [self.column(name) for name in names]
+        for (i, j) in itertools.combinations(range(len(names)), 2):
+            union = popcount(columns[i] | columns[j])
+            shared = popcount(columns[i] & columns[j])
+            yield names[i], names[j], shared, shared / union if union else 1.0
+
+    def unique(self, name, others):
+        """
+        :param name: Name of a configuration.
+        :param others: Names of other configurations.
+        :return: Bit set of the calls of the configuration that none of the others calls.
+        """
+        union = 0
+        for other in others:
+            union |= self.column(other)
+        return self.column(name) & ~union
+
+    def intersections(self, names):
+        """
+        Split calls into exclusive intersections (UpSet plot): each call belongs to the set of configurations that call it.
+        :param names: Names of configurations.
+        :return: List of (tuple of names, count of calls), by decreasing count.
+        """
+        columns = [self.column(name) for name in names]
+        union = 0
+        for column in columns:
+            union |= column
+        # Split the calls by each column in turn, keeping non-empty parts only
+        parts = [((), union)]
+        for (name, column) in zip(names, columns):
+            split = []
+            for (members, bits) in parts:
+                (inside, outside) = (bits & column, bits & ~column)
+                if inside:
+                    split.append((members + (name,), inside))
+                if outside:
+                    split.append((members, outside))
+            parts = split
+        return sorted([(members, popcount(bits)) for (members, bits) in parts], key=lambda part: (-part[1], part[0]))
+
+    def keys(self, bits):
+        """
+        :param bits: Bit set of variants.
+        :return: Generator of the keys (contig index, position, reference, alternate) of the variants, sorted.
+        """
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        db = self.connect()
+        try:
+            # Variants are stored in key order: no sort
+            for (contig, pos, ref, alt, variant_id) in db.execute(
+                    'SELECT contig, pos, ref, alt, id FROM variants WHERE id < ? ORDER BY contig, pos, ref, alt',
+                    (self.n_variants,)):
+                if variant_id >> 3 < len(data) and data[variant_id >> 3] & (1 << (variant_id & 7)):
+                    yield contig, pos, ref, alt
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build and query the matrix of the calls of each configuration of a benchmark (in <out>/matrix).'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    parser_update = subparsers.add_parser('update', help='Add the calls of configurations completed since the last update.')
+    parser_update.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_update.add_argument('ref', metavar='ref.fa', help='Reference genome (its Fasta index must exist).')
+    parser_update.add_argument(
+        '-a', '--all-calls', action='store_true',
+        help='Add all calls, including filtered calls (default: calls that passed the filters of the program only).'
+    )
+    parser_jaccard = subparsers.add_parser('jaccard', help='Shared calls and Jaccard index of pairs of configurations.')
+    parser_jaccard.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_jaccard.add_argument('names', metavar='name', nargs='*', help='Configurations (default: all).')
+    parser_unique = subparsers.add_parser('unique', help='Calls of a configuration that none of the others calls.')
+    parser_unique.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_unique.add_argument('name', metavar='name', help='Configuration (e.g. MuTect2/config_1).')
+    parser_unique.add_argument('others', metavar='other', nargs='*', help='Other configurations (default: all).')
+    parser_upset = subparsers.add_parser('upset', help='Counts of calls of each exclusive intersection of configurations.')
+    parser_upset.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_upset.add_argument('names', metavar='name', nargs='+', help='Configurations.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command is None:
+        parser.error('a command is required')
+    try:
+        matrix = CallMatrix(os.path.join(args.out, 'matrix'))
+        if args.command == 'update':
+            added = matrix.update(args.out, ReferenceIndex.get("{0}.fai".format(args.ref)), args.all_calls)
+            logging.info("{0} configurations added ({1} variants)".format(added, matrix.n_variants))
+        elif args.command == 'jaccard':
+            for (name1, name2, shared, jaccard) in matrix.jaccard(args.names or matrix.names()):
+                sys.stdout.write("{0}\t{1}\t{2}\t{3:.4f}\n".format(name1, name2, shared, jaccard))
+        elif args.command == 'unique':
+            others = args.others or [name for name in matrix.names() if name != args.name]
+            for key in matrix.keys(matrix.unique(args.name, others)):
+                sys.stdout.write("{0}\t{1}\t{2}\t{3}\n".format(
+                    matrix.contigs[key[0]], key[1], key[2] or '-', key[3] or '-'
+                ))
+        elif args.command == 'upset':
+            for (members, count) in matrix.intersections(args.names):
+                sys.stdout.write("{0}\t{1}\n".format(count, ','.join(members)))
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
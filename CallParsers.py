@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import collections
+import glob
+import gzip
+import logging
+import os
+import sys
+
+# Custom
+from ReferenceIndex import *
+
+# Common record of a call: index of the contig in the reference index, 1-based position and alleles
+# in their minimal representation (shared prefix and suffix removed, '' for the empty allele),
+# FILTER value (or status, for tools that do not filter) and score (float, or None if unavailable)
+Variant = collections.namedtuple('Variant', ['contig', 'pos', 'ref', 'alt', 'filter', 'score'])
+
+
+class CallParser:
+    """
+    A class to read the calls of one configuration of a program, from its native output files.
+    Calls are generated one at a time (constant memory), as Variant tuples, so that the calls of
+    different programs can be compared: e.g. the VCF deletion 'ACG>A' at 100 and the VarScan
+    deletion 'A>-CG' at 100 both give the record (contig, 101, 'CG', '').
+    """
+
+    patterns = []  # Glob patterns of output files, relative to the folder of the configuration
+    score_key = None  # INFO key of the score (VCF); QUAL is used if None
+    passed_filters = ('PASS', '.')  # FILTER values of calls that passed the filters of the program
+
+    def __init__(self, ref_index):
+        """
+        Initialise a CallParser object.
+        :param ref_index: ReferenceIndex object of the reference genome (contig names to indices).
+        """
+        self.ref_index = ref_index
+        self.lookup = ref_index.lookup
+
+    @staticmethod
+    def get(program, ref_index):
+        """
+        :param program: Name of the program.
+        :param ref_index: ReferenceIndex object of the reference genome.
+        :return: CallParser object of the program.
+        """
+        if program not in parsers:
+            raise ValueError("No parser for program: {0} (expected one of {1})".format(
+                program, ', '.join(sorted(parsers.keys()))
+            ))
+        return parsers[program](ref_index)
+
+    def passed(self, variant):
+        """
+        :param variant: Variant tuple.
+        :return: True if the call passed the filters of the program.
+        """
+        return variant.filter in self.passed_filters
+
+    def files(self, config_dir):
+        """
+        :param config_dir: Folder of the configuration.
+        :return: Sorted list of output files of the configuration.
+        """
+        files = set()
+        for pattern in self.patterns:
+            files.update(glob.glob(os.path.join(config_dir, pattern)))
+        return sorted(files)
+
+    def parse(self, config_dir):
+        """
+        :param config_dir: Folder of the configuration.
+        :return: Generator of Variant tuples, file by file, in the order of each file.
+        """
+        for path in self.files(config_dir):
+            logging.info("Parse calls: {0}".format(path))
+            for variant in self.parse_file(path):
+                yield variant
+
+    def parse_file(self, path):
+        """
+        Parse a VCF file; multi-allelic records give one call per alternate allele.
+        :param path: VCF file (plain or gzip-compressed).
+        :return: Generator of Variant tuples.
+        """
+        with self.open_text(path) as stream:
+            for line in stream:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t', 8)
+                if len(fields) < 8:
+                    continue
+                alts = fields[4].split(',')
+                scores = self.vcf_scores(fields, len(alts))
+                for (alt, score) in zip(alts, scores):
+                    if alt in ('.', '*') or alt.startswith('<'):
+                        continue  # no call, or symbolic allele
+                    yield self.record(path, fields[0], int(fields[1]), fields[3], alt, fields[6], score)
+
+    def vcf_scores(self, fields, n_alts):
+        """
+        :param fields: Fields of a VCF line (at least 8).
+        :param n_alts: Count of alternate alleles.
+        :return: List of the score of each alternate allele (from INFO/score_key, or QUAL).
+        """
+        if self.score_key is None:
+            values = [fields[5]]
+        else:
+            values = self.info_value(fields[7], self.score_key)
+            values = [None] if values is None else values.split(',')
+        if len(values) != n_alts:
+            values = values[:1] * n_alts
+        return [self.parse_score(value) for value in values]
+
+    @staticmethod
+    def info_value(info, key):
+        """
+        :param info: INFO field of a VCF line.
+        :param key: INFO key.
+        :return: Value of the key (string), or None if absent or a flag.
+        """
+        prefix = key + '='
+        for entry in info.split(';'):
+            if entry.startswith(prefix):
+                return entry[len(prefix):]
+        return None
+
+    @staticmethod
+    def parse_score(value):
+        """
+        :param value: Score (string), or None.
+        :return: Score (float), or None if missing or not a number.
+        """
+        if value is None or value == '.':
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def open_text(path):
+        """
+        :param path: Text file, gzip-compressed if its name ends with '.gz'.
+        :return: Text stream.
+        """
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt')
+        return open(path)
+
+    def record(self, path, contig, pos, ref, alt, filter_value, score):
+        """
+        Build the common record of a call, with alleles in their minimal representation.
+        :param path: File of the call (for error messages).
+        :param contig: Name of the contig.
+        :param pos: 1-based position of the first base of the reference allele.
+        :param ref: Reference allele ('' or '-' if empty).
+        :param alt: Alternate allele ('' or '-' if empty).
+        :param filter_value: FILTER value or status.
+        :param score: Score (float or None).
+        :return: Variant tuple.
+        """
+        try:
+            contig_index = self.lookup[contig]
+        except KeyError:
+            raise ValueError("Contig not found in {0}: {1} ({2})".format(self.ref_index.ref_fai, contig, path))
+        ref = ref.upper().strip('-')
+        alt = alt.upper().strip('-')
+        # Remove the shared suffix, then the shared prefix (e.g. the anchor base of VCF indels)
+        while ref and alt and ref[-1] == alt[-1] and (len(ref) > 1 or len(alt) > 1):
+            (ref, alt) = (ref[:-1], alt[:-1])
+        prefix = 0
+        while prefix < len(ref) and prefix < len(alt) and ref[prefix] == alt[prefix]:
+            prefix += 1
+        return Variant(
+            contig_index, pos + prefix, ref[prefix:], alt[prefix:], sys.intern(filter_value), score
+        )
+
+
+class MuTect2Parser(CallParser):
+    """
+    Calls of MuTect2 ('output.vcf'), scored by the tumour LOD (TLOD).
+    """
+
+    patterns = ['output.vcf']
+    score_key = 'TLOD'
+
+
+class StrelkaParser(CallParser):
+    """
+    Calls of Strelka ('analysis/results/all.somatic.*.vcf', which include filtered calls),
+    scored by the somatic quality of SNVs (QSS) or indels (QSI).
+    """
+
+    patterns = [os.path.join('analysis', 'results', 'all.somatic.snvs.vcf'),
+                os.path.join('analysis', 'results', 'all.somatic.indels.vcf')]
+
+    def vcf_scores(self, fields, n_alts):
+        """
+        :param fields: Fields of a VCF line (at least 8).
+        :param n_alts: Count of alternate alleles.
+        :return: List of the score of each alternate allele (QSS, or QSI for indels).
+        """
+        value = self.info_value(fields[7], 'QSS')
+        if value is None:
+            value = self.info_value(fields[7], 'QSI')
+        return [self.parse_score(value)] * n_alts
+
+
+class VirmidParser(CallParser):
+    """
+    Somatic calls of Virmid ('*.som.passed.vcf'), scored by QUAL.
+    """
+
+    patterns = ['*.som.passed.vcf']
+
+
+class CaVEManParser(CallParser):
+    """
+    Somatic calls of CaVEMan ('results/<contig>/*.muts.vcf', possibly compressed), scored by the
+    somatic mutation probability (MP).
+    """
+
+    patterns = [os.path.join('results', '*', '*.muts.vcf'), os.path.join('results', '*', '*.muts.vcf.gz')]
+    score_key = 'MP'
+
+
+class VarScanParser(CallParser):
+    """
+    Calls of VarScan somatic: native tab-separated files ('output.snp', 'output.indel'), or VCF files
+    ('output.snp.vcf', 'output.indel.vcf') with '--output-vcf 1'.
+    The FILTER value is the somatic status (e.g. 'Somatic', 'Germline', 'LOH'); the score is the somatic p-value.
+    """
+
+    patterns = ['output.snp', 'output.indel', 'output.snp.vcf', 'output.indel.vcf']
+    score_key = 'SPV'
+    passed_filters = ('Somatic',)
+    somatic_status = {'0': 'Reference', '1': 'Germline', '2': 'Somatic', '3': 'LOH', '5': 'Unknown'} # INFO/SS codes
+
+    def parse_file(self, path):
+        """
+        :param path: Native or VCF output file of VarScan.
+        :return: Generator of Variant tuples.
+        """
+        if path.endswith('.vcf'):
+            for variant in CallParser.parse_file(self, path):
+                yield variant
+            return
+        with self.open_text(path) as stream:
+            for line in stream:
+                fields = line.rstrip('\n').split('\t', 15)
+                if len(fields) < 15 or fields[0] == 'chrom':
+                    continue
+                (contig, pos, ref, var) = fields[:4]
+                pos = int(pos)
+                if var.startswith('+'):
+                    (ref, alt) = (ref, ref + var[1:])  # insertion after the reference base
+                elif var.startswith('-'):
+                    (ref, alt) = (ref + var[1:], ref)  # deletion after the reference base
+                else:
+                    alt = var
+                yield self.record(path, contig, pos, ref, alt, fields[12], self.parse_score(fields[14]))
+
+    def vcf_scores(self, fields, n_alts):
+        """
+        :param fields: Fields of a VCF line (at least 8); FILTER is replaced by the somatic status.
+        :param n_alts: Count of alternate alleles.
+        :return: List of the score of each alternate allele (SPV).
+        """
+        status = self.info_value(fields[7], 'SS')
+        if status is not None:
+            fields[6] = self.somatic_status.get(status, status)
+        return CallParser.vcf_scores(self, fields, n_alts)
+
+
+class EBCallParser(CallParser):
+    """
+    Calls of EBCall ('analysis/output.txt'; ANNOVAR-like columns Chr, Start, End, Ref, Obs, ...,
+    with '-' for the empty allele), scored by the last column (minus log10 p-value).
+    EBCall only reports calls that passed its thresholds: the FILTER value is always 'PASS'.
+    """
+
+    patterns = [os.path.join('analysis', 'output.txt')]
+
+    def parse_file(self, path):
+        """
+        :param path: Output file of EBCall.
+        :return: Generator of Variant tuples.
+        """
+        with self.open_text(path) as stream:
+            for line in stream:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 6 or not fields[1].isdigit():
+                    continue  # header
+                (contig, start, ref, obs) = (fields[0], int(fields[1]), fields[3], fields[4])
+                if ref == '-':
+                    start += 1  # insertion after the start position
+                yield self.record(path, contig, start, ref, obs, 'PASS', self.parse_score(fields[-1]))
+
+
+# Parser of each program (same names as in the configuration file)
+parsers = {
+    'MuTect2': MuTect2Parser,
+    'Strelka': StrelkaParser,
+    'Virmid': VirmidParser,
+    'VarScan': VarScanParser,
+    'EBCall': EBCallParser,
+    'CaVEMan': CaVEManParser
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Print the calls of a configuration, from the native output files of the program, as tab-separated '
+                    'lines (contig, position, reference, alternate, filter, score).'
+    )
+    parser.add_argument(
+        'program', choices=sorted(parsers.keys()),
+        help='Program of the configuration.'
+    )
+    parser.add_argument(
+        'ref', metavar='ref.fa',
+        help='Reference genome (its Fasta index ref.fa.fai must exist).'
+    )
+    parser.add_argument(
+        'config_dirs', metavar='config_dir', nargs='+',
+        help='Folder of a configuration (e.g. out/MuTect2/config_1).'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        index = ReferenceIndex.get("{0}.fai".format(args.ref))
+        call_parser = CallParser.get(args.program, index)
+        for config_dir in args.config_dirs:
+            for variant in call_parser.parse(config_dir):
+                sys.stdout.write("{0}\t{1}\t{2}\t{3}\t{4}\t{5}\n".format(
+                    index.names[variant.contig], variant.pos, variant.ref or '-', variant.alt or '-',
+                    variant.filter, '.' if variant.score is None else "{0:.6g}".format(variant.score)
+                ))
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
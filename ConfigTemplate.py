@@ -0,0 +1,69 @@
+import logging
+import os
+import re
+
+
+class ConfigTemplate:
+    """
+    A class to render the configuration file of a program (e.g. Strelka .ini, EBCall config.sh) from a template
+    of 'KEY=VALUE' lines. The template is read once; each configuration sets some of its keys, and keys that the
+    template does not define are rejected before any job is submitted.
+    """
+
+    pattern_key = re.compile(r'^(\w+)\s*=')
+
+    def __init__(self, template_file, separator='='):
+        """
+        Initialise a ConfigTemplate object.
+        :param template_file: Template configuration file.
+        :param separator: Separator written between keys and values of rendered lines (e.g. ' = ').
+        """
+        self.template_file = template_file
+        self.separator = separator
+        try:
+            with open(template_file) as stream:
+                self.lines = stream.readlines()
+        except OSError as err:
+            raise ValueError("Could not read template configuration file {0}: {1}".format(template_file, err))
+        self.keys = set()
+        for line in self.lines:
+            match = self.pattern_key.match(line)
+            if match is not None:
+                self.keys.add(match.group(1))
+
+    def validate(self, values):
+        """
+        :param values: Dictionary of keys and values.
+        :return: None
+        """
+        unknown = sorted([key for key in values.keys() if key not in self.keys])
+        if unknown:
+            raise ValueError("Keys not found in template configuration file {0}: {1}".format(
+                self.template_file, ', '.join(unknown)
+            ))
+        for (key, value) in values.items():
+            if value is None:
+                raise ValueError("Key without value: {0}".format(key))
+            if '\n' in value:
+                raise ValueError("Invalid value of {0} (new line): {1}".format(key, value))
+        return None
+
+    def render(self, values, config_file):
+        """
+        Write the configuration file (atomically), with the lines of the given keys replaced.
+        :param values: Dictionary of keys and values.
+        :param config_file: Configuration file to write.
+        :return: None
+        """
+        self.validate(values)
+        logging.info("Create configuration file: {0}".format(config_file))
+        tmp_file = "{0}.tmp.{1}".format(config_file, os.getpid())
+        with open(tmp_file, 'w') as stream:
+            for line in self.lines:
+                match = self.pattern_key.match(line)
+                if match is not None and match.group(1) in values:
+                    key = match.group(1)
+                    line = "{0}{1}{2} # edited\n".format(key, self.separator, values[key])
+                stream.write(line)
+        os.replace(tmp_file, config_file)
+        return None
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import array
+import bisect
+import collections
+import json
+import logging
+import os
+import sys
+
+# Custom
+from CallParsers import *
+
+
+class ConfidentRegions:
+    """
+    A class to store regions of a BED file as sorted, merged intervals on the concatenated genome
+    (see ReferenceIndex), so that membership is one binary search in two arrays.
+    """
+
+    def __init__(self, ref_index, bed_file):
+        """
+        Initialise a ConfidentRegions object.
+        :param ref_index: ReferenceIndex object of the reference genome.
+        :param bed_file: BED file of regions (0-based, half-open).
+        """
+        self.ref_index = ref_index
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.size = 0
+        self.load(bed_file)
+
+    def load(self, bed_file):
+        """
+        :param bed_file: BED file of regions.
+        :return: None
+        """
+        intervals = []
+        with CallParser.open_text(bed_file) as stream:
+            for line in stream:
+                if line.startswith(('#', 'track', 'browser')) or not line.strip():
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 3:
+                    raise ValueError("Invalid line in BED file {0}: {1}".format(bed_file, line.rstrip('\n')))
+                (contig, start, end) = self.ref_index.validate(fields[0], int(fields[1]), int(fields[2]))
+                offset = self.ref_index.starts[self.ref_index.contig_index(contig)]
+                intervals.append((offset + start, offset + end))
+        intervals.sort()
+        for (start, end) in intervals:
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+        self.size = sum([end - start for (start, end) in zip(self.starts, self.ends)])
+        logging.info("{0} confident regions ({1} bp) in {2}".format(len(self.starts), self.size, bed_file))
+        return None
+
+    def contains(self, variant):
+        """
+        :param variant: Variant tuple (see CallParsers).
+        :return: True if the position of the variant lies within a region.
+        """
+        position = self.ref_index.starts[variant.contig] + variant.pos - 1
+        index = bisect.bisect_right(self.starts, position) - 1
+        return index >= 0 and position < self.ends[index]
+
+
+class Evaluator:
+    """
+    A class to score the calls of configurations against a truth set: true positives (TP), false positives (FP),
+    false negatives (FN), precision, recall and F1, overall and by variant type and contig.
+    Calls and truth variants are compared by key (contig, position, alleles in their minimal representation);
+    only calls that passed the filters of the program are scored, within confident regions and contigs if given.
+    """
+
+    evaluation_filename = 'evaluation.json'
+
+    def __init__(self, ref_index, truth_vcf, bed_file=None, contigs=None):
+        """
+        Initialise an Evaluator object.
+        :param ref_index: ReferenceIndex object of the reference genome.
+        :param truth_vcf: VCF file of true variants (plain or gzip-compressed); filtered records are ignored.
+        :param bed_file: BED file of confident regions (optional).
+        :param contigs: List of contigs to score (default: all), e.g. those of a tier of the input files.
+        """
+        self.ref_index = ref_index
+        self.truth_vcf = truth_vcf
+        self.bed_file = bed_file
+        self.regions = None
+        if bed_file is not None:
+            self.regions = ConfidentRegions(ref_index, bed_file)
+        self.contigs = contigs
+        self.contig_indices = None
+        if contigs is not None:
+            self.contig_indices = set([ref_index.contig_index(contig) for contig in contigs])
+        self.truth = self.read_calls(CallParser(ref_index), [truth_vcf])
+        logging.info("{0} true variants in {1}".format(len(self.truth), truth_vcf))
+
+    def read_calls(self, call_parser, files):
+        """
+        :param call_parser: CallParser object.
+        :param files: Files of calls.
+        :return: Set of keys of the calls that passed filters, within confident regions and contigs.
+        """
+        keys = set()
+        for path in files:
+            for variant in call_parser.parse_file(path):
+                if not call_parser.passed(variant):
+                    continue
+                if self.contig_indices is not None and variant.contig not in self.contig_indices:
+                    continue
+                if self.regions is not None and not self.regions.contains(variant):
+                    continue
+                keys.add(variant[:4])
+        return keys
+
+    @staticmethod
+    def variant_type(key):
+        """
+        :param key: Key of a variant (contig, position, reference, alternate), alleles in minimal representation.
+        :return: 'SNV', 'insertion', 'deletion', 'MNV' or 'complex'.
+        """
+        (ref, alt) = key[2:]
+        if not ref:
+            return 'insertion'
+        if not alt:
+            return 'deletion'
+        if len(ref) == len(alt):
+            return 'SNV' if len(ref) == 1 else 'MNV'
+        return 'complex'
+
+    @staticmethod
+    def scores(tp, fp, fn):
+        """
+        :return: Dictionary of counts, precision, recall and F1 (None when undefined).
+        """
+        precision = tp / (tp + fp) if tp + fp else None
+        recall = tp / (tp + fn) if tp + fn else None
+        f1 = None
+        if precision is not None and recall is not None and precision + recall > 0:
+            f1 = 2 * precision * recall / (precision + recall)
+        return {'TP': tp, 'FP': fp, 'FN': fn, 'precision': precision, 'recall': recall, 'F1': f1}
+
+    def evaluate(self, program, config_dir):
+        """
+        :param program: Name of the program.
+        :param config_dir: Folder of the configuration.
+        :return: Dictionary of scores: overall, by variant type and by contig.
+        """
+        call_parser = CallParser.get(program, self.ref_index)
+        calls = self.read_calls(call_parser, call_parser.files(config_dir))
+        counts = collections.defaultdict(lambda: [0, 0, 0])  # TP, FP, FN by stratum
+        for key in calls:
+            column = 0 if key in self.truth else 1
+            for stratum in ('all', 'type:' + self.variant_type(key), 'contig:' + self.ref_index.names[key[0]]):
+                counts[stratum][column] += 1
+        for key in self.truth:
+            if key not in calls:
+                for stratum in ('all', 'type:' + self.variant_type(key), 'contig:' + self.ref_index.names[key[0]]):
+                    counts[stratum][2] += 1
+        overall = self.scores(*counts.pop('all', [0, 0, 0]))
+        evaluation = {
+            'truth': os.path.abspath(self.truth_vcf),
+            'regions': None if self.bed_file is None else os.path.abspath(self.bed_file),
+            'contigs': self.contigs,
+            'all': overall,
+            'type': {},
+            'contig': {}
+        }
+        for (stratum, (tp, fp, fn)) in sorted(counts.items()):
+            (kind, name) = stratum.split(':', 1)
+            evaluation[kind][name] = self.scores(tp, fp, fn)
+        return evaluation
+
+    def write(self, program, config_dir):
+        """
+        Evaluate a configuration, and write its scores in 'evaluation.json' in its folder.
+        :param program: Name of the program.
+        :param config_dir: Folder of the configuration.
+        :return: Dictionary of scores.
+        """
+        evaluation = self.evaluate(program, config_dir)
+        evaluation_file = os.path.join(config_dir, self.evaluation_filename)
+        tmp_file = "{0}.tmp.{1}".format(evaluation_file, os.getpid())
+        with open(tmp_file, 'w') as stream:
+            json.dump(evaluation, stream, indent=1, sort_keys=True)
+        os.replace(tmp_file, evaluation_file)
+        return evaluation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Score the calls of configurations against a truth set (evaluation.json in each folder).'
+    )
+    parser.add_argument(
+        'program', choices=sorted(parsers.keys()),
+        help='Program of the configurations.'
+    )
+    parser.add_argument(
+        'ref', metavar='ref.fa',
+        help='Reference genome (its Fasta index ref.fa.fai must exist).'
+    )
+    parser.add_argument(
+        'truth', metavar='truth.vcf',
+        help='VCF file of true somatic variants (plain or gzip-compressed).'
+    )
+    parser.add_argument(
+        'config_dirs', metavar='config_dir', nargs='+',
+        help='Folder of a configuration (e.g. out/MuTect2/config_1).'
+    )
+    parser.add_argument(
+        '-b', '--bed', metavar='regions.bed',
+        help='BED file of confident regions; calls and true variants outside are ignored.'
+    )
+    parser.add_argument(
+        '-c', '--contigs', metavar='chr21,chr22',
+        help='Comma-separated list of contigs (e.g. of an input tier); calls and true variants on others are ignored.'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        contigs = None if args.contigs is None else [contig for contig in args.contigs.split(',') if contig]
+        evaluator = Evaluator(ReferenceIndex.get("{0}.fai".format(args.ref)), args.truth, args.bed, contigs)
+        for config_dir in args.config_dirs:
+            scores = evaluator.write(args.program, config_dir)['all']
+            logging.info("{0}: TP={1} FP={2} FN={3} precision={4} recall={5} F1={6}".format(
+                config_dir, scores['TP'], scores['FP'], scores['FN'], scores['precision'], scores['recall'],
+                scores['F1']
+            ))
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
@@ -0,0 +1,217 @@
+import logging
+import os
+import re
+import subprocess
+import threading
+
+from Tracing import *
+
+
+class Executor:
+    """
+    Parent class to run benchmark scripts as jobs, possibly array jobs held until other jobs complete.
+    """
+
+    name = None # Name of the executor in the job manifest
+    manifest = None # Set by self.set_manifest()
+
+    def submit(self, script, job_name, stdout, stderr, resources=None, n_tasks=None, hold=None, max_running=None,
+               task_hold=None):
+        """
+        Submit a script as a job.
+        :param script: Script to run.
+        :param job_name: Name of the job.
+        :param stdout: File to store the standard output of the job.
+        :param stderr: File to store the standard error of the job.
+        :param resources: Resources object of the job (or of each task of an array job); None for a light job.
+        :param n_tasks: If not None, submit an array job of this many tasks ($SGE_TASK_ID from 1 to n_tasks).
+        :param hold: List of job identifiers that must complete before the job starts.
+        :param max_running: Maximal count of tasks of an array job that run concurrently (default: no limit).
+        :param task_hold: List of identifiers of array jobs of n_tasks tasks: task i of the job starts when task i of
+        each of them has completed.
+        :return: Job identifier.
+        """
+        raise NotImplementedError("submit() must be implemented by {0}".format(type(self).__name__))
+
+    def wait(self):
+        """
+        Wait for submitted jobs, if the executor runs them itself.
+        :return: None
+        """
+        return None
+
+    def set_manifest(self, manifest):
+        """
+        Record submitted jobs in a manifest, to monitor them (see JobMonitor).
+        :param manifest: JobManifest object.
+        :return: None
+        """
+        self.manifest = manifest
+        return None
+
+    def record(self, job_id, job_name, script, n_tasks=None, hold=None):
+        """
+        Record a submitted job in the manifest, if any.
+        :return: None
+        """
+        if self.manifest is not None:
+            self.manifest.add(job_id, self.name, job_name, script, n_tasks, hold)
+        return None
+
+
+class SGEExecutor(Executor):
+    """
+    Submit jobs to a Sun Grid Engine (SGE) cluster with qsub.
+    """
+
+    name = 'sge'
+    pattern_job_id = re.compile(r'.* (\d+)[ .].*')
+
+    def __init__(self, queue='short.qc'):
+        """
+        Initialise a SGEExecutor object.
+        :param queue: Queue to submit jobs to, unless their resources specify another one.
+        """
+        self.queue = queue
+
+    def submit(self, script, job_name, stdout, stderr, resources=None, n_tasks=None, hold=None, max_running=None,
+               task_hold=None):
+        """
+        Submit a script with qsub (see Executor.submit()).
+        :return: Job identifier parsed from the output of qsub.
+        """
+        qsub_cmd_args = ['qsub']
+        if n_tasks is not None:
+            qsub_cmd_args.extend(['-t', "1-{0}".format(n_tasks)])
+            if max_running is not None:
+                qsub_cmd_args.extend(['-tc', str(max_running)])
+        if hold:
+            qsub_cmd_args.extend(['-hold_jid', ','.join(hold)])
+        if task_hold:
+            qsub_cmd_args.extend(['-hold_jid_ad', ','.join(task_hold)])
+        qsub_cmd_args.extend(['-o', stdout, '-e', stderr])
+        queue = self.queue
+        if resources is not None:
+            qsub_cmd_args.extend(resources.qsub_args())
+            if resources.queue is not None:
+                queue = resources.queue
+        qsub_cmd_args.extend(['-N', job_name, '-q', queue, script])
+        logging.info("Submit command: {0}".format(' '.join(qsub_cmd_args)))
+        with tracer.span('qsub', 'submit', job_name=job_name, n_tasks=n_tasks, hold=hold) as span:
+            qsub_stdout, err = subprocess.Popen(qsub_cmd_args, stdout=subprocess.PIPE).communicate()
+            logging.info(qsub_stdout.decode("utf-8").strip())
+            job_id = self.pattern_job_id.match(qsub_stdout.decode("utf-8")).group(1)
+            span.set('job_id', job_id)
+        logging.info("{0} JOB_ID: {1}".format(job_name, job_id))
+        self.record(job_id, job_name, script, n_tasks, (hold or []) + (task_hold or []))
+        return job_id
+
+
+class LocalExecutor(Executor):
+    """
+    Run jobs on the local machine, in a pool of processes limited by the count of cores reserved by running jobs.
+    Jobs run when wait() is called. As with SGE, a job held on other jobs starts when they complete,
+    whether they succeed or fail; tasks of array jobs run independently of each other, or when the task of the same
+    index of the array jobs they are held on task by task completes.
+    """
+
+    name = 'local'
+
+    def __init__(self, max_cores=None):
+        """
+        Initialise a LocalExecutor object.
+        :param max_cores: Count of cores available to jobs (default: all cores of the machine).
+        """
+        self.max_cores = max_cores if max_cores is not None else os.cpu_count()
+        self.jobs = []
+        self.workdir = os.getcwd()
+        self.lock = threading.Lock() # Jobs may be submitted concurrently (see StageGraph)
+
+    def submit(self, script, job_name, stdout, stderr, resources=None, n_tasks=None, hold=None, max_running=None,
+               task_hold=None):
+        """
+        Queue a script until wait() is called (see Executor.submit()).
+        :return: Job identifier (rank of submission).
+        """
+        n_cores = 1 if resources is None else resources.n_cores()
+        if n_cores > self.max_cores:
+            logging.warning("{0} requests {1} cores; limited to {2}".format(job_name, n_cores, self.max_cores))
+            n_cores = self.max_cores
+        with self.lock:
+            job_id = str(len(self.jobs) + 1)
+            self.jobs.append({
+                'id': job_id, 'name': job_name, 'script': script, 'stdout': stdout, 'stderr': stderr,
+                'n_cores': n_cores, 'tasks': [None] if n_tasks is None else list(range(1, n_tasks + 1)),
+                'hold': list(hold) if hold else [], 'task_hold': list(task_hold) if task_hold else [],
+                'max_running': max_running, 'running': 0, 'exit_status': {}
+            })
+        logging.info("Queue local job {0} ({1}): {2}".format(job_id, job_name, script))
+        self.record(job_id, job_name, script, n_tasks, (hold or []) + (task_hold or []))
+        return job_id
+
+    def is_completed(self, job_id):
+        """
+        :param job_id: Job identifier.
+        :return: True if all tasks of the job have completed.
+        """
+        job = self.jobs[int(job_id) - 1]
+        return len(job['exit_status']) == len(job['tasks'])
+
+    def start(self, job, task):
+        """
+        Start one task of a job, with the environment variables that SGE would set.
+        :param job: Job record.
+        :param task: Array task index (None for a job that is not an array job).
+        :return: Popen object of the process.
+        """
+        env = dict(os.environ)
+        env.update({
+            'JOB_ID': job['id'], 'JOB_NAME': job['name'], 'NSLOTS': str(job['n_cores']), 'SGE_O_WORKDIR': self.workdir
+        })
+        env['SGE_TASK_ID'] = 'undefined' if task is None else str(task)
+        logging.info("Run local job {0} ({1}) task {2}".format(job['id'], job['name'], task))
+        with open(job['stdout'], 'a') as stdout, open(job['stderr'], 'a') as stderr:
+            return subprocess.Popen(
+                ['/bin/bash', job['script']], stdout=stdout, stderr=stderr, env=env, cwd=self.workdir
+            )
+
+    def wait(self):
+        """
+        Run all submitted jobs, starting each task as soon as the jobs it is held on have completed
+        and enough cores are free.
+        :return: None
+        """
+        pending = [(job, task) for job in self.jobs for task in job['tasks']]
+        running = {}
+        free_cores = self.max_cores
+        while pending or running:
+            for (job, task) in list(pending):
+                if job['n_cores'] > free_cores:
+                    continue
+                if job['max_running'] is not None and job['running'] >= job['max_running']:
+                    continue
+                if not all([self.is_completed(held) for held in job['hold']]):
+                    continue
+                if not all([task in self.jobs[int(held) - 1]['exit_status'] for held in job['task_hold']]):
+                    continue
+                pending.remove((job, task))
+                proc = self.start(job, task)
+                running[proc.pid] = (proc, job, task)
+                free_cores -= job['n_cores']
+                job['running'] += 1
+            if not running:
+                raise ValueError("Local jobs are held on jobs that were never submitted.")
+            (pid, status) = os.wait()
+            if pid not in running:
+                continue
+            (proc, job, task) = running.pop(pid)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            job['exit_status'][task] = proc.returncode
+            free_cores += job['n_cores']
+            job['running'] -= 1
+            if proc.returncode != 0:
+                logging.warning("Local job {0} ({1}) task {2} failed with exit status {3}".format(
+                    job['id'], job['name'], task, proc.returncode
+                ))
+        logging.info("{0} local jobs completed.".format(len(self.jobs)))
+        return None
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import collections
+import glob
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+
+class FilterCounter:
+    """
+    A class to count the values of the FILTER field of VCF files, in a single streaming pass.
+    Variants may have several values in the FILTER field (separated by ';'): all values are counted.
+    """
+
+    buffer_size = 1 << 22  # Bytes read at once
+    min_range_size = 1 << 26  # Plain VCF files smaller than this are never split across processes
+
+    def __init__(self, vcf_files, n_procs=1):
+        """
+        Initialise a FilterCounter object.
+        :param vcf_files: VCF files (plain, or compressed with gzip/bgzip if the name ends with '.gz').
+        :param n_procs: Count of processes; large plain VCF files are split into byte ranges across processes.
+        """
+        self.vcf_files = vcf_files
+        self.n_procs = max(1, n_procs)
+        self.variants = 0
+        self.filters = collections.Counter()
+
+    @classmethod
+    def count_lines(cls, lines, filters):
+        """
+        Count the FILTER values of VCF lines, skipping header lines.
+        :param lines: Iterable of VCF lines (bytes).
+        :param filters: Counter of FILTER values (bytes), updated.
+        :return: Count of variants.
+        """
+        variants = 0
+        for line in lines:
+            if line.startswith(b'#'):
+                continue
+            fields = line.split(b'\t', 7)
+            if len(fields) < 7:
+                continue
+            variants += 1
+            filters.update(fields[6].rstrip(b'\r\n').split(b';'))
+        return variants
+
+    @classmethod
+    def count_file(cls, vcf_file):
+        """
+        :param vcf_file: VCF file (plain or gzip-compressed).
+        :return: Tuple of the count of variants and a Counter of FILTER values (bytes).
+        """
+        filters = collections.Counter()
+        if vcf_file.endswith('.gz'):
+            stream = gzip.open(vcf_file, 'rb')
+        else:
+            stream = open(vcf_file, 'rb', buffering=cls.buffer_size)
+        with stream:
+            variants = cls.count_lines(stream, filters)
+        return variants, filters
+
+    @classmethod
+    def count_range(cls, task):
+        """
+        Count the FILTER values of the lines of a plain VCF file that start within a byte range.
+        :param task: Tuple (VCF file, start offset, end offset).
+        :return: Tuple of the count of variants and a Counter of FILTER values (bytes).
+        """
+        (vcf_file, start, end) = task
+        filters = collections.Counter()
+        with open(vcf_file, 'rb', buffering=cls.buffer_size) as stream:
+            if start > 0:
+                # The line that overlaps the start of the range belongs to the previous range
+                stream.seek(start - 1)
+                stream.readline()
+            variants = cls.count_lines(cls.lines_until(stream, end), filters)
+        return variants, filters
+
+    @staticmethod
+    def lines_until(stream, end):
+        """
+        :param stream: Binary stream.
+        :param end: Offset; lines that start at or after it are not read.
+        :return: Generator of lines.
+        """
+        position = stream.tell()
+        while position < end:
+            line = stream.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+    def tasks(self):
+        """
+        Split the work into tasks: compressed and small files are read whole, large plain files are split.
+        :return: List of (VCF file, start offset, end offset) tuples; offsets are None for whole files.
+        """
+        tasks = []
+        for vcf_file in self.vcf_files:
+            size = os.path.getsize(vcf_file)
+            if self.n_procs == 1 or vcf_file.endswith('.gz') or size < self.min_range_size:
+                tasks.append((vcf_file, None, None))
+                continue
+            range_size = size // self.n_procs + 1
+            for start in range(0, size, range_size):
+                tasks.append((vcf_file, start, min(size, start + range_size)))
+        return tasks
+
+    @classmethod
+    def run_task(cls, task):
+        """
+        :param task: Tuple (VCF file, start offset, end offset); offsets are None for whole files.
+        :return: Tuple of the count of variants and a Counter of FILTER values (bytes).
+        """
+        if task[1] is None:
+            return cls.count_file(task[0])
+        return cls.count_range(task)
+
+    def count(self):
+        """
+        Count FILTER values in all VCF files.
+        :return: None
+        """
+        tasks = self.tasks()
+        logging.info("Count FILTER values in {0} files ({1} tasks)".format(len(self.vcf_files), len(tasks)))
+        if self.n_procs > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(self.n_procs, len(tasks))) as pool:
+                results = pool.map(self.run_task, tasks)
+        else:
+            results = [self.run_task(task) for task in tasks]
+        for (variants, filters) in results:
+            self.variants += variants
+            self.filters.update(filters)
+        return None
+
+    def write(self, out):
+        """
+        Write 'filters.txt' (count and value of each FILTER value, as 'uniq -c' would) and 'filters.json'.
+        Both files are written atomically: replacing them updates the time of the folder (see ResultsStore).
+        :param out: Output folder.
+        :return: None
+        """
+        filters = {value.decode('utf-8'): count for (value, count) in self.filters.items()}
+        txt_file = os.path.join(out, 'filters.txt')
+        tmp_file = "{0}.tmp.{1}".format(txt_file, os.getpid())
+        with open(tmp_file, 'w') as stream:
+            for value in sorted(filters.keys()):
+                stream.write("{0:7d} {1}\n".format(filters[value], value))
+        os.replace(tmp_file, txt_file)
+        json_file = os.path.join(out, 'filters.json')
+        tmp_file = "{0}.tmp.{1}".format(json_file, os.getpid())
+        with open(tmp_file, 'w') as stream:
+            json.dump({
+                'files': self.vcf_files,
+                'variants': self.variants,
+                'filters': filters
+            }, stream, indent=1, sort_keys=True)
+        os.replace(tmp_file, json_file)
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Count the values of the FILTER field of VCF files (plain or gzip-compressed).'
+    )
+    parser.add_argument(
+        'out', metavar='output_folder',
+        help='Folder to write filters.txt and filters.json.'
+    )
+    parser.add_argument(
+        'inputs', metavar='input.vcf', nargs='+',
+        help='VCF files (or glob patterns, with --glob).'
+    )
+    parser.add_argument(
+        '-g', '--glob', action='store_true',
+        help='Inputs are glob patterns (e.g. "results/*/*.vcf"); patterns that match no file are ignored.'
+    )
+    parser.add_argument(
+        '-p', '--processes', metavar='N', type=int, default=1,
+        help='Count of processes; large plain VCF files are split into byte ranges across processes (default: 1).'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG)
+    inputs = args.inputs
+    if args.glob:
+        inputs = sorted(set([vcf_file for pattern in args.inputs for vcf_file in glob.glob(pattern)]))
+    try:
+        counter = FilterCounter(inputs, args.processes)
+        counter.count()
+        counter.write(args.out)
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
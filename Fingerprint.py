@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+
+class Fingerprint:
+    """
+    A class to identify configurations by content: the same program, parameters, tools and input files
+    give the same fingerprint, so that completed results can be found again and shared.
+    """
+
+    head_size = 1 << 16  # Bytes hashed at the start of each file (e.g. the header of a BAM file)
+
+    @classmethod
+    def file_identity(cls, path):
+        """
+        Describe a file cheaply: absolute path, size, modification time and hash of its first bytes.
+        Files that do not exist are described by their absolute path only.
+        :param path: Path to the file.
+        :return: Dictionary that describes the file.
+        """
+        identity = {'path': os.path.abspath(path)}
+        try:
+            stat = os.stat(path)
+            with open(path, 'rb') as stream:
+                head = stream.read(cls.head_size)
+        except OSError:
+            return identity
+        identity.update({
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'head_sha1': hashlib.sha1(head).hexdigest()
+        })
+        return identity
+
+    @staticmethod
+    def compute(program, params, tools, inputs, resources=None):
+        """
+        Compute the fingerprint of a configuration.
+        :param program: Name of the program.
+        :param params: Dictionary of parameter flags and values (or None for toggle flags).
+        :param tools: List of identities of the executable and template files of the program.
+        :param inputs: Dictionary of identities of input files (e.g. reference, normal, tumour).
+        :param resources: Resources object of the configuration, if its commands depend on it (threads, JVM heap);
+        only cores and memory are identified, as the queue and walltime do not change the outputs.
+        :return: Hexadecimal fingerprint.
+        """
+        identity = {
+            'program': program,
+            'params': sorted([[k, v] for (k, v) in params.items()], key=lambda kv: kv[0]),
+            'tools': tools,
+            'inputs': inputs
+        }
+        if resources is not None:
+            identity['resources'] = {'cores': resources.n_cores(), 'memory': resources.memory}
+        canonical = json.dumps(identity, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
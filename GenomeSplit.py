@@ -0,0 +1,120 @@
+import logging
+import math
+import os
+
+from ReferenceIndex import *
+
+
+class GenomeSplit:
+    """
+    A class to split a reference genome into chunks of intervals of balanced total size.
+    Large contigs are cut across chunks; consecutive small contigs are packed into shared chunks.
+    """
+
+    def __init__(self, ref_fai, chunk_size=None, n_chunks=None):
+        """
+        Initialise a GenomeSplit object.
+        If neither chunk_size nor n_chunks is given, each contig of the .fai index makes one chunk.
+        :param ref_fai: Fasta index (.fai) file of the reference genome.
+        :param chunk_size: Target total size of intervals in each chunk (bp).
+        :param n_chunks: Target count of chunks (ignored if chunk_size is given).
+        """
+        self.ref_fai = ref_fai
+        self.index = ReferenceIndex.get(ref_fai)
+        self.contigs = list(self.index.contigs())
+        self.genome_size = self.index.genome_size
+        if chunk_size is not None:
+            n_chunks = int(math.ceil(self.genome_size / chunk_size))
+        if n_chunks is None:
+            self.chunks = [[interval] for interval in self.index.intervals()]
+        else:
+            self.chunks = self.balance(n_chunks)
+        logging.info("Genome split: {0} intervals in {1} chunks (largest chunk: {2} bp)".format(
+            len(self.intervals()), len(self.chunks), max([self.chunk_size(chunk) for chunk in self.chunks])
+        ))
+
+    @staticmethod
+    def chunk_size(chunk):
+        """
+        :param chunk: List of (contig, start, end) intervals.
+        :return: Total size of the intervals (bp).
+        """
+        return sum([end - start for (_, start, end) in chunk])
+
+    def balance(self, n_chunks):
+        """
+        Split the genome into at most a given count of chunks of equal total size.
+        Chunks are contiguous runs of intervals in genome order: contigs are cut at chunk boundaries,
+        except small contigs (less than a tenth of a chunk), which are kept whole in the chunk where they start.
+        :param n_chunks: Target count of chunks.
+        :return: List of chunks, each a list of (contig, start, end) intervals (0-based, half-open).
+        """
+        target = int(math.ceil(self.genome_size / max(1, n_chunks)))
+        min_cut = target // 10
+        chunks = []
+        current = []
+        current_size = 0
+        for (contig, length) in self.contigs:
+            start = 0
+            while start < length:
+                end = length
+                if length >= min_cut:
+                    end = min(length, start + target - current_size)
+                current.append((contig, start, end))
+                current_size += end - start
+                start = end
+                if current_size >= target:
+                    chunks.append(current)
+                    current = []
+                    current_size = 0
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def intervals(self):
+        """
+        :return: List of all intervals, in chunk order.
+        """
+        return [interval for chunk in self.chunks for interval in chunk]
+
+    @staticmethod
+    def region_file(folder, task):
+        """
+        :param folder: Folder of region lists.
+        :param task: Array task index (may refer to a shell variable, e.g. ${SGE_TASK_ID}).
+        :return: Path to the region list of the array task.
+        """
+        return os.path.join(folder, "task_{0}.intervals".format(task))
+
+    def write_region_lists(self, folder):
+        """
+        Write the regions of each chunk in a list file ('contig:start-end', 1-based, inclusive), one file per task.
+        This format is understood by GATK (-L) and samtools (region arguments).
+        :param folder: Folder of region lists (created if needed).
+        :return: None
+        """
+        logging.info("Make region lists: {0}".format(folder))
+        os.makedirs(folder, exist_ok=True)
+        for (chunk_index, chunk) in enumerate(self.chunks):
+            with open(self.region_file(folder, chunk_index + 1), 'w') as stream:
+                for (contig, start, end) in chunk:
+                    stream.write("{0}:{1}-{2}\n".format(contig, start + 1, end))
+        return None
+
+    def write_split_list(self, split_file, task_file):
+        """
+        Write a CaVEMan split list (one interval per line) and the list of split indices processed by each task.
+        :param split_file: Output split list file ('contig<TAB>start<TAB>end').
+        :param task_file: Output task file; line N lists the (1-based) split indices processed by array task N.
+        :return: None
+        """
+        split_index = 0
+        with open(split_file, 'w') as split_stream, open(task_file, 'w') as task_stream:
+            for chunk in self.chunks:
+                task_indices = []
+                for (contig, start, end) in chunk:
+                    split_index += 1
+                    split_stream.write("{0}\t{1}\t{2}\n".format(contig, start, end))
+                    task_indices.append(str(split_index))
+                task_stream.write("{0}\n".format(' '.join(task_indices)))
+        return None
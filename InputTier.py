@@ -0,0 +1,155 @@
+from SingleConfiguration import *
+from Fingerprint import *
+from ReferenceIndex import *
+
+
+class InputTier(SharedStage):
+    """
+    A reduced pair of input files, to benchmark configurations quickly before running them on the whole genome:
+    the reads of some contigs (e.g. 'chr22'), or a random fraction of the reads (e.g. '0.05').
+    The tier is created once by a shared stage, cached by fingerprint like a configuration, and indexed;
+    the scripts of all programs read it instead of the input files. A tier of contigs comes with a reduced
+    Fasta index, so that genome splits (CaVEMan split list, scatter mode) only cover its contigs.
+    """
+
+    tier_dirname = 'tier'
+    normal_basename = 'normal.bam'
+    tumour_basename = 'tumour.bam'
+    seed = 1 # Seed of 'samtools view -s': the same reads are kept in both files, and at each run
+
+    def __init__(self, spec):
+        """
+        Initialise an InputTier object.
+        :param spec: Comma-separated list of contigs (e.g. 'chr21,chr22'),
+        or fraction of reads to keep (e.g. '0.05').
+        """
+        (self.contigs, self.fraction) = self.parse(spec)
+        if self.fraction is None:
+            params = {'contigs': ','.join(self.contigs)}
+        else:
+            params = {'fraction': self.fraction, 'seed': self.seed}
+        super().__init__(self.tier_dirname, params)
+        self.spec = spec
+        self.resources = Resources.default(self.tier_dirname)
+        self.folder = None # Set by self.make_tier_dir()
+        self.ref = None # Set by self.make_tier_dir()
+
+    @staticmethod
+    def parse(spec):
+        """
+        Parse a tier specification: a number with a decimal point is a fraction of reads, anything else
+        a list of contigs (contig names may be numbers, e.g. '22').
+        :param spec: Tier specification (e.g. 'chr22', '21,22', '0.05').
+        :return: Tuple of the list of contigs and the fraction of reads (one of them is None).
+        """
+        fraction = None
+        if '.' in spec:
+            try:
+                fraction = float(spec)
+            except ValueError:
+                fraction = None
+        if fraction is not None:
+            if not 0 < fraction < 1:
+                raise ValueError("Invalid tier fraction (expected between 0 and 1): {0}".format(spec))
+            return None, fraction
+        contigs = [contig for contig in spec.split(',') if contig]
+        if not contigs:
+            raise ValueError("Invalid tier (expected contigs or a fraction of reads): {0}".format(spec))
+        if len(set(contigs)) != len(contigs):
+            raise ValueError("Duplicate contigs in tier: {0}".format(spec))
+        return contigs, None
+
+    def make_tier_dir(self, out, cache_dir, ref, inputs):
+        """
+        Create the folder of the tier, as a link to the cache folder of its fingerprint, and the reduced Fasta index
+        of a tier of contigs. The tier is identified by its specification, samtools and the input files.
+        :param out: Root folder to store outputs of the benchmark.
+        :param cache_dir: Folder of cached configuration outputs, by fingerprint.
+        :param ref: Reference genome Fasta file.
+        :param inputs: Dictionary of identities of input files (see Fingerprint.file_identity()).
+        :return: None
+        """
+        reference = ReferenceIndex.get("{0}.fai".format(ref))
+        if self.contigs is not None:
+            for contig in self.contigs:
+                reference.contig_index(contig)
+        fingerprint = Fingerprint.compute(
+            'tier', self.params, [Fingerprint.file_identity(samtools_exe)], inputs
+        )
+        self.make_dir_structure(out, cache_dir, fingerprint)
+        self.folder = os.path.join(out, self.out)
+        self.ref = ref
+        if self.contigs is not None and self.status == 'pending':
+            self.write_fai("{0}.fai".format(ref))
+        logging.info("Input tier {0}: {1} ({2})".format(self.spec, self.folder, self.status))
+        return None
+
+    def write_fai(self, ref_fai):
+        """
+        Write the lines of the contigs of the tier from the Fasta index of the reference genome, in its order,
+        next to a link to the reference genome (CaVEMan finds the Fasta file from the path of its index).
+        :param ref_fai: Fasta index (.fai) file of the reference genome.
+        :return: None
+        """
+        contigs = set(self.contigs)
+        tier_fai = self.fai_file()
+        logging.info("Create reduced Fasta index file: {0}".format(tier_fai))
+        with open(ref_fai) as stream, open(tier_fai, 'w') as tier_stream:
+            for fai_entry in stream:
+                if fai_entry.split('\t', 1)[0] in contigs:
+                    tier_stream.write(fai_entry)
+        os.symlink(os.path.abspath(self.ref), tier_fai[:-len('.fai')])
+        return None
+
+    def fai_file(self):
+        """
+        :return: Fasta index (.fai) file of the contigs of the tier, or None for a tier of reads of the whole genome.
+        """
+        if self.contigs is None:
+            return None
+        return os.path.join(self.folder, "{0}.fai".format(os.path.basename(self.ref)))
+
+    def bam_files(self):
+        """
+        :return: Tuple of the input files of the tier (normal, tumour).
+        """
+        return os.path.join(self.folder, self.normal_basename), os.path.join(self.folder, self.tumour_basename)
+
+    def write_tier_script(self, file1, file2):
+        """
+        Write a script to extract the reads of the tier from each input file, and index the output files.
+        Outputs are written to temporary files, so that an interrupted job never leaves a truncated file.
+        :param file1: Input file for reference group (e.g. normal).
+        :param file2: Input file for target group (e.g. tumour).
+        :return: None
+        """
+        script_file = os.path.join(self.folder, self.script_filename)
+        logging.info("Create script file: {0}".format(script_file))
+        with ScriptWriter(script_file) as stream:
+            for (input_file, tier_file) in zip((file1, file2), self.bam_files()):
+                label = "tier.{0}".format(os.path.basename(tier_file))
+                if self.fraction is None:
+                    # Region queries require the index of the input file
+                    cmd = "{0} view -b {1} {2}".format(samtools_exe, input_file, ' '.join(self.contigs))
+                else:
+                    # The integer part of the argument of '-s' is the seed, the fractional part the fraction
+                    cmd = "{0} view -b -s {1}{2} {3}".format(
+                        samtools_exe, self.seed, "{0:.10f}".format(self.fraction).rstrip('0')[1:], input_file
+                    )
+                cmd = "{0} > {1}.tmp".format(cmd, tier_file)
+                stream.write(self.instrument_command(cmd, label, self.folder) + "\n")
+                stream.write("mv {0}.tmp {0}\n".format(tier_file))
+                stream.write("{0} index {1}\n".format(samtools_exe, tier_file))
+            stream.write(self.completion_command(self.folder))
+        return None
+
+    def add_tier_stage(self, graph):
+        """
+        :param graph: StageGraph object.
+        :return: Stage object, which the first jobs of all programs depend on.
+        """
+        script = os.path.join(self.folder, self.script_filename)
+        return graph.add(
+            script, script, self.tier_dirname, os.path.join(self.folder, self.job_stdout),
+            os.path.join(self.folder, self.job_stderr), self.resources
+        )
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import fcntl
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+class CommandMetrics:
+    """
+    A class to run one command of a benchmark script and record its resource usage.
+    """
+
+    def __init__(self, cmd, label, sampler=None):
+        """
+        Initialise a CommandMetrics object.
+        :param cmd: Shell command to run (interpreted by bash).
+        :param label: Label of the command in the metrics file (e.g. 'MuTect2', 'mstep.1').
+        :param sampler: Optional ResourceSampler to record a time series while the command runs.
+        """
+        self.cmd = cmd
+        self.label = label
+        self.sampler = sampler
+        self.record = None
+
+    def run(self):
+        """
+        Run the command and collect wall time, CPU times and I/O of the whole process tree, and the largest peak RSS
+        of any single process of the tree (ru_maxrss; the combined RSS of the tree is sampled, see ResourceSampler).
+        Resource usage of the command and of all its (reaped) descendants is obtained from wait4().
+        I/O counters of reaped descendants are accumulated by the kernel into /proc/self/io of this process.
+        :return: Exit status of the command.
+        """
+        io_before = self.read_proc_io()
+        start_time = time.time()
+        proc = subprocess.Popen(['/bin/bash', '-c', self.cmd])
+        if self.sampler is not None:
+            self.sampler.start(proc.pid)
+        (_, status, usage) = os.wait4(proc.pid, 0)
+        end_time = time.time()
+        if self.sampler is not None:
+            self.sampler.stop()
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        io_after = self.read_proc_io()
+        if io_before is None or io_after is None:
+            # Fall back on block counts (units of 512 bytes) if /proc is not available
+            io = {
+                'read_bytes': usage.ru_inblock * 512, 'write_bytes': usage.ru_oublock * 512,
+                'rchar': None, 'wchar': None
+            }
+        else:
+            io = {key: io_after[key] - io_before[key] for key in io_after.keys()}
+        self.record = {
+            'command': self.cmd,
+            'host': socket.gethostname(),
+            'start': start_time,
+            'wall_time_s': end_time - start_time,
+            'user_time_s': usage.ru_utime,
+            'sys_time_s': usage.ru_stime,
+            'max_rss_kb': usage.ru_maxrss,
+            'read_bytes': io['read_bytes'],
+            'write_bytes': io['write_bytes'],
+            'rchar': io['rchar'],
+            'wchar': io['wchar'],
+            'exit_status': proc.returncode
+        }
+        return proc.returncode
+
+    @staticmethod
+    def read_proc_io(pid='self'):
+        """
+        Read the I/O counters of a process.
+        :param pid: Process identifier (default: this process).
+        :return: Dictionary of counters (bytes), or None if unavailable.
+        """
+        counters = {}
+        try:
+            with open(os.path.join('/proc', str(pid), 'io')) as stream:
+                for line in stream:
+                    (key, value) = line.split(':')
+                    counters[key] = int(value)
+        except (OSError, ValueError):
+            return None
+        return {key: counters.get(key, 0) for key in ('rchar', 'wchar', 'read_bytes', 'write_bytes')}
+
+    def write(self, metrics_file):
+        """
+        Add the record of the command to a metrics file.
+        Commands of a configuration may run concurrently (e.g. array tasks), hence the file is updated under a lock.
+        :param metrics_file: JSON file of metrics for the configuration.
+        :return: None
+        """
+        with open("{0}.lock".format(metrics_file), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            metrics = {'commands': {}}
+            if os.path.exists(metrics_file):
+                with open(metrics_file) as stream:
+                    metrics = json.load(stream)
+            metrics['commands'][self.label] = self.record
+            tmp_file = "{0}.tmp.{1}".format(metrics_file, os.getpid())
+            with open(tmp_file, 'w') as stream:
+                json.dump(metrics, stream, indent=1, sort_keys=True)
+            os.replace(tmp_file, metrics_file)
+        return None
+
+
+class ResourceSampler:
+    """
+    A class to sample the resource usage of a process tree from /proc at regular intervals, in a background thread.
+    The sampling interval doubles whenever the CPU time of the sampler exceeds its overhead budget.
+    """
+
+    columns = ('time_s', 'cpu_percent', 'rss_kb', 'read_bytes', 'write_bytes', 'threads')
+
+    def __init__(self, interval, budget=0.01):
+        """
+        Initialise a ResourceSampler object.
+        :param interval: Initial sampling interval (seconds).
+        :param budget: Maximal fraction of one core that the sampler may use.
+        """
+        self.interval = interval
+        self.budget = budget
+        self.data = {column: [] for column in self.columns}
+        self.root_pid = None
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+        # Last counters seen for each process of the tree, so that totals stay cumulative after processes exit
+        self.cpu_ticks = {}
+        self.io_bytes = {}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self, pid):
+        """
+        Start sampling the process tree rooted at a given process.
+        :param pid: Process identifier of the root of the tree.
+        :return: None
+        """
+        self.root_pid = pid
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return None
+
+    def stop(self):
+        """
+        Stop sampling and wait for the background thread.
+        :return: None
+        """
+        self.stopped.set()
+        self.thread.join()
+        return None
+
+    def run(self):
+        """
+        Sampling loop of the background thread.
+        :return: None
+        """
+        start_time = time.monotonic()
+        previous_time = start_time
+        previous_ticks = 0
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            (threads, rss_pages) = self.sample()
+            total_ticks = sum(self.cpu_ticks.values())
+            self.data['time_s'].append(round(now - start_time, 3))
+            self.data['cpu_percent'].append(
+                round(100.0 * (total_ticks - previous_ticks) / self.clock_ticks / (now - previous_time), 1)
+            )
+            self.data['rss_kb'].append(rss_pages * self.page_kb)
+            self.data['read_bytes'].append(sum([io[0] for io in self.io_bytes.values()]))
+            self.data['write_bytes'].append(sum([io[1] for io in self.io_bytes.values()]))
+            self.data['threads'].append(threads)
+            (previous_time, previous_ticks) = (now, total_ticks)
+            if time.thread_time() > self.budget * (now - start_time):
+                self.interval *= 2
+        return None
+
+    def sample(self):
+        """
+        Update the counters of all processes in the tree.
+        :return: Tuple of the count of threads and of resident pages in the tree.
+        """
+        children = {}
+        stats = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join('/proc', entry, 'stat')) as stream:
+                    stat = stream.read()
+            except OSError:
+                continue
+            # The command name (field 2) may contain spaces; fields after it are space-separated
+            fields = stat[stat.rfind(')') + 2:].split()
+            pid = int(entry)
+            stats[pid] = fields
+            children.setdefault(int(fields[1]), []).append(pid)
+        tree = [self.root_pid]
+        threads = 0
+        rss_pages = 0
+        while tree:
+            pid = tree.pop()
+            tree.extend(children.get(pid, []))
+            if pid not in stats:
+                continue
+            fields = stats[pid]
+            # Fields 14-15 (utime, stime), 20 (num_threads) and 24 (rss) of /proc/[pid]/stat
+            self.cpu_ticks[pid] = int(fields[11]) + int(fields[12])
+            threads += int(fields[17])
+            rss_pages += int(fields[21])
+            io = CommandMetrics.read_proc_io(pid)
+            if io is not None:
+                self.io_bytes[pid] = (io['read_bytes'], io['write_bytes'])
+        return threads, rss_pages
+
+    def write(self, samples_file):
+        """
+        Write the time series in a columnar JSON file.
+        :param samples_file: Output file.
+        :return: None
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(samples_file)), exist_ok=True)
+        with open(samples_file, 'w') as stream:
+            json.dump({'final_interval_s': self.interval, 'columns': self.data}, stream, separators=(',', ':'))
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run a command and record its resource usage in a JSON metrics file.'
+    )
+    parser.add_argument(
+        'metrics', metavar='metrics.json', type=str,
+        help='JSON file of metrics for the configuration (created if needed, updated otherwise).'
+    )
+    parser.add_argument(
+        'label', metavar='label', type=str,
+        help='Label of the command in the metrics file.'
+    )
+    parser.add_argument(
+        'cmd', metavar='command', type=str,
+        help='Shell command to run (interpreted by bash).'
+    )
+    parser.add_argument(
+        '-s', '--samples', metavar='samples.json', type=str,
+        help='Sample resource usage of the command while it runs, and write the time series in this file.'
+    )
+    parser.add_argument(
+        '-i', '--sample-interval', metavar='SECONDS', type=float, default=10,
+        help='Initial interval between samples (default: 10).'
+    )
+    parser.add_argument(
+        '-b', '--sample-budget', metavar='FRACTION', type=float, default=0.01,
+        help='Maximal fraction of one core used by the sampler; the interval doubles when exceeded (default: 0.01).'
+    )
+    args = parser.parse_args()
+    sampler = None
+    if args.samples is not None:
+        sampler = ResourceSampler(args.sample_interval, args.sample_budget)
+    command = CommandMetrics(args.cmd, args.label, sampler)
+    exit_status = command.run()
+    try:
+        if sampler is not None:
+            sampler.write(args.samples)
+        command.write(args.metrics)
+    except OSError as err:
+        # Never fail a benchmark job because its metrics could not be saved
+        logging.warning("Could not write metrics file {0}: {1}".format(args.metrics, err))
+    # Follow the shell convention for commands terminated by a signal
+    sys.exit(exit_status if exit_status >= 0 else 128 - exit_status)
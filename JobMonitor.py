@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import asyncio
+import collections
+import getpass
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+class JobManifest:
+    """
+    A class to record every job submitted for a benchmark in '<out>/jobs.tsv' (appended by each run, so that resumed
+    benchmarks keep the jobs of previous runs): job identifier, executor, name, count of array tasks, jobs it is held on,
+    script and time of submission. Final states of jobs found by monitors are recorded in '<out>/jobs.final.tsv', so
+    that jobs of previous runs are never queried again.
+    """
+
+    manifest_filename = 'jobs.tsv'
+    final_filename = 'jobs.final.tsv'
+    fields = ('job_id', 'executor', 'name', 'n_tasks', 'hold', 'script', 'submitted')
+
+    def __init__(self, out):
+        """
+        Initialise a JobManifest object.
+        :param out: Root folder of the outputs of the benchmark.
+        """
+        self.out = out
+        self.manifest_file = os.path.join(out, self.manifest_filename)
+        self.final_file = os.path.join(out, self.final_filename)
+
+    def add(self, job_id, executor, job_name, script, n_tasks=None, hold=None):
+        """
+        Append a job to the manifest.
+        :param job_id: Job identifier.
+        :param executor: Name of the executor of the job (e.g. 'sge').
+        :param job_name: Name of the job.
+        :param script: Script of the job.
+        :param n_tasks: Count of tasks of an array job (None otherwise).
+        :param hold: List of job identifiers that the job is held on.
+        :return: None
+        """
+        with open(self.manifest_file, 'a') as stream:
+            stream.write("\t".join([
+                job_id, executor, job_name, '' if n_tasks is None else str(n_tasks), ','.join(hold) if hold else '',
+                os.path.abspath(script), "{0:.0f}".format(time.time())
+            ]) + "\n")
+        return None
+
+    def read(self):
+        """
+        :return: List of jobs (dictionaries of the fields of the manifest), in the order of submission.
+        """
+        jobs = []
+        if not os.path.exists(self.manifest_file):
+            return jobs
+        with open(self.manifest_file) as stream:
+            for line in stream:
+                job = dict(zip(self.fields, line.rstrip('\n').split('\t')))
+                if len(job) != len(self.fields):
+                    raise ValueError("Invalid line in job manifest {0}: {1}".format(self.manifest_file, line.rstrip()))
+                job['program'] = self.program(job['script'])
+                jobs.append(job)
+        return jobs
+
+    def read_final(self):
+        """
+        :return: Dictionary of final states of jobs, by job identifier.
+        """
+        states = {}
+        if not os.path.exists(self.final_file):
+            return states
+        with open(self.final_file) as stream:
+            for line in stream:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 2:
+                    states[fields[0]] = fields[1]
+        return states
+
+    def add_final(self, states):
+        """
+        Append final states of jobs; the output folder may be read-only, in which case they are not recorded.
+        :param states: Dictionary of final states of jobs, by job identifier.
+        :return: None
+        """
+        try:
+            with open(self.final_file, 'a') as stream:
+                for (job_id, state) in states.items():
+                    stream.write("{0}\t{1}\n".format(job_id, state))
+        except OSError as err:
+            logging.warning("Could not record final states of jobs in {0}: {1}".format(self.final_file, err))
+        return None
+
+    def program(self, script):
+        """
+        :param script: Script of a job.
+        :return: Name of the program of the job (first folder of the script under the root folder), or None.
+        """
+        relative = os.path.relpath(script, os.path.abspath(self.out))
+        if relative.startswith(os.pardir) or os.sep not in relative:
+            return None
+        return relative.split(os.sep)[0]
+
+
+class JobMonitor:
+    """
+    A class to track the state of the jobs of a benchmark, and of its configurations.
+    Each poll makes one batched 'qstat' call for all jobs, and one 'qacct' call for the exit status of the jobs that
+    have left the queue since the previous poll (if any), restricted to the jobs of the user that started after the
+    earliest submission of those jobs; final states are recorded (see JobManifest), and never queried again
+    ('finished' if the job has no accounting record).
+    Configurations are completed when the marker written by their script exists ('benchmark_completed'),
+    and failed when no job of their program is queued or running any more.
+    """
+
+    completed_filename = 'benchmark_completed'  # Marker of completed configurations (see SinglePairedConfiguration)
+    pattern_config = re.compile(r'^config_(\d+)$')
+    active_states = ('queued', 'held', 'running')
+
+    def __init__(self, out, interval=60, accounting=True):
+        """
+        Initialise a JobMonitor object.
+        :param out: Root folder of the outputs of the benchmark.
+        :param interval: Interval between polls of the scheduler (seconds), for the asynchronous API.
+        :param accounting: Query the exit status of finished jobs with qacct.
+        """
+        self.out = out
+        self.interval = interval
+        self.accounting = accounting
+        self.manifest = JobManifest(out)
+        self.jobs = self.manifest.read()
+        self.final_states = self.manifest.read_final() # Final state of jobs by identifier: 'done', 'failed' or 'finished'
+        self.completed = set() # (program, index) of configurations whose marker exists
+        self.snapshot = None # Set by self.poll()
+        self.condition = None # Set by self.start_polling()
+        self.polling = False # Set by self.start_polling(), until no job is active or a poll fails
+        self.poll_error = None # Set by self.poll_forever()
+
+    @staticmethod
+    def parse_qstat(output):
+        """
+        :param output: Output of 'qstat' (default format).
+        :return: Dictionary of states ('queued', 'held', 'running', 'error') by job identifier; the state of an array
+        job is the most advanced state of its tasks.
+        """
+        ranks = {'error': 0, 'held': 1, 'queued': 2, 'running': 3}
+        states = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) < 5 or not fields[0].isdigit():
+                continue  # Header and separator lines
+            code = fields[4]
+            if 'E' in code:
+                state = 'error'
+            elif 'r' in code or 't' in code:
+                state = 'running'
+            elif 'h' in code:
+                state = 'held'
+            else:
+                state = 'queued'
+            if fields[0] not in states or ranks[state] > ranks[states[fields[0]]]:
+                states[fields[0]] = state
+        return states
+
+    @staticmethod
+    def parse_qacct(output):
+        """
+        :param output: Output of 'qacct -j' (records separated by lines of '=').
+        :return: Dictionary of final states ('done' or 'failed') by job identifier; an array job failed if any task did.
+        """
+        states = {}
+        record = {}
+        for line in output.splitlines() + ['=']:
+            if line.startswith('='):
+                if 'jobnumber' in record:
+                    failed = record.get('failed', '0').split()[0] != '0' or record.get('exit_status', '0') != '0'
+                    if failed or states.get(record['jobnumber']) != 'failed':
+                        states[record['jobnumber']] = 'failed' if failed else 'done'
+                record = {}
+                continue
+            fields = line.split(None, 1)
+            if len(fields) == 2:
+                record[fields[0]] = fields[1].strip()
+        return states
+
+    def query(self, cmd_args):
+        """
+        :param cmd_args: Command (list of arguments).
+        :return: Standard output of the command.
+        """
+        logging.info("Query scheduler: {0}".format(' '.join(cmd_args)))
+        process = subprocess.run(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise OSError("{0} failed: {1}".format(cmd_args[0], process.stderr.decode('utf-8').strip()))
+        return process.stdout.decode('utf-8')
+
+    def job_states(self):
+        """
+        :return: Dictionary of states by job identifier (one qstat call, and one qacct call if jobs have finished).
+        """
+        states = dict(self.final_states)
+        unresolved = [job for job in self.jobs if job['job_id'] not in states]
+        final_states = {}
+        for job in [job for job in unresolved if job['executor'] != 'sge']:
+            final_states[job['job_id']] = 'finished'  # Local jobs have completed when the driver returned
+        unresolved = [job for job in unresolved if job['executor'] == 'sge']
+        if unresolved:
+            states.update(self.parse_qstat(self.query(['qstat'])))
+        finished = [job for job in unresolved if job['job_id'] not in states]
+        accounted = {}
+        if finished and self.accounting:
+            # Jobs of the user that started after the earliest submission of the jobs that left the queue
+            # (qacct -b [[CC]YY]MMDDhhmm); qacct has no option to select a list of jobs
+            begin = time.strftime('%Y%m%d%H%M', time.localtime(min([int(job['submitted']) for job in finished]) - 60))
+            accounted = self.parse_qacct(self.query(['qacct', '-o', getpass.getuser(), '-b', begin, '-j']))
+        for job in finished:
+            final_states[job['job_id']] = accounted.get(job['job_id'], 'finished')
+        if final_states:
+            self.final_states.update(final_states)
+            self.manifest.add_final(final_states)
+            states.update(final_states)
+        return states
+
+    def configurations(self):
+        """
+        :return: Dictionary of sorted indices of configurations by program (folders 'config_N' of the root folder).
+        """
+        configs = {}
+        for program in sorted(os.listdir(self.out)):
+            program_folder = os.path.join(self.out, program)
+            if not os.path.isdir(program_folder):
+                continue
+            indices = []
+            for entry in os.listdir(program_folder):
+                match = self.pattern_config.match(entry)
+                if match is not None:
+                    indices.append(int(match.group(1)))
+            if indices:
+                configs[program] = sorted(indices)
+        return configs
+
+    def poll(self):
+        """
+        Query the state of all jobs, and look for the completion markers of configurations not completed yet.
+        :return: Dictionary of the state of the benchmark:
+        'jobs' (state by job identifier), 'active' (count of active jobs by program; None for jobs outside programs),
+        'configurations' (state by program and index: 'completed', 'pending' or 'failed').
+        """
+        states = self.job_states()
+        active = collections.Counter()
+        for job in self.jobs:
+            if states[job['job_id']] in self.active_states:
+                active[job['program']] += 1
+        configurations = {}
+        for (program, indices) in self.configurations().items():
+            configurations[program] = {}
+            for index in indices:
+                if (program, index) not in self.completed:
+                    marker = os.path.join(self.out, program, "config_{0}".format(index), self.completed_filename)
+                    if os.path.exists(marker):
+                        self.completed.add((program, index))
+                if (program, index) in self.completed:
+                    configurations[program][index] = 'completed'
+                elif active[program]:
+                    configurations[program][index] = 'pending'
+                else:
+                    configurations[program][index] = 'failed'
+        self.snapshot = {'jobs': states, 'active': dict(active), 'configurations': configurations}
+        return self.snapshot
+
+    def start_polling(self):
+        """
+        Start polling the scheduler in the background (once, whatever the count of coroutines awaiting).
+        :return: None
+        """
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+            self.polling = True
+            asyncio.ensure_future(self.poll_forever())
+        return None
+
+    async def poll_forever(self):
+        """
+        Poll the scheduler at each interval (in a thread, so that the event loop is not blocked),
+        until no job is active.
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                snapshot = await loop.run_in_executor(None, self.poll)
+                if not sum(snapshot['active'].values()):
+                    break
+                async with self.condition:
+                    self.condition.notify_all()
+                await asyncio.sleep(self.interval)
+        except (OSError, ValueError) as err:
+            self.poll_error = err
+        finally:
+            self.polling = False
+            async with self.condition:
+                self.condition.notify_all()
+        return None
+
+    async def wait_for(self, predicate):
+        """
+        :param predicate: Function of a snapshot (see self.poll()), True when the wait is over.
+        :return: Snapshot that satisfied the predicate.
+        """
+        self.start_polling()
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.polling or (
+                self.snapshot is not None and predicate(self.snapshot)
+            ))
+        if self.poll_error is not None:
+            raise self.poll_error
+        return self.snapshot
+
+    async def wait_benchmark(self):
+        """
+        Wait until no job of the benchmark is queued or running.
+        :return: Dictionary of the states of configurations by program and index (see self.poll()).
+        """
+        snapshot = await self.wait_for(lambda snapshot: not sum(snapshot['active'].values()))
+        return snapshot['configurations']
+
+    async def wait_configuration(self, program, index):
+        """
+        Wait until a configuration completed, or no job of its program is queued or running.
+        :param program: Name of the program.
+        :param index: Index of the configuration.
+        :return: 'completed' or 'failed'.
+        """
+        def is_over(snapshot):
+            return snapshot['configurations'].get(program, {}).get(index, 'failed') != 'pending'
+
+        snapshot = await self.wait_for(is_over)
+        if index not in snapshot['configurations'].get(program, {}):
+            raise ValueError("Configuration not found: {0}/config_{1}".format(program, index))
+        return snapshot['configurations'][program][index]
+
+    def report(self, snapshot):
+        """
+        :param snapshot: State of the benchmark (see self.poll()).
+        :return: Table (string) of the count of jobs by state, and of configurations by state, by program.
+        """
+        job_counts = collections.defaultdict(collections.Counter)
+        for job in self.jobs:
+            job_counts[job['program'] or '-'][snapshot['jobs'][job['job_id']]] += 1
+        job_states = ('queued', 'held', 'running', 'error', 'done', 'failed', 'finished')
+        config_states = ('completed', 'pending', 'failed')
+        lines = ["{0:<10} ".format('program') + ' '.join(["{0:>9}".format(state) for state in config_states]) +
+                 ' | ' + ' '.join(["{0:>8}".format(state) for state in job_states])]
+        for program in sorted(set(job_counts.keys()) | set(snapshot['configurations'].keys())):
+            config_counts = collections.Counter(snapshot['configurations'].get(program, {}).values())
+            lines.append("{0:<10} ".format(program) +
+                         ' '.join(["{0:>9d}".format(config_counts[state]) for state in config_states]) + ' | ' +
+                         ' '.join(["{0:>8d}".format(job_counts[program][state]) for state in job_states]))
+        return "\n".join(lines) + "\n"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Show the state of the jobs and configurations of a benchmark, or wait for their completion.'
+    )
+    parser.add_argument(
+        'out', metavar='./benchmark',
+        help='Overall output folder of the benchmark (with its job manifest jobs.tsv).'
+    )
+    parser.add_argument(
+        '-w', '--wait', action='store_true',
+        help='Wait until no job of the benchmark is queued or running, then show the state.'
+    )
+    parser.add_argument(
+        '-c', '--config', metavar='PROGRAM:INDEX',
+        help='Wait for one configuration (e.g. "MuTect2:3"); the exit status is 1 if it failed.'
+    )
+    parser.add_argument(
+        '-i', '--interval', metavar='SECONDS', type=float, default=60,
+        help='Interval between polls of the scheduler, when waiting (default: 60).'
+    )
+    parser.add_argument(
+        '--no-accounting', action='store_true',
+        help='Do not query the exit status of finished jobs with qacct.'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        monitor = JobMonitor(args.out, args.interval, not args.no_accounting)
+        if args.config is not None:
+            (program, index) = args.config.rsplit(':', 1)
+            state = asyncio.run(monitor.wait_configuration(program, int(index)))
+            logging.info("{0}/config_{1}: {2}".format(program, index, state))
+            sys.exit(0 if state == 'completed' else 1)
+        if args.wait:
+            asyncio.run(monitor.wait_benchmark())
+        else:
+            monitor.poll()
+        sys.stdout.write(monitor.report(monitor.snapshot))
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
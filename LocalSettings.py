@@ -1,4 +1,5 @@
 import os
+import sys
 
 home_dir = '/gpfs2/well/ratcliff'
 appsdir = '/apps/well'
@@ -21,3 +22,28 @@ samtools_dir = os.path.join(appsdir, 'samtools', '1.3', 'bin')
 R_dir = os.path.join(appsdir, 'R', '3.3.0', 'bin')
 
 samtools_exe = os.path.join(samtools_dir, 'samtools')
+
+# Interpreter used by benchmark scripts to run helper modules of this framework
+python_exe = sys.executable
+
+# Default resources of benchmark jobs (see Resources); overridden per program, on the command line, or per
+# configuration line (third column of the configuration file)
+default_cores = 4
+default_memory = '32G'
+default_queue = 'short.qc'
+default_walltime = None
+
+# Threads that create the folders and scripts of configurations (file system operations overlap on shared
+# file systems); 1 creates them one at a time
+io_threads = 8
+
+# Threads that submit independent jobs concurrently (see StageGraph), to overlap the latency of qsub;
+# 1 submits them one at a time
+submit_threads = 4
+
+# Default resources of each program (same format as the command line option --resources)
+program_resources = {
+    'CaVEMan': 'cores=1;memory=8G',
+    'tier': 'cores=1;memory=4G',  # Job that extracts the input tier (see InputTier)
+    'postprocess': 'cores=2;memory=4G'  # Post-processing jobs; FILTER values are counted by one process per core
+}
@@ -0,0 +1,100 @@
+import itertools
+import logging
+import re
+
+
+class ParamSweep:
+    """
+    A class to expand one line of the configuration file into a sweep of configurations.
+    Each parameter value may be a literal, a list or a range; configurations are the cartesian product of all values:
+    - '{1.5,2.2,3.0}': list of values
+    - '10..50': integer range (inclusive), step 1
+    - '10..50:+10' (or '10..50:10'): linear range (inclusive), step 10
+    - '10000..100000:x2': log-spaced range (inclusive), each value twice the previous one
+    Configurations are generated lazily, in the order of the product (the last parameter varies fastest).
+    """
+
+    pattern_range = re.compile(r'^(-?\d+(?:\.\d+)?)\.\.(-?\d+(?:\.\d+)?)(?::(x|\+)?(\d+(?:\.\d+)?))?$')
+    pattern_list = re.compile(r'^\{(.*)\}$')
+
+    def __init__(self, params):
+        """
+        Initialise a ParamSweep object.
+        :param params: Dictionary of parameter flags and value specifications (or None for toggle flags).
+        """
+        self.params = params
+        self.values = [self.parse_value(value) for value in params.values()]
+        self.count = 1
+        for values in self.values:
+            self.count *= len(values)
+        if self.count > 1:
+            logging.info("Parameter sweep of {0} configurations".format(self.count))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """
+        :return: Generator of dictionaries of parameter flags and values, one per configuration of the sweep.
+        """
+        flags = list(self.params.keys())
+        for point in itertools.product(*self.values):
+            yield dict(zip(flags, point))
+
+    @classmethod
+    def parse_value(cls, value):
+        """
+        Parse the specification of the values of one parameter.
+        :param value: Value specification (see class documentation), or None for toggle flags.
+        :return: List of values (strings, or None for toggle flags).
+        """
+        if value is None:
+            return [None]
+        match_list = cls.pattern_list.match(value)
+        if match_list is not None:
+            items = [item.strip() for item in match_list.group(1).split(',')]
+            if not all(items):
+                raise ValueError("Invalid list of values: {0}".format(value))
+            return items
+        match_range = cls.pattern_range.match(value)
+        if match_range is not None:
+            return cls.expand_range(*match_range.groups())
+        return [value]
+
+    @staticmethod
+    def expand_range(start, stop, mode, step):
+        """
+        Expand a linear or log-spaced range of values, including both ends when the steps reach them.
+        Integer ranges with integer steps give integer values; otherwise values are formatted as decimal numbers.
+        :param start: First value (string).
+        :param stop: Last value (string).
+        :param mode: 'x' for a log-spaced range, '+' or None for a linear range.
+        :param step: Step (linear) or factor (log-spaced), as a string, or None for a step of 1.
+        :return: List of values (strings).
+        """
+        is_int = all(['.' not in number for number in (start, stop, step or '1')])
+        number = int if is_int else float
+        (first, last, step) = (number(start), number(stop), number(step or '1'))
+        tolerance = 0 if is_int else 1e-9 * max(abs(first), abs(last), 1)
+        values = []
+        if mode == 'x':
+            if step <= 1 or first <= 0:
+                raise ValueError("Invalid log-spaced range (factor must be > 1, start > 0): {0}..{1}".format(
+                    start, stop
+                ))
+            current = first
+            while current <= last + tolerance:
+                values.append(current)
+                current *= step
+        else:
+            if step <= 0:
+                raise ValueError("Invalid range (step must be > 0): {0}..{1}".format(start, stop))
+            index = 0
+            while first + index * step <= last + tolerance:
+                values.append(first + index * step)
+                index += 1
+        if not values:
+            raise ValueError("Empty range of values: {0}..{1}".format(start, stop))
+        if is_int:
+            return [str(value) for value in values]
+        return ["{0:.10g}".format(value) for value in values]
@@ -1,5 +1,12 @@
+import concurrent.futures
+import itertools
+
 from SingleConfiguration import *
 from LocalSettings import *
+from GenomeSplit import *
+from Fingerprint import *
+from ParamSweep import *
+from Resources import *
 
 
 class PairedProgramConfiguration:
@@ -7,64 +14,475 @@ class PairedProgramConfiguration:
     Parent class to store benchmark configurations for one program.
     """
 
-    def __init__(self, params, out):
+    regions_dirname = 'regions'
+    dispatch_script = 'dispatch_script.sh'
+    dispatch_list = 'dispatch_list.txt'
+    dispatch_stdout = 'dispatch.out'
+    dispatch_stderr = 'dispatch.err'
+    postprocess_dispatch_script = 'postprocess_dispatch_script.sh'
+    postprocess_dispatch_stdout = 'postprocess_dispatch.out'
+    postprocess_dispatch_stderr = 'postprocess_dispatch.err'
+    resume_dispatch_script = 'postprocess_resume_dispatch_script.sh'
+    resume_dispatch_list = 'postprocess_resume_list.txt'
+    resume_dispatch_stdout = 'postprocess_resume_dispatch.out'
+    resume_dispatch_stderr = 'postprocess_resume_dispatch.err'
+    batch_size = 1024 # Configurations handed to the pool of threads at once (see map_configurations())
+    vcf_outputs = None # Glob patterns of the VCF outputs of each configuration (relative to its folder), if any
+    supports_scatter = False # Programs that can process regions of the genome in parallel array tasks
+
+    def __init__(self, params, out, resources=None):
         """
         Initialise a Configuration object.
         :param params: Parameters to supply to the program.
         :param out: Folder to store all outputs of the program (name of the program).
+        :param resources: Resources object of the configuration, overriding those of the program (optional).
         """
-        self.configurations = []
+        self.sweeps = [] # List of (ParamSweep, index of its first configuration, Resources) tuples
+        self.resources = Resources.default(out) # Updated by self.set_resources()
+        self.n_configurations = 0
+        self.pending = set() # Indices of configurations to run; set by self.make_config_dirs()
+        self.duplicates = set() # Indices of configurations identical to another one; set by self.make_config_dirs()
+        self.resumed = set() # Indices of completed configurations to post-process; set by write_postprocess_scripts()
+        self.cache_dir = None # Set by self.make_config_dirs()
+        self.inputs = None # Set by self.make_config_dirs()
         self.out = out
-        self.add_configuration(params)
+        self.sample_interval = None # Set by self.set_sampling()
+        self.sample_budget = None # Set by self.set_sampling()
+        self.split_size = None # Set by self.set_splitting()
+        self.split_tasks = None # Set by self.set_splitting()
+        self.scatter = False # Set by self.set_splitting()
+        self.genome_split = None # Set when self.write_scripts() is called (scatter mode)
+        self.array_jobs = False # Set by self.set_array_jobs()
+        self.array_limit = None # Set by self.set_array_jobs()
+        self.truth = None # Set by self.set_evaluation()
+        self.confident_regions = None # Set by self.set_evaluation()
+        self.tier = None # Set by self.set_tier()
+        self.add_configuration(params, resources)
 
-    def add_configuration(self, params):
+    def add_configuration(self, params, resources=None):
         """
-        Add a configuration.
-        :param params: Dictionary of parameter flags and values (or None for toggle flags).
-        :return: None
+        Add a configuration, or a sweep of configurations (see ParamSweep).
+        Configurations of a sweep take consecutive indices, in the order of expansion.
+        :param params: Dictionary of parameter flags and value specifications (or None for toggle flags).
+        :param resources: Resources object of the configurations, overriding those of the program (optional).
+        :return: Count of configurations added.
+        """
+        sweep = ParamSweep(params)
+        self.sweeps.append((sweep, self.n_configurations + 1, Resources() if resources is None else resources))
+        self.n_configurations += len(sweep)
+        return len(sweep)
+
+    def configurations(self):
         """
-        config_index = len(self.configurations)+1
-        self.configurations.append(SinglePairedConfiguration(params, config_index))
+        Expand sweeps lazily, so that configurations are never all held in memory.
+        :return: Generator of SinglePairedConfiguration objects, in the order of their indices.
+        """
+        for (sweep, first_index, resources) in self.sweeps:
+            config_resources = self.resources.update(resources)
+            for (offset, params) in enumerate(sweep):
+                config = SinglePairedConfiguration(params, first_index + offset)
+                config.sample_interval = self.sample_interval
+                config.sample_budget = self.sample_budget
+                config.resources = config_resources
+                yield config
 
-    def make_dir_structure(self, out):
+    def make_dir_structure(self, out, cache_dir, inputs, claimed):
         """
         Create the folder to store all outputs of the program.
         :param out: Root folder to store outputs of the benchmark.
+        :param cache_dir: Folder of cached configuration outputs, by fingerprint.
+        :param inputs: Dictionary of identities of input files (see Fingerprint.file_identity()).
+        :param claimed: Set of fingerprints already claimed by configurations of this benchmark run (updated).
         :return: None
         """
         program_folder = os.path.join(out, self.out)
         self.make_output_dir(program_folder)
-        self.make_config_dirs(program_folder)
+        self.make_config_dirs(program_folder, cache_dir, inputs, claimed)
         return None
 
     def make_output_dir(self, out):
         """
-        :param out: Folder to store all outputs of the program.
+        :param out: Folder to store all outputs of the program (kept if it exists, to resume a benchmark).
         :return:
         """
         logging.info("Create program output folder: {0}".format(out))
-        os.mkdir(out)
+        os.makedirs(out, exist_ok=True)
         return None
 
-    def make_config_dirs(self, out):
+    def make_config_dirs(self, out, cache_dir, inputs, claimed):
         """
-        Create a folder for each configuration under the folder for the corresponding program.
+        Create a folder for each configuration under the folder for the corresponding program,
+        as a link to the cache folder of the fingerprint of the configuration.
         :param out: Folder to store all outputs of the program.
+        :param cache_dir: Folder of cached configuration outputs, by fingerprint.
+        :param inputs: Dictionary of identities of input files (see Fingerprint.file_identity()).
+        :param claimed: Set of fingerprints already claimed by configurations of this benchmark run (updated).
+        :return: None
+        """
+        self.cache_dir = cache_dir
+        self.inputs = inputs
+        tools = [Fingerprint.file_identity(tool_file) for tool_file in self.tool_files()]
+        self.pending = set()
+        self.duplicates = set()
+
+        def claim_configurations():
+            # Duplicates are decided in the order of configurations, before folders are created concurrently
+            for config in self.configurations():
+                fingerprint = Fingerprint.compute(self.out, config.params, tools, inputs, config.resources)
+                yield config, fingerprint, fingerprint in claimed
+                claimed.add(fingerprint)
+
+        def make_config_dir(claim):
+            (config, fingerprint, duplicate) = claim
+            with tracer.span('config_dir', 'make_dir', program=self.out, config=config.index) as span:
+                config.make_dir_structure(out, cache_dir, fingerprint, duplicate)
+                span.set('status', config.status)
+            return config
+
+        for config in self.map_configurations(make_config_dir, claim_configurations()):
+            if config.status == 'pending':
+                self.pending.add(config.index)
+            elif config.status == 'duplicate':
+                self.duplicates.add(config.index)
+        logging.info("{0}: {1} configurations to run, {2} completed or duplicated.".format(
+            self.out, len(self.pending), self.n_configurations - len(self.pending)
+        ))
+        return None
+
+    def tool_files(self):
+        """
+        :return: List of the executable and template files of the program, which identify its version.
+        """
+        return [self.path2exe]
+
+    def map_configurations(self, function, items):
+        """
+        Apply a function to items (e.g. configurations) in a pool of threads, to overlap the latency of file
+        system operations (see io_threads in LocalSettings). Items are consumed in batches, so that
+        configurations are never all in memory at once.
+        :param function: Function of one item.
+        :param items: Iterable of items.
+        :return: Generator of results, in the order of items.
+        """
+        items = iter(items)
+        if io_threads <= 1:
+            for item in items:
+                yield function(item)
+            return
+        with concurrent.futures.ThreadPoolExecutor(io_threads) as pool:
+            while True:
+                batch = list(itertools.islice(items, self.batch_size))
+                if not batch:
+                    break
+                for result in pool.map(function, batch):
+                    yield result
+
+    def for_each_pending(self, function, span_name='config_scripts'):
+        """
+        Apply a function to each configuration that must run, in a pool of threads (see map_configurations()).
+        :param function: Function of one configuration (e.g. that writes its scripts).
+        :param span_name: Name of the span that times each call (see Tracing).
+        :return: None
+        """
+        def traced_function(config):
+            with tracer.span(span_name, 'write', program=self.out, config=config.index):
+                return function(config)
+
+        for _ in self.map_configurations(traced_function, self.pending_configurations()):
+            pass
+        return None
+
+    def pending_configurations(self):
+        """
+        :return: Generator of configurations that must run (not completed in a previous run, nor duplicates).
+        """
+        for config in self.configurations():
+            if config.index in self.pending:
+                yield config
+
+    def completed_configurations(self):
+        """
+        :return: Generator of configurations completed in a previous run (neither pending nor duplicates).
+        """
+        for config in self.configurations():
+            if config.index not in self.pending and config.index not in self.duplicates:
+                yield config
+
+    def resumed_configurations(self):
+        """
+        :return: Generator of completed configurations whose post-processing must run (see write_postprocess_scripts()).
+        """
+        for config in self.configurations():
+            if config.index in self.resumed:
+                yield config
+
+    def set_sampling(self, interval, budget):
+        """
+        Enable background sampling of resource usage in the scripts of all configurations.
+        :param interval: Initial interval between samples (seconds).
+        :param budget: Maximal fraction of one core used by the sampler.
+        :return: None
+        """
+        self.sample_interval = interval
+        self.sample_budget = budget
+        return None
+
+    def set_evaluation(self, truth, confident_regions=None):
+        """
+        Score the calls of each configuration against a truth set, in its post-processing job (see Evaluation).
+        :param truth: VCF file of true variants.
+        :param confident_regions: BED file of confident regions (optional).
+        :return: None
+        """
+        self.truth = truth
+        self.confident_regions = confident_regions
+        return None
+
+    def set_tier(self, tier):
+        """
+        Run all configurations on a tier of the input files (see InputTier): genome splits only cover its contigs.
+        :param tier: InputTier object.
+        :return: None
+        """
+        self.tier = tier
+        return None
+
+    def fai_file(self, ref):
+        """
+        :param ref: Reference genome Fasta file.
+        :return: Fasta index (.fai) file that genome splits cover: that of the contigs of the tier, if any.
+        """
+        if self.tier is not None and self.tier.fai_file() is not None:
+            return self.tier.fai_file()
+        return "{0}.fai".format(ref)
+
+    def set_resources(self, resources):
+        """
+        Override the default resources of the program (see LocalSettings) for all its configurations.
+        Resources given on configuration lines still override those.
+        :param resources: Resources object.
+        :return: None
+        """
+        self.resources = self.resources.update(resources)
+        logging.info("{0}: resources {1}".format(self.out, self.resources))
+        return None
+
+    def set_splitting(self, split_size, split_tasks, scatter=False):
+        """
+        Set how the genome is split for programs that process regions in parallel.
+        :param split_size: Target total size of intervals processed by each task (bp).
+        :param split_tasks: Target count of tasks (ignored if split_size is given).
+        :param scatter: Scatter configurations into one array task per chunk of the genome, if the program supports it.
         :return: None
         """
-        for config in self.configurations:
-            config.make_dir_structure(out)
+        self.split_size = split_size
+        self.split_tasks = split_tasks
+        self.scatter = scatter and self.supports_scatter
+        return None
+
+    def make_regions(self, out, ref):
+        """
+        In scatter mode, split the genome and write the region list of each array task in the program folder.
+        :param out: Folder to store all outputs of the benchmark.
+        :param ref: Reference genome Fasta file.
+        :return: Tuple of the folder of region lists and the count of array tasks, or (None, None) if not scattered.
+        """
+        if not self.scatter:
+            return None, None
+        regions_dir = os.path.join(out, self.out, self.regions_dirname)
+        self.genome_split = GenomeSplit(self.fai_file(ref), self.split_size, self.split_tasks)
+        self.genome_split.write_region_lists(regions_dir)
+        return regions_dir, len(self.genome_split.chunks)
+
+    def set_array_jobs(self, array_jobs, array_limit=None):
+        """
+        Set whether configurations are submitted as the tasks of a single array job.
+        :param array_jobs: Submit one array job for the program, instead of one job per configuration.
+        :param array_limit: Maximal count of configurations that run concurrently (default: no limit).
+        :return: None
+        """
+        self.array_jobs = array_jobs
+        self.array_limit = array_limit
+        return None
+
+    def write_postprocess_scripts(self, out, ref):
+        """
+        Write a script that post-processes the outputs of each configuration (FILTER counts, call matrix, evaluation):
+        configurations that must run, and configurations completed in a previous run whose post-processing did not
+        complete (e.g. its job failed or was killed), or whose calls were not scored against the truth set, confident
+        regions and contigs of this run (see SinglePairedConfiguration.is_evaluated()).
+        :param out: Folder to store all outputs of the benchmark.
+        :param ref: Reference genome.
+        :return: None
+        """
+        program_folder = os.path.join(out, self.out)
+        # The truth set covers the whole genome: a tier of contigs is only scored on its contigs
+        contigs = self.tier.contigs if self.tier is not None else None
+
+        def write_postprocess_script(config):
+            config.write_postprocess_script(
+                program_folder, ref, self.vcf_outputs, self.truth, self.confident_regions, contigs
+            )
+
+        def resume_postprocess(config):
+            with tracer.span('postprocess_resume', 'write', program=self.out, config=config.index):
+                config_dir = os.path.join(program_folder, config.out)
+                if config.is_postprocessed(config_dir) and (
+                        self.truth is None or
+                        config.is_evaluated(config_dir, self.truth, self.confident_regions, contigs)):
+                    return None
+                write_postprocess_script(config)
+                return config.index
+
+        self.for_each_pending(write_postprocess_script, 'postprocess_script')
+        self.resumed = set([
+            index for index in self.map_configurations(resume_postprocess, self.completed_configurations())
+            if index is not None
+        ])
+        if self.resumed:
+            logging.info("{0}: {1} completed configurations to post-process.".format(self.out, len(self.resumed)))
         return None
 
-    def submit_scripts(self, out):
+    def add_stages(self, out, graph, depends=None):
         """
-        Run all benchmark scripts.
+        Add the stages of all configurations that must run to the graph of the benchmark:
+        shared stages, then the job(s) of each configuration, then its post-processing job; and the post-processing
+        job of configurations completed in a previous run, if it did not complete.
         :param out: Root folder to store outputs of the benchmark.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the first jobs of the program start (e.g. tier).
         :return: None
         """
         program_folder = os.path.join(out, self.out)
-        for config in self.configurations:
-            config.submit_script(program_folder)
+        n_tasks = None
+        if self.genome_split is not None:
+            n_tasks = len(self.genome_split.chunks)
+        self.add_resumed_postprocess_stages(program_folder, graph)
+        if not self.pending:
+            return None
+        # Shared stages that must run depend on the stages given, which configurations then depend on transitively
+        depends = self.add_shared_stages(program_folder, graph, depends) or depends
+        if self.array_jobs and n_tasks is None:
+            stage = self.add_array_stage(program_folder, graph, depends)
+            self.add_postprocess_array_stage(program_folder, graph, stage)
+            return None
+        for config in self.pending_configurations():
+            stage = config.add_stages(program_folder, graph, n_tasks, depends)
+            config.add_postprocess_stage(program_folder, graph, stage)
+        return None
+
+    def add_shared_stages(self, out, graph, depends=None):
+        """
+        Add the stages shared by all configurations of the program, if any must run.
+        :param out: Folder to store all outputs of the program.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before shared stages start.
+        :return: List of stages that jobs of the configurations depend on.
+        """
+        return []
+
+    def add_array_stage(self, out, graph, depends=None):
+        """
+        Add all configurations as a single array job.
+        A dispatcher script maps each task ($SGE_TASK_ID) to the script of one configuration.
+        :param out: Folder to store all outputs of the program.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the array job starts (e.g. shared stages).
+        :return: Stage object.
+        """
+        dispatch_script = os.path.join(out, self.dispatch_script)
+        dispatch_list = os.path.join(out, self.dispatch_list)
+        logging.info("Create dispatch list: {0}".format(dispatch_list))
+        n_tasks = 0
+        resources = []
+        with open(dispatch_list, 'w') as stream:
+            for config in self.pending_configurations():
+                stream.write("{0}\n".format(os.path.join(out, config.out)))
+                n_tasks += 1
+                if config.resources not in resources:
+                    resources.append(config.resources)
+        self.write_dispatch_script(
+            dispatch_script, dispatch_list, SinglePairedConfiguration.script_filename,
+            SinglePairedConfiguration.job_stdout, SinglePairedConfiguration.job_stderr
+        )
+        return graph.add(
+            dispatch_script, dispatch_script, self.out,
+            os.path.join(out, self.dispatch_stdout), os.path.join(out, self.dispatch_stderr),
+            Resources.maximum(resources), n_tasks, depends, self.array_limit  # tasks of an array job share resources
+        )
+
+    def add_postprocess_array_stage(self, out, graph, stage):
+        """
+        Add the post-processing of all configurations as a single array job, mapped to configurations
+        by the dispatch list of the array job of the program: each task is held on the task of its configuration.
+        :param out: Folder to store all outputs of the program.
+        :param graph: StageGraph object.
+        :param stage: Array stage of the program.
+        :return: Stage object.
+        """
+        dispatch_script = os.path.join(out, self.postprocess_dispatch_script)
+        dispatch_list = os.path.join(out, self.dispatch_list)
+        self.write_dispatch_script(
+            dispatch_script, dispatch_list, SinglePairedConfiguration.postprocess_script_filename,
+            SinglePairedConfiguration.postprocess_stdout, SinglePairedConfiguration.postprocess_stderr
+        )
+        return graph.add(
+            dispatch_script, dispatch_script, "postprocess_{0}".format(self.out),
+            os.path.join(out, self.postprocess_dispatch_stdout), os.path.join(out, self.postprocess_dispatch_stderr),
+            Resources.default('postprocess'), len(self.pending),
+            task_depends=[stage]  # task i is held until configuration i completed (same dispatch list)
+        )
+
+    def add_resumed_postprocess_stages(self, out, graph):
+        """
+        Add the post-processing of configurations completed in a previous run, which are not held on any job:
+        one job per configuration, or a single array job with its own dispatch list in array job mode.
+        :param out: Folder to store all outputs of the program.
+        :param graph: StageGraph object.
+        :return: None
+        """
+        if not self.resumed:
+            return None
+        if not self.array_jobs:
+            for config in self.resumed_configurations():
+                config.add_postprocess_stage(out, graph)
+            return None
+        dispatch_script = os.path.join(out, self.resume_dispatch_script)
+        dispatch_list = os.path.join(out, self.resume_dispatch_list)
+        logging.info("Create dispatch list: {0}".format(dispatch_list))
+        with open(dispatch_list, 'w') as stream:
+            for config in self.resumed_configurations():
+                stream.write("{0}\n".format(os.path.join(out, config.out)))
+        self.write_dispatch_script(
+            dispatch_script, dispatch_list, SinglePairedConfiguration.postprocess_script_filename,
+            SinglePairedConfiguration.postprocess_stdout, SinglePairedConfiguration.postprocess_stderr
+        )
+        graph.add(
+            dispatch_script, dispatch_script, "postprocess_resume_{0}".format(self.out),
+            os.path.join(out, self.resume_dispatch_stdout), os.path.join(out, self.resume_dispatch_stderr),
+            Resources.default('postprocess'), len(self.resumed)
+        )
+        return None
+
+    @staticmethod
+    def write_dispatch_script(dispatch_script, dispatch_list, script_filename, stdout, stderr):
+        """
+        Write a dispatcher script, which maps each task ($SGE_TASK_ID) of an array job to the script of one configuration.
+        :param dispatch_script: Filename of the dispatcher script.
+        :param dispatch_list: File that lists the folder of the configuration of each task.
+        :param script_filename: Filename of the script to run in the folder of the configuration.
+        :param stdout: Filename of the standard output of the script, in the folder of the configuration.
+        :param stderr: Filename of the standard error of the script, in the folder of the configuration.
+        :return: None
+        """
+        logging.info("Create script file: {0}".format(dispatch_script))
+        with ScriptWriter(dispatch_script, prolog=False) as stream:
+            stream.write("#!/bin/bash\n")
+            stream.write("cd $SGE_O_WORKDIR\n")
+            stream.write("CONFIG_DIR=$(sed -n \"${{SGE_TASK_ID}}p\" {0})\n".format(dispatch_list))
+            stream.write("exec $CONFIG_DIR/{0} 1>$CONFIG_DIR/{1} 2>$CONFIG_DIR/{2}\n".format(
+                script_filename, stdout, stderr
+            ))
         return None
 
 
@@ -72,8 +490,12 @@ class MuTect2PairedConfiguration(PairedProgramConfiguration):
     """
     Configuration for the MuTect2 program.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+
+    supports_scatter = True
+    vcf_outputs = ['output.vcf']
+
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(GATK_dir, 'GenomeAnalysisTK.jar')
 
     def write_scripts(self, out, ref, file1, file2):
@@ -85,9 +507,11 @@ class MuTect2PairedConfiguration(PairedProgramConfiguration):
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
-            config.write_MuTect2_script(program_folder, self.path2exe, ref, file1, file2)
+        (regions_dir, n_tasks) = self.make_regions(out, ref)
+        program_folder = os.path.join(out, self.out)
+        self.for_each_pending(lambda config: config.write_MuTect2_script(
+            program_folder, self.path2exe, ref, file1, file2, regions_dir, n_tasks
+        ))
         return None
 
 
@@ -96,13 +520,23 @@ class StrelkaPairedConfiguration(PairedProgramConfiguration):
     Configuration for the Strelka program.
     Warning: may be renamed to StrelkaBwaPairedConfiguration if elaand and/or isaac are used in the future.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+
+    # The passed.* files repeat the PASS calls of the all.* files
+    vcf_outputs = [os.path.join('analysis', 'results', 'all.somatic.*.vcf')]
+
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(Strelka_dir, 'strelka_workflow-1.0.14', 'bin', 'configureStrelkaWorkflow.pl')
         self.template_config = os.path.join(
             Strelka_dir, 'strelka_workflow-1.0.14', 'etc', 'strelka_config_bwa_default.ini'
         )
 
+    def tool_files(self):
+        """
+        :return: List of the executable and template files of the program, which identify its version.
+        """
+        return [self.path2exe, self.template_config]
+
     def write_scripts(self, out, ref, file1, file2):
         """
         Write a script for each configuration.
@@ -112,9 +546,13 @@ class StrelkaPairedConfiguration(PairedProgramConfiguration):
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
-            config.write_Strelka_script(program_folder, self.path2exe, ref, file1, file2, self.template_config)
+        if not self.pending:
+            return None
+        template = ConfigTemplate(self.template_config, ' = ')
+        program_folder = os.path.join(out, self.out)
+        self.for_each_pending(lambda config: config.write_Strelka_script(
+            program_folder, self.path2exe, ref, file1, file2, template
+        ))
         return None
 
 
@@ -122,8 +560,12 @@ class VirmidPairedConfiguration(PairedProgramConfiguration):
     """
     Configuration for the Virmid program.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+
+    supports_scatter = True
+    vcf_outputs = ['*.som.all.vcf'] # The som.passed.vcf file repeats its PASS calls
+
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(Virmid_dir, 'virmid.jar')
 
     def write_scripts(self, out, ref, file1, file2):
@@ -135,9 +577,11 @@ class VirmidPairedConfiguration(PairedProgramConfiguration):
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
-            config.write_Virmid_script(program_folder, self.path2exe, ref, file1, file2)
+        (regions_dir, n_tasks) = self.make_regions(out, ref)
+        program_folder = os.path.join(out, self.out)
+        self.for_each_pending(lambda config: config.write_Virmid_script(
+            program_folder, self.path2exe, ref, file1, file2, regions_dir, n_tasks
+        ))
         return None
 
 
@@ -145,12 +589,18 @@ class EBCallPairedConfiguration(PairedProgramConfiguration):
     """
     Configuration for the EBcall program.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(EBCall_dir, 'ebCall_v2.sh')
         self.template_config = os.path.join(EBCall_dir, 'config.sh')
         self.normal_list = os.path.join(EBCall_dir, 'testdata', 'list_normal_sample.txt')
 
+    def tool_files(self):
+        """
+        :return: List of the executable and template files of the program, which identify its version.
+        """
+        return [self.path2exe, self.template_config, self.normal_list]
+
     def write_scripts(self, out, ref, file1, file2):
         """
         Write a script for each configuration.
@@ -160,62 +610,128 @@ class EBCallPairedConfiguration(PairedProgramConfiguration):
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
-            config.write_EBCall_script(
-                program_folder, self.path2exe, ref, file1, file2, self.template_config, self.normal_list
-            )
+        if not self.pending:
+            return None
+        template = ConfigTemplate(self.template_config)
+        program_folder = os.path.join(out, self.out)
+        self.for_each_pending(lambda config: config.write_EBCall_script(
+            program_folder, self.path2exe, ref, file1, file2, template, self.normal_list
+        ))
         return None
 
 
 class VarScanPairedConfiguration(PairedProgramConfiguration):
     """
     Configuration for the VarScan program.
+    The pileup of the input files does not depend on VarScan parameters: it is computed once by a shared stage,
+    cached compressed on disk, and read by all configurations.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+
+    supports_scatter = True
+    pileup_dirname = 'pileup'
+    vcf_outputs = ['output.snp.vcf', 'output.indel.vcf'] # With '--output-vcf 1' only
+
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(VarScan_dir, 'VarScan.v2.3.9.jar')
+        self.pileup = None # Set when self.write_scripts() is called
+        self.n_tasks = None # Set when self.write_scripts() is called (scatter mode)
 
     def write_scripts(self, out, ref, file1, file2):
         """
-        Write a script for each configuration.
+        Write the script of the shared pileup stage, and a script for each configuration.
         :param out: Folder to store all outputs of the benchmark.
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
-            config.write_VarScan_script(program_folder, self.path2exe, ref, file1, file2)
+        (regions_dir, self.n_tasks) = self.make_regions(out, ref)
+        if not self.pending:
+            return None
+        program_folder = os.path.join(out, self.out)
+        self.make_pileup(program_folder, ref, file1, file2, regions_dir)
+        pileup_dir = os.path.join(program_folder, self.pileup.out)
+        self.for_each_pending(lambda config: config.write_VarScan_script(
+            program_folder, self.path2exe, pileup_dir, regions_dir, self.n_tasks
+        ))
+        return None
+
+    def make_pileup(self, out, ref, file1, file2, regions_dir):
+        """
+        Create the folder of the shared pileup stage, as a link to its cache folder, and write its script if needed.
+        The pileup is identified by samtools, the input files and the regions of array tasks (scatter mode).
+        :param out: Folder to store all outputs of the program.
+        :param ref: Reference genome Fasta file.
+        :param file1: Input file for reference group (e.g. normal).
+        :param file2: Input file for target group (e.g. tumour).
+        :param regions_dir: Folder of region lists (scatter mode), or None.
+        :return: None
+        """
+        self.pileup = SharedStage(self.pileup_dirname)
+        self.pileup.sample_interval = self.sample_interval
+        self.pileup.sample_budget = self.sample_budget
+        # samtools mpileup and gzip run in a pipe
+        self.pileup.resources = self.resources.update(Resources(cores=2))
+        chunks = None
+        if regions_dir is not None:
+            chunks = self.genome_split.chunks
+        fingerprint = Fingerprint.compute(
+            'mpileup', {'chunks': chunks}, [Fingerprint.file_identity(samtools_exe)], self.inputs
+        )
+        self.pileup.make_dir_structure(out, self.cache_dir, fingerprint)
+        if self.pileup.status == 'pending':
+            self.pileup.write_pileup_script(out, ref, file1, file2, regions_dir, self.n_tasks)
         return None
 
+    def add_shared_stages(self, out, graph, depends=None):
+        """
+        Add the pileup stage, unless completed in a previous run.
+        :param out: Folder to store all outputs of the program.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the pileup starts.
+        :return: List of stages that jobs of the configurations depend on.
+        """
+        if self.pileup.status != 'pending':
+            return []
+        return [self.pileup.add_stage(out, graph, self.n_tasks, depends)]
+
 
 class CaVEManPairedConfiguration(PairedProgramConfiguration):
     """
-    Configuration for the VarScan program.
+    Configuration for the CaVEMan program.
+    The model (setup, Mstep, merge) only depends on 'setup:' and 'mstep:' parameters: it is built once for each
+    distinct set of those parameters, and shared by configurations that only differ in 'estep:' parameters.
     """
-    def __init__(self, params, out):
-        super().__init__(params, out)
+
+    model_steps = ('setup:', 'mstep:')
+    vcf_outputs = [os.path.join('results', '*', '*.vcf'), os.path.join('results', '*', '*.vcf.gz')]
+    def __init__(self, params, out, resources=None):
+        super().__init__(params, out, resources)
         self.path2exe = os.path.join(CaVEMan_dir, 'bin', 'caveman')
+        self.setup_script = '00_Setup_script.sh'
         self.mstep_script = '01_Mstep_script.sh'
         self.merge_script = '02_Merge_script.sh'
         self.estep_script = '03_Estep_script.sh'
         self.config_file = 'caveman.cfg.ini'
+        self.split_file = 'splitList'
+        self.task_file = 'taskList'
         self.cov_file = 'covs_arr'
         self.prob_file = 'probs_arr'
         self.qsub_dir = 'qsub'
         self.ref_fai = None # Set when self.write_scripts() is called
         self.file1 = None # Set when self.write_scripts() is called
         self.file2 = None # Set when self.write_scripts() is called
+        self.models = {} # SharedStage objects of models, by fingerprint; set when self.write_scripts() is called
 
-    def add_configuration(self, params):
+    def add_configuration(self, params, resources=None):
         """
         Add a configuration (CaVEMan requires a specific add configuration).
-        :param params: Dictionary of parameter flags and values (or None for toggle flags).
-        :return: None
+        :param params: Dictionary of parameter flags and value specifications (or None for toggle flags).
+        :param resources: Resources object of the configurations, overriding those of the program (optional).
+        :return: Count of configurations added.
         """
-        config_index = len(self.configurations)+1
+        config_index = self.n_configurations + 1
         # '-g' is a mandatory argument of CaVEMan (Location of tsv ignore regions file)
         # Other programs do not require (or even support) this type of file
         # Therefore, this benchmark framework makes this file an optional input
@@ -223,7 +739,7 @@ class CaVEManPairedConfiguration(PairedProgramConfiguration):
         if 'setup:-g' not in params.keys():
             logging.info("CaVEMan: config_{0} adding setup:-g=/dev/null in params".format(config_index))
             params['setup:-g'] = '/dev/null'
-        self.configurations.append(SinglePairedConfiguration(params, config_index))
+        return super().add_configuration(params, resources)
 
     def write_scripts(self, out, ref, file1, file2):
         """
@@ -234,28 +750,89 @@ class CaVEManPairedConfiguration(PairedProgramConfiguration):
         :param file2: Input file for target group (e.g. tumour).
         :return: None
         """
-        self.ref_fai = "{0}.fai".format(ref)
+        self.ref_fai = self.fai_file(ref)
         self.file1 = file1
         self.file2 = file2
         logging.info("Fasta index file: {0}".format(self.ref_fai))
-        for config in self.configurations:
-            program_folder = os.path.join(out, self.out)
+        self.genome_split = GenomeSplit(self.ref_fai, self.split_size, self.split_tasks)
+        self.models = {}
+        program_folder = os.path.join(out, self.out)
+        # Models are numbered in the order of configurations: create them first, then the Estep scripts concurrently
+        for config in self.pending_configurations():
+            self.make_model(program_folder, config.params, config.resources)
+
+        def write_estep_scripts(config):
+            model = self.models[self.model_fingerprint(config.params)]
             config.write_CaVEMan_scripts(
-                program_folder, self.path2exe, self.qsub_dir, self.config_file,
-                self.mstep_script, self.merge_script, self.cov_file, self.prob_file, self.estep_script
+                program_folder, self.path2exe, os.path.join(program_folder, model.out), self.qsub_dir,
+                self.config_file, self.cov_file, self.prob_file, self.estep_script, self.task_file
             )
+
+        self.for_each_pending(write_estep_scripts)
         return None
 
-    def submit_scripts(self, out):
+    def model_fingerprint(self, params):
+        """
+        :param params: Dictionary of parameter flags and values of a configuration.
+        :return: Fingerprint of the model of the configuration (setup and Mstep parameters, genome split).
+        """
+        model_params = {key: value for (key, value) in params.items() if key.startswith(self.model_steps)}
+        model_params['chunks'] = self.genome_split.chunks
+        return Fingerprint.compute(
+            'CaVEMan model', model_params, [Fingerprint.file_identity(self.path2exe)], self.inputs
+        )
+
+    def make_model(self, out, params, resources):
+        """
+        Get the model of a configuration; on first use, create its folder (as a link to its cache folder),
+        and write its scripts unless it has completed in a previous run.
+        :param out: Folder to store all outputs of the program.
+        :param params: Dictionary of parameter flags and values of the configuration.
+        :param resources: Resources object of the configuration (used by the model if created).
+        :return: SharedStage object of the model.
+        """
+        fingerprint = self.model_fingerprint(params)
+        if fingerprint in self.models:
+            return self.models[fingerprint]
+        model_params = {key: value for (key, value) in params.items() if key.startswith(self.model_steps)}
+        model = SharedStage("model_{0}".format(len(self.models) + 1), model_params)
+        model.sample_interval = self.sample_interval
+        model.sample_budget = self.sample_budget
+        model.resources = resources
+        model.make_dir_structure(out, self.cache_dir, fingerprint)
+        if model.status == 'pending':
+            model.write_CaVEMan_model_scripts(
+                out, self.path2exe, self.qsub_dir, self.config_file, self.mstep_script, self.merge_script,
+                self.cov_file, self.prob_file, self.genome_split, self.split_file, self.task_file,
+                self.setup_script, self.ref_fai, self.file1, self.file2
+            )
+        self.models[fingerprint] = model
+        return model
+
+    def add_stages(self, out, graph, depends=None):
         """
-        Submit all benchmark scripts (CaVEMan submits multiple scripts with dependencies).
+        Add the stages of all configurations that must run (CaVEMan runs multiple scripts with dependencies).
+        The chain of stages of each model that must run is shared by the configurations that use it (same nodes of the
+        graph); their Estep jobs are held until its merge job has completed. Configurations completed in a previous run
+        are post-processed if their post-processing did not complete.
         :param out: Root folder to store outputs of the benchmark.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the first jobs of the program start (e.g. tier).
         :return: None
         """
         program_folder = os.path.join(out, self.out)
-        for config in self.configurations:
-            config.submit_CaVEMan_scripts(
-                program_folder, self.path2exe, self.ref_fai, self.file1, self.file2,
-                self.config_file, self.qsub_dir, self.mstep_script, self.merge_script, self.estep_script
+        self.add_resumed_postprocess_stages(program_folder, graph)
+        n_tasks = len(self.genome_split.chunks)
+        for config in self.pending_configurations():
+            model = self.models[self.model_fingerprint(config.params)]
+            estep_depends = depends
+            if model.status == 'pending':
+                estep_depends = [model.add_CaVEMan_model_stages(
+                    program_folder, self.qsub_dir, self.setup_script, self.mstep_script, self.merge_script,
+                    n_tasks, graph, depends
+                )]
+            stage = config.add_CaVEMan_stages(
+                program_folder, self.qsub_dir, self.estep_script, n_tasks, graph, estep_depends
             )
+            config.add_postprocess_stage(program_folder, graph, stage)
         return None
@@ -0,0 +1,192 @@
+import array
+import bisect
+import logging
+import os
+import struct
+
+
+class ReferenceIndex:
+    """
+    A class to store the Fasta index (.fai) of a reference genome in compact arrays (names, lengths, offsets).
+    The index is parsed once, and cached in a binary sidecar file ('<ref>.fa.fai.bin') that is valid
+    as long as the .fai file has the same modification time and size.
+    """
+
+    sidecar_extension = '.bin'
+    magic = b'BENCHFAI1'
+    header = struct.Struct('<qqq')  # .fai modification time (ns), .fai size, count of contigs
+    loaded = {}  # ReferenceIndex objects already loaded by this process, by absolute path of the .fai file
+
+    def __init__(self, ref_fai):
+        """
+        Initialise a ReferenceIndex object (see also get(), which shares loaded indices).
+        :param ref_fai: Fasta index (.fai) file of the reference genome.
+        """
+        self.ref_fai = ref_fai
+        self.names = []
+        self.lengths = array.array('q')
+        self.offsets = array.array('q')  # Byte offset of the first base of each contig in the Fasta file
+        self.starts = array.array('q')  # Start of each contig on the concatenated genome
+        self.lookup = {}
+        self.genome_size = 0
+        self.load()
+
+    @classmethod
+    def get(cls, ref_fai):
+        """
+        :param ref_fai: Fasta index (.fai) file of the reference genome.
+        :return: ReferenceIndex object, loaded once per process.
+        """
+        key = os.path.abspath(ref_fai)
+        if key not in cls.loaded:
+            cls.loaded[key] = cls(ref_fai)
+        return cls.loaded[key]
+
+    def sidecar_file(self):
+        """
+        :return: Path to the binary sidecar file of the index.
+        """
+        return "{0}{1}".format(self.ref_fai, self.sidecar_extension)
+
+    def load(self):
+        """
+        Load the index from the sidecar file if it is up to date; otherwise, parse the .fai file and write the sidecar.
+        :return: None
+        """
+        try:
+            stat = os.stat(self.ref_fai)
+        except OSError:
+            raise ValueError("Fasta index file not found: {0}".format(self.ref_fai))
+        if not self.read_sidecar(stat):
+            self.parse_fai()
+            self.write_sidecar(stat)
+        self.lookup = {name: index for (index, name) in enumerate(self.names)}
+        if len(self.lookup) != len(self.names):
+            raise ValueError("Duplicate contig names in Fasta index file: {0}".format(self.ref_fai))
+        position = 0
+        for length in self.lengths:
+            self.starts.append(position)
+            position += length
+        self.genome_size = position
+        return None
+
+    def parse_fai(self):
+        """
+        Parse the name, length and offset of each contig in the .fai file.
+        :return: None
+        """
+        logging.info("Parse Fasta index file: {0}".format(self.ref_fai))
+        with open(self.ref_fai) as stream:
+            for (line_index, fai_entry) in enumerate(stream):
+                fai_fields = fai_entry.rstrip('\n').split('\t')
+                if len(fai_fields) < 3:
+                    raise ValueError("Invalid line {0} in Fasta index file: {1}".format(line_index + 1, self.ref_fai))
+                self.names.append(fai_fields[0])
+                self.lengths.append(int(fai_fields[1]))
+                self.offsets.append(int(fai_fields[2]))
+        return None
+
+    def read_sidecar(self, stat):
+        """
+        :param stat: Result of os.stat() on the .fai file.
+        :return: True if the index was loaded from an up-to-date sidecar file.
+        """
+        try:
+            with open(self.sidecar_file(), 'rb') as stream:
+                if stream.read(len(self.magic)) != self.magic:
+                    return False
+                (mtime_ns, size, n_contigs) = self.header.unpack(stream.read(self.header.size))
+                if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+                    return False
+                self.lengths.fromfile(stream, n_contigs)
+                self.offsets.fromfile(stream, n_contigs)
+                self.names = stream.read().decode('utf-8').split('\n')
+        except (OSError, EOFError, struct.error, UnicodeDecodeError):
+            (self.names, self.lengths, self.offsets) = ([], array.array('q'), array.array('q'))
+            return False
+        if len(self.names) != len(self.lengths):
+            (self.names, self.lengths, self.offsets) = ([], array.array('q'), array.array('q'))
+            return False
+        return True
+
+    def write_sidecar(self, stat):
+        """
+        Write the sidecar file (atomically); the reference folder may be read-only, in which case it is skipped.
+        :param stat: Result of os.stat() on the .fai file.
+        :return: None
+        """
+        tmp_file = "{0}.tmp.{1}".format(self.sidecar_file(), os.getpid())
+        try:
+            with open(tmp_file, 'wb') as stream:
+                stream.write(self.magic)
+                stream.write(self.header.pack(stat.st_mtime_ns, stat.st_size, len(self.names)))
+                self.lengths.tofile(stream)
+                self.offsets.tofile(stream)
+                stream.write('\n'.join(self.names).encode('utf-8'))
+            os.replace(tmp_file, self.sidecar_file())
+        except OSError as err:
+            logging.warning("Could not cache Fasta index in {0}: {1}".format(self.sidecar_file(), err))
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+    def contigs(self):
+        """
+        :return: Generator of (name, length) tuples, in the order of the .fai file.
+        """
+        return zip(self.names, self.lengths)
+
+    def contig_index(self, contig):
+        """
+        :param contig: Name of a contig.
+        :return: Index of the contig in the .fai file.
+        """
+        try:
+            return self.lookup[contig]
+        except KeyError:
+            raise ValueError("Contig not found in {0}: {1}".format(self.ref_fai, contig))
+
+    def length(self, contig):
+        """
+        :param contig: Name of a contig.
+        :return: Length of the contig (bp).
+        """
+        return self.lengths[self.contig_index(contig)]
+
+    def validate(self, contig, start=0, end=None):
+        """
+        Check that an interval lies within a contig.
+        :param contig: Name of a contig.
+        :param start: Start of the interval (0-based).
+        :param end: End of the interval (exclusive; default: end of the contig).
+        :return: Tuple (contig, start, end) with the end resolved.
+        """
+        length = self.length(contig)
+        if end is None:
+            end = length
+        if not 0 <= start < end <= length:
+            raise ValueError("Invalid interval {0}:{1}-{2} (contig length: {3})".format(contig, start, end, length))
+        return contig, start, end
+
+    def locate(self, position):
+        """
+        :param position: Position on the concatenated genome (0-based).
+        :return: Tuple (contig, position on the contig).
+        """
+        if not 0 <= position < self.genome_size:
+            raise ValueError("Position beyond the genome: {0}".format(position))
+        index = bisect.bisect_right(self.starts, position) - 1
+        return self.names[index], position - self.starts[index]
+
+    def intervals(self, window=None):
+        """
+        :param window: Maximal size of intervals (bp; default: whole contigs).
+        :return: Generator of (contig, start, end) intervals (0-based, half-open) that tile the genome.
+        """
+        for (name, length) in self.contigs():
+            if length == 0:
+                continue
+            step = length if window is None else window
+            for start in range(0, length, step):
+                yield name, start, min(length, start + step)
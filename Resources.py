@@ -0,0 +1,155 @@
+import re
+
+from LocalSettings import *
+
+
+class Resources:
+    """
+    A class to store the resources of a job (cores, memory, queue, walltime).
+    They define both the request to the scheduler and the parallelism of the tools (threads, JVM heap).
+    Fields left to None are not requested, or inherited when resources are combined (see update()).
+    """
+
+    fields = ('cores', 'memory', 'queue', 'walltime')
+    heap_fraction = 0.8 # Fraction of the memory of a job given to the JVM heap (the rest is for off-heap memory)
+    pattern_memory = re.compile(r'^(\d+(?:\.\d+)?)([KMGT]?)B?$', re.IGNORECASE)
+    pattern_walltime = re.compile(r'^\d+(?::\d{2}){0,2}$')
+    memory_units = {'K': 1.0 / 1024, '': 1, 'M': 1, 'G': 1024, 'T': 1024 * 1024}
+
+    def __init__(self, cores=None, memory=None, queue=None, walltime=None):
+        """
+        Initialise a Resources object.
+        :param cores: Count of cores (slots of the shared memory parallel environment).
+        :param memory: Total memory of the job (e.g. '32G', '500M').
+        :param queue: Queue to submit the job to.
+        :param walltime: Maximal run time of the job ('HH:MM:SS', or seconds).
+        """
+        if cores is not None and int(cores) < 1:
+            raise ValueError("Invalid count of cores: {0}".format(cores))
+        if memory is not None and self.pattern_memory.match(memory) is None:
+            raise ValueError("Invalid memory (expected e.g. '32G', '500M'): {0}".format(memory))
+        if walltime is not None and self.pattern_walltime.match(walltime) is None:
+            raise ValueError("Invalid walltime (expected 'HH:MM:SS'): {0}".format(walltime))
+        self.cores = None if cores is None else int(cores)
+        self.memory = memory
+        self.queue = queue
+        self.walltime = walltime
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parse resources. Expected format: 'cores=8;memory=32G;queue=long.qc;walltime=24:00:00' (any subset).
+        :param spec: Resources specification (may be empty).
+        :return: Resources object.
+        """
+        values = {}
+        for kv in spec.split(';'):
+            if not kv:
+                continue
+            if '=' not in kv:
+                raise ValueError("Invalid resource (expected 'name=value'): {0}".format(kv))
+            (k, v) = kv.split('=', 1)
+            if k not in cls.fields:
+                raise ValueError("Invalid resource name: {0} (expected one of {1})".format(k, ', '.join(cls.fields)))
+            values[k] = v
+        return cls(**values)
+
+    @classmethod
+    def default(cls, program=None):
+        """
+        :param program: Name of the program (optional).
+        :return: Default resources of jobs (see LocalSettings), updated by the defaults of the program if any.
+        """
+        resources = cls(default_cores, default_memory, default_queue, default_walltime)
+        if program is not None and program in program_resources:
+            resources = resources.update(cls.parse(program_resources[program]))
+        return resources
+
+    @classmethod
+    def maximum(cls, resources_list):
+        """
+        :param resources_list: Iterable of Resources objects (e.g. of configurations run as one array job).
+        :return: Resources object that satisfies all of them (the queue of the first one is kept).
+        """
+        maximum = None
+        for resources in resources_list:
+            if maximum is None:
+                maximum = resources
+                continue
+            values = {}
+            for field in ('cores', 'memory', 'walltime'):
+                (current, other) = (getattr(maximum, field), getattr(resources, field))
+                key = {'cores': int, 'memory': cls.parse_memory_mb, 'walltime': cls.parse_walltime_s}[field]
+                if current is None or (other is not None and key(other) > key(current)):
+                    current = other
+                values[field] = current
+            maximum = cls(values['cores'], values['memory'], maximum.queue, values['walltime'])
+        return maximum
+
+    def update(self, other):
+        """
+        :param other: Resources object whose fields override those of this object, unless None.
+        :return: New Resources object.
+        """
+        values = {}
+        for field in self.fields:
+            value = getattr(other, field)
+            values[field] = getattr(self, field) if value is None else value
+        return Resources(**values)
+
+    @classmethod
+    def parse_memory_mb(cls, memory):
+        """
+        :param memory: Memory (e.g. '32G', '500M'; no unit means megabytes).
+        :return: Memory in megabytes.
+        """
+        (value, unit) = cls.pattern_memory.match(memory).groups()
+        return int(float(value) * cls.memory_units[unit.upper()])
+
+    @staticmethod
+    def parse_walltime_s(walltime):
+        """
+        :param walltime: Walltime ('HH:MM:SS', 'MM:SS' or seconds).
+        :return: Walltime in seconds.
+        """
+        seconds = 0
+        for field in walltime.split(':'):
+            seconds = seconds * 60 + int(field)
+        return seconds
+
+    def n_cores(self):
+        """
+        :return: Count of cores (1 if not set).
+        """
+        return 1 if self.cores is None else self.cores
+
+    def qsub_args(self):
+        """
+        :return: List of qsub arguments that request the resources (memory is requested per slot).
+        """
+        args = []
+        if self.cores is not None:
+            args.extend(['-pe', 'shmem', str(self.cores)])
+        resources = []
+        if self.memory is not None:
+            resources.append("h_vmem={0}M".format(max(1, self.parse_memory_mb(self.memory) // self.n_cores())))
+        if self.walltime is not None:
+            resources.append("h_rt={0}".format(self.walltime))
+        if resources:
+            args.extend(['-l', ','.join(resources)])
+        return args
+
+    def java_options(self):
+        """
+        :return: JVM options that fit the heap into the memory of the job, and GC threads to its cores.
+        """
+        options = []
+        if self.memory is not None:
+            options.append("-Xmx{0}m".format(int(self.parse_memory_mb(self.memory) * self.heap_fraction)))
+        options.append("-XX:ParallelGCThreads={0}".format(self.n_cores()))
+        return ' '.join(options)
+
+    def __str__(self):
+        return ';'.join(
+            ["{0}={1}".format(field, getattr(self, field)) for field in self.fields if getattr(self, field) is not None]
+        )
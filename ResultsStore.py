@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+
+
+class ResultsStore:
+    """
+    A class to aggregate the results of the configurations of a benchmark in a SQLite database ('<out>/results.sqlite'):
+    parameters, metrics of commands (see JobMetrics), FILTER counts (see FilterCounts), call counts (see CallMatrix)
+    and scores (see Evaluation).
+    Updates are incremental: the 'configurations' table is the manifest of ingested folders, keyed by the inode and
+    modification time of each folder (outputs are written atomically, which updates the time of the folder);
+    only new or modified folders are read again. Call counts are read again only when the call matrix changed.
+    Commands of shared stages (VarScan pileup, CaVEMan model, see SharedStage) run in the cache folders of the stages:
+    their metrics are counted with those of each configuration that reads them ('shared_stages.txt'), which is read
+    again when the folder of one of its stages changed.
+    """
+
+    db_filename = 'results.sqlite'
+    config_filename = 'benchmark_config.txt'  # See SinglePairedConfiguration
+    completed_filename = 'benchmark_completed'
+    shared_stages_filename = 'shared_stages.txt'  # See SinglePairedConfiguration
+    cache_dirname = 'cache'  # See PairedBenchmarkConfiguration
+    metrics_filename = 'metrics.json'
+    filters_filename = 'filters.json'
+    evaluation_filename = 'evaluation.json'
+    matrix_index = os.path.join('matrix', 'columns.json')
+    pattern_config = re.compile(r'^config_(\d+)$')
+    metrics_keys = ('wall_time_s', 'user_time_s', 'sys_time_s', 'max_rss_kb', 'read_bytes', 'write_bytes', 'exit_status')
+    score_keys = ('TP', 'FP', 'FN', 'precision', 'recall', 'F1')
+    version = 2  # Version of the schema (PRAGMA user_version)
+    schema = """
+        CREATE TABLE IF NOT EXISTS configurations (
+            program TEXT NOT NULL, config INTEGER NOT NULL, folder TEXT NOT NULL, inode INTEGER, mtime_ns INTEGER,
+            shared TEXT, shared_state TEXT, completed INTEGER, wall_time_s REAL, cpu_time_s REAL, max_rss_kb INTEGER, read_bytes INTEGER,
+            write_bytes INTEGER, exit_status INTEGER, variants INTEGER,
+            TP INTEGER, FP INTEGER, FN INTEGER, precision REAL, recall REAL, F1 REAL,
+            PRIMARY KEY (program, config)
+        );
+        CREATE TABLE IF NOT EXISTS params (
+            program TEXT NOT NULL, config INTEGER NOT NULL, flag TEXT NOT NULL, value TEXT
+        );
+        CREATE INDEX IF NOT EXISTS params_flag ON params (program, flag, value);
+        CREATE INDEX IF NOT EXISTS params_config ON params (program, config);
+        CREATE TABLE IF NOT EXISTS metrics (
+            program TEXT NOT NULL, config INTEGER NOT NULL, stage TEXT, label TEXT NOT NULL, wall_time_s REAL,
+            user_time_s REAL, sys_time_s REAL, max_rss_kb INTEGER, read_bytes INTEGER, write_bytes INTEGER,
+            exit_status INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS metrics_config ON metrics (program, config);
+        CREATE TABLE IF NOT EXISTS filters (
+            program TEXT NOT NULL, config INTEGER NOT NULL, filter TEXT NOT NULL, count INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS filters_config ON filters (program, config);
+        CREATE TABLE IF NOT EXISTS calls (
+            program TEXT NOT NULL, config INTEGER NOT NULL, calls INTEGER, PRIMARY KEY (program, config)
+        );
+        CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER);
+    """
+
+    def __init__(self, out, db_file=None):
+        """
+        Initialise a ResultsStore object.
+        :param out: Root folder of the outputs of the benchmark.
+        :param db_file: SQLite database (default: '<out>/results.sqlite').
+        """
+        self.out = out
+        self.db_file = db_file if db_file is not None else os.path.join(out, self.db_filename)
+        self.db = sqlite3.connect(self.db_file)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            # The store only holds copies of the outputs: tables of another version are dropped, and ingested again
+            with self.db:
+                for (table,) in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    self.db.execute("DROP TABLE {0}".format(table))
+            self.db.execute("PRAGMA user_version = {0}".format(self.version))
+        self.db.executescript(self.schema)
+
+    def close(self):
+        """
+        :return: None
+        """
+        self.db.close()
+        return None
+
+    def folders(self):
+        """
+        :return: Dictionary of configuration folders by (program, index) (folders 'config_N' of the root folder).
+        """
+        folders = {}
+        for program in sorted(os.listdir(self.out)):
+            program_folder = os.path.join(self.out, program)
+            if not os.path.isdir(program_folder):
+                continue
+            for entry in os.listdir(program_folder):
+                match = self.pattern_config.match(entry)
+                if match is not None:
+                    folders[(program, int(match.group(1)))] = os.path.join(program_folder, entry)
+        return folders
+
+    def update(self):
+        """
+        Ingest configurations that are new or modified (or whose shared stages are) since the last update, drop those
+        that no longer exist, and update the call counts if the call matrix changed.
+        :return: Count of configurations ingested.
+        """
+        ingested = {}
+        stage_states = {}
+        for (program, index, inode, mtime_ns, shared_state) in self.db.execute(
+                'SELECT program, config, inode, mtime_ns, shared_state FROM configurations'):
+            ingested[(program, index)] = (inode, mtime_ns, shared_state)
+        folders = self.folders()
+        n_ingested = 0
+        with self.db:
+            for key in [key for key in ingested.keys() if key not in folders]:
+                self.delete(*key)
+            for (key, folder) in sorted(folders.items()):
+                try:
+                    stat = os.stat(folder)
+                except FileNotFoundError:
+                    continue  # Broken link (folder of the cache removed)
+                if key in ingested and ingested[key][:2] == (stat.st_ino, stat.st_mtime_ns):
+                    shared_state = ingested[key][2]
+                    if shared_state is None or shared_state == self.shared_state(
+                            [entry.split(':', 1)[0] for entry in shared_state.split(',')], stage_states):
+                        continue
+                self.ingest(key[0], key[1], folder, stat)
+                n_ingested += 1
+            self.update_calls()
+        logging.info("{0} configurations ingested ({1} unchanged) in {2}".format(
+            n_ingested, len(folders) - n_ingested, self.db_file
+        ))
+        return n_ingested
+
+    def delete(self, program, index):
+        """
+        Delete the rows of a configuration.
+        :return: None
+        """
+        for table in ('configurations', 'params', 'metrics', 'filters'):
+            self.db.execute("DELETE FROM {0} WHERE program = ? AND config = ?".format(table), (program, index))
+        return None
+
+    @staticmethod
+    def read_json(path):
+        """
+        :param path: JSON file.
+        :return: Content of the file, or None if it does not exist.
+        """
+        try:
+            with open(path) as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    def shared_state(self, fingerprints, stage_states):
+        """
+        :param fingerprints: List of fingerprints of shared stages (names of their cache folders).
+        :param stage_states: Dictionary of states by fingerprint, filled as folders are read (a stage is shared by
+        many configurations).
+        :return: State of the folders of the stages ('<fingerprint>:<inode>:<mtime>', comma-separated).
+        """
+        for fingerprint in fingerprints:
+            if fingerprint not in stage_states:
+                try:
+                    stat = os.stat(os.path.join(self.out, self.cache_dirname, fingerprint))
+                    stage_states[fingerprint] = "{0}:{1}:{2}".format(fingerprint, stat.st_ino, stat.st_mtime_ns)
+                except FileNotFoundError:
+                    stage_states[fingerprint] = "{0}::".format(fingerprint)  # Folder of the cache removed
+        return ','.join([stage_states[fingerprint] for fingerprint in fingerprints])
+
+    def ingest_metrics(self, program, index, stage, folder):
+        """
+        Insert the metrics of the commands run in a folder.
+        :param program: Name of the program.
+        :param index: Index of the configuration.
+        :param stage: Name of the shared stage that ran the commands, or None for the configuration itself.
+        :param folder: Folder of the configuration or of the shared stage.
+        :return: List of the metrics of the commands (dictionaries, see JobMetrics).
+        """
+        metrics = self.read_json(os.path.join(folder, self.metrics_filename))
+        if metrics is None:
+            return []
+        records = metrics['commands']
+        for (label, record) in sorted(records.items()):
+            self.db.execute(
+                'INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (program, index, stage, label) + tuple([record.get(key) for key in self.metrics_keys])
+            )
+        return list(records.values())
+
+    def ingest(self, program, index, folder, stat):
+        """
+        Replace the rows of a configuration with the contents of its folder.
+        :param program: Name of the program.
+        :param index: Index of the configuration.
+        :param folder: Folder of the configuration.
+        :param stat: Result of os.stat() of the folder, before it is read.
+        :return: None
+        """
+        self.delete(program, index)
+        row = {
+            'program': program, 'config': index, 'folder': os.path.relpath(folder, self.out),
+            'inode': stat.st_ino, 'mtime_ns': stat.st_mtime_ns,
+            'completed': int(os.path.exists(os.path.join(folder, self.completed_filename)))
+        }
+        config_file = os.path.join(folder, self.config_filename)
+        if os.path.exists(config_file):
+            with open(config_file) as stream:
+                for line in stream:
+                    (flag, value) = line.rstrip('\n').split('\t', 1)
+                    self.db.execute(
+                        'INSERT INTO params VALUES (?, ?, ?, ?)', (program, index, flag, None if value == 'NA' else value)
+                    )
+        records = self.ingest_metrics(program, index, None, folder)
+        shared_file = os.path.join(folder, self.shared_stages_filename)
+        if os.path.exists(shared_file):
+            with open(shared_file) as stream:
+                stages = [line.rstrip('\n').split('\t', 1) for line in stream]
+            row['shared'] = ','.join([name for (name, fingerprint) in stages])
+            # State of the stages before they are read
+            row['shared_state'] = self.shared_state([fingerprint for (name, fingerprint) in stages], {})
+            for (name, fingerprint) in stages:
+                records += self.ingest_metrics(
+                    program, index, name, os.path.join(self.out, self.cache_dirname, fingerprint)
+                )
+        if records:
+            # Totals of the configuration and its shared stages: commands run one after the other
+            # (array tasks are summed)
+            row['wall_time_s'] = sum([record['wall_time_s'] for record in records])
+            row['cpu_time_s'] = sum([record['user_time_s'] + record['sys_time_s'] for record in records])
+            row['max_rss_kb'] = max([record['max_rss_kb'] for record in records])
+            for key in ('read_bytes', 'write_bytes'):
+                row[key] = sum([record[key] or 0 for record in records])
+            row['exit_status'] = max([record['exit_status'] for record in records], key=abs, default=None)
+        filters = self.read_json(os.path.join(folder, self.filters_filename))
+        if filters is not None:
+            row['variants'] = filters['variants']
+            for (value, count) in sorted(filters['filters'].items()):
+                self.db.execute('INSERT INTO filters VALUES (?, ?, ?, ?)', (program, index, value, count))
+        evaluation = self.read_json(os.path.join(folder, self.evaluation_filename))
+        if evaluation is not None:
+            for key in self.score_keys:
+                row[key] = evaluation['all'][key]
+        columns = sorted(row.keys())
+        self.db.execute("INSERT INTO configurations ({0}) VALUES ({1})".format(
+            ', '.join(columns), ', '.join(['?'] * len(columns))
+        ), [row[column] for column in columns])
+        return None
+
+    def update_calls(self):
+        """
+        Read the call counts of the columns of the call matrix again if it changed since the last update: columns are
+        added as configurations complete, and replaced when configurations link to another cache folder.
+        :return: None
+        """
+        matrix_index = os.path.join(self.out, self.matrix_index)
+        if not os.path.exists(matrix_index):
+            return None
+        state = dict(self.db.execute('SELECT key, value FROM state').fetchall())
+        mtime_ns = os.stat(matrix_index).st_mtime_ns
+        if state.get('matrix_mtime_ns') == mtime_ns:
+            return None
+        # One row per configuration: small next to the variants of the matrix
+        self.db.execute('DELETE FROM calls')
+        for column in self.read_json(matrix_index)['columns']:
+            (program, config) = column['name'].split('/')
+            index = int(self.pattern_config.match(config).group(1))
+            self.db.execute('INSERT INTO calls VALUES (?, ?, ?)', (program, index, column['calls']))
+        self.db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', ('matrix_mtime_ns', mtime_ns))
+        return None
+
+    def export(self, stream, program=None):
+        """
+        Write one row per configuration (TAB-separated, with a header): results, then one column per parameter
+        flag ('param:<flag>') and per FILTER value ('filter:<value>').
+        :param stream: Output stream.
+        :param program: Only export configurations of this program (default: all).
+        :return: Count of configurations exported.
+        """
+        where = ('WHERE program = ?', (program,)) if program is not None else ('', ())
+        cursor = self.db.execute(
+            "SELECT * FROM configurations LEFT JOIN calls USING (program, config) {0} ORDER BY program, config".format(
+                where[0]
+            ), where[1]
+        )
+        fields = [description[0] for description in cursor.description if description[0] not in
+                  ('inode', 'mtime_ns', 'shared_state')]
+        rows = [dict(zip([description[0] for description in cursor.description], row)) for row in cursor]
+        extra = {}
+        for (table, prefix) in (('params', 'param:'), ('filters', 'filter:')):
+            column = 'flag' if table == 'params' else 'filter'
+            value = 'value' if table == 'params' else 'count'
+            for (row_program, index, name, content) in self.db.execute(
+                    "SELECT program, config, {0}, {1} FROM {2} {3}".format(column, value, table, where[0]), where[1]):
+                extra.setdefault((row_program, index), {})[prefix + name] = content
+        extra_fields = sorted(set([name for values in extra.values() for name in values.keys()]))
+        stream.write("\t".join(fields + extra_fields) + "\n")
+        for row in rows:
+            row.update(extra.get((row['program'], row['config']), {}))
+            stream.write("\t".join(['NA' if row.get(field) is None else str(row[field])
+                                    for field in fields + extra_fields]) + "\n")
+        return len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Aggregate the results of the configurations of a benchmark in a SQLite database, and export them.'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    parser_update = subparsers.add_parser('update', help='Ingest configurations that are new or modified.')
+    parser_update.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_export = subparsers.add_parser('export', help='Export one row per configuration (TAB-separated).')
+    parser_export.add_argument('out', metavar='output_folder', help='Folder of the outputs of the benchmark.')
+    parser_export.add_argument('-p', '--program', help='Only export configurations of this program.')
+    parser_export.add_argument('-o', '--output', metavar='results.tsv', help='Output file (default: standard output).')
+    parser_export.add_argument('-n', '--no-update', action='store_true', help='Do not update the database first.')
+    for subparser in (parser_update, parser_export):
+        subparser.add_argument('-d', '--db', metavar='results.sqlite', help='Database (default: <out>/results.sqlite).')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command is None:
+        parser.error('a command is required')
+    try:
+        store = ResultsStore(args.out, args.db)
+        if args.command == 'update' or not args.no_update:
+            store.update()
+        if args.command == 'export':
+            if args.output is None:
+                store.export(sys.stdout, args.program)
+            else:
+                with open(args.output, 'w') as stream:
+                    n_rows = store.export(stream, args.program)
+                logging.info("{0} configurations exported in {1}".format(n_rows, args.output))
+        store.close()
+    except (OSError, ValueError, sqlite3.Error) as err:
+        logging.error(err)
+        sys.exit(1)
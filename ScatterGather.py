@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import logging
+import os
+import shutil
+import sys
+
+
+class Gatherer:
+    """
+    A class to merge the outputs of the array tasks of a scattered configuration, in task order.
+    Inputs are expected to cover consecutive regions of the genome, in the order given.
+    """
+
+    def __init__(self, inputs):
+        """
+        Initialise a Gatherer object.
+        :param inputs: Output files (or folders) of the array tasks, in task order.
+        """
+        self.inputs = inputs
+
+    def gather(self, output):
+        """
+        Merge files into one.
+        For VCF files ('.vcf'), the header (lines starting with '#') of the first file is kept;
+        for other files (tables such as VarScan outputs), the first line of the first file is kept.
+        :param output: Merged output file.
+        :return: None
+        """
+        is_vcf = output.endswith('.vcf')
+        logging.info("Gather {0} files into {1}".format(len(self.inputs), output))
+        with open(output, 'w') as stream_out:
+            for (input_index, input_file) in enumerate(self.inputs):
+                with open(input_file) as stream_in:
+                    if is_vcf:
+                        for line in stream_in:
+                            if not line.startswith('#'):
+                                stream_out.write(line)
+                                break
+                            if input_index == 0:
+                                stream_out.write(line)
+                    else:
+                        header = stream_in.readline()
+                        if input_index == 0:
+                            stream_out.write(header)
+                    shutil.copyfileobj(stream_in, stream_out, 1 << 20)
+        return None
+
+    def gather_dirs(self, output_dir):
+        """
+        Merge the VCF files of task folders into one folder; files are matched by name with those of the first folder.
+        :param output_dir: Folder to store merged VCF files.
+        :return: None
+        """
+        filenames = [filename for filename in sorted(os.listdir(self.inputs[0])) if filename.endswith('.vcf')]
+        if not filenames:
+            raise ValueError("No VCF file to gather in folder: {0}".format(self.inputs[0]))
+        for filename in filenames:
+            gatherer = Gatherer([os.path.join(input_dir, filename) for input_dir in self.inputs])
+            gatherer.gather(os.path.join(output_dir, filename))
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Merge the outputs of the array tasks of a scattered configuration, in task order.'
+    )
+    parser.add_argument(
+        '-d', '--dirs', action='store_true',
+        help='Inputs are task folders: merge each VCF file of the first folder with the files of the same name.'
+    )
+    parser.add_argument(
+        'output', metavar='output',
+        help='Merged output file (or folder, with --dirs).'
+    )
+    parser.add_argument(
+        'inputs', metavar='input', nargs='+',
+        help='Output files (or folders, with --dirs) of the array tasks, in task order.'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG)
+    try:
+        if args.dirs:
+            Gatherer(args.inputs).gather_dirs(args.output)
+        else:
+            Gatherer(args.inputs).gather(args.output)
+    except (OSError, ValueError) as err:
+        logging.error(err)
+        sys.exit(1)
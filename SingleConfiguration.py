@@ -1,13 +1,65 @@
 
+import io
+import json
 import logging
-import subprocess
-import re
+import shlex
+import shutil
 
 from LocalSettings import *
+from ConfigTemplate import *
+from GenomeSplit import *
+from Resources import *
+from Tracing import *
+from StageGraph import *
 
 # Set the root logging level to DEBUG
 logging.basicConfig(level=logging.DEBUG)
 
+# Helper modules called by benchmark scripts
+metrics_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JobMetrics.py')
+gather_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScatterGather.py')
+filters_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FilterCounts.py')
+matrix_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CallMatrix.py')
+evaluation_exe = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Evaluation.py')
+
+
+class ScriptWriter(io.StringIO):
+    """
+    A class to build a benchmark script in memory, and write it once, executable, at the end of a 'with' block.
+    Scripts start with a common prolog: they exit at the first failed command, so that failed configurations
+    are never marked as completed.
+    """
+
+    mode = 0o777  # Restricted by the umask, as 'chmod +x' would be
+
+    def __init__(self, script, prolog=True):
+        """
+        Initialise a ScriptWriter object.
+        :param script: Filename of the script file to write.
+        :param prolog: If True, start the script with the common prolog.
+        """
+        super().__init__()
+        self.script = script
+        if prolog:
+            self.write("#!/bin/bash\n")
+            self.write("set -e\n")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.save()
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def save(self):
+        """
+        Write the script with a single system call, creating it executable (no chmod).
+        :return: None
+        """
+        with tracer.span('script_file', 'write', script=self.script):
+            fd = os.open(self.script, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, self.mode)
+            with os.fdopen(fd, 'w') as stream:
+                stream.write(self.getvalue())
+        return None
+
 
 class SinglePairedConfiguration:
     """
@@ -15,10 +67,22 @@ class SinglePairedConfiguration:
     """
 
     config_filename = 'benchmark_config.txt'
+    completed_filename = 'benchmark_completed'
     script_filename = 'benchmark_script.sh'
+    gather_script_filename = 'gather_script.sh'
+    scatter_dirname = 'scatter'
     job_stdout = 'qsub.out'
     job_stderr = 'qsub.err'
-    n_cores = 4
+    gather_stdout = 'gather.out'
+    gather_stderr = 'gather.err'
+    postprocess_script_filename = 'postprocess_script.sh'
+    postprocess_completed_filename = 'postprocess_completed'
+    evaluation_filename = 'evaluation.json'  # See Evaluator
+    postprocess_stdout = 'postprocess.out'
+    postprocess_stderr = 'postprocess.err'
+    metrics_filename = 'metrics.json'
+    samples_dirname = 'samples'
+    shared_stages_filename = 'shared_stages.txt'
 
     def __init__(self, params, index):
         """
@@ -29,18 +93,117 @@ class SinglePairedConfiguration:
         self.params = params
         self.index = index
         self.out = "config_{0}".format(index)
+        self.sample_interval = None # Set by PairedProgramConfiguration.set_sampling()
+        self.sample_budget = None # Set by PairedProgramConfiguration.set_sampling()
+        self.fingerprint = None # Set by self.make_dir_structure()
+        self.status = None # Set by self.make_dir_structure()
+        self.resources = Resources.default() # Set by PairedProgramConfiguration.configurations()
 
-    def make_dir_structure(self, out):
+    def make_dir_structure(self, out, cache_dir, fingerprint, duplicate=False):
         """
+        Link the configuration folder to the cache folder of its fingerprint, where outputs are stored.
+        Cache folders of completed configurations are kept as they are; others are (re)created empty.
         :param out: Folder to store outputs of the program.
+        :param cache_dir: Folder of cached configuration outputs, by fingerprint.
+        :param fingerprint: Fingerprint of the configuration.
+        :param duplicate: True if another configuration of this benchmark run has the same fingerprint
+        (and runs instead).
         :return: None
         """
+        self.fingerprint = fingerprint
         config_folder = os.path.join(out, self.out)
-        logging.info("Create configuration output folder: {0}".format(config_folder))
-        os.mkdir(config_folder)
-        self.write_config_file(config_folder)
+        cache_folder = os.path.join(cache_dir, fingerprint)
+        if duplicate:
+            logging.info("Configuration identical to another one: {0}".format(config_folder))
+            self.status = 'duplicate'
+        elif self.is_completed(cache_folder):
+            logging.info("Configuration already completed: {0}".format(config_folder))
+            self.status = 'completed'
+        else:
+            if os.path.exists(cache_folder):
+                logging.info("Remove outputs of incomplete configuration: {0}".format(cache_folder))
+                shutil.rmtree(cache_folder)
+            logging.info("Create configuration output folder: {0}".format(cache_folder))
+            os.mkdir(cache_folder)
+            self.write_config_file(cache_folder)
+            self.status = 'pending'
+        self.link_config_dir(config_folder, cache_folder)
         return None
 
+    @staticmethod
+    def link_config_dir(config_folder, cache_folder):
+        """
+        Create (or update) the configuration folder as a relative symbolic link to a cache folder.
+        :param config_folder: Configuration folder (e.g. 'out/MuTect2/config_1').
+        :param cache_folder: Cache folder.
+        :return: None
+        """
+        target = os.path.relpath(cache_folder, os.path.dirname(config_folder))
+        if os.path.islink(config_folder):
+            if os.readlink(config_folder) == target:
+                return None
+            os.remove(config_folder)
+        elif os.path.exists(config_folder):
+            raise ValueError("Configuration folder is not a link to the cache: {0}".format(config_folder))
+        os.symlink(target, config_folder)
+        return None
+
+    def is_completed(self, out):
+        """
+        :param out: Folder to store outputs of the configuration.
+        :return: True if the jobs of the configuration have completed successfully.
+        """
+        return os.path.exists(os.path.join(out, self.completed_filename))
+
+    def is_postprocessed(self, out):
+        """
+        :param out: Folder to store outputs of the configuration.
+        :return: True if the post-processing job of the configuration has completed successfully.
+        """
+        return os.path.exists(os.path.join(out, self.postprocess_completed_filename))
+
+    def is_evaluated(self, out, truth, confident_regions=None, contigs=None):
+        """
+        :param out: Folder to store outputs of the configuration.
+        :param truth: VCF file of true variants.
+        :param confident_regions: BED file of confident regions (optional).
+        :param contigs: List of contigs to score calls on (default: all).
+        :return: True if the calls of the configuration were scored with the same truth set, regions and contigs
+        (recorded in 'evaluation.json').
+        """
+        try:
+            with open(os.path.join(out, self.evaluation_filename)) as stream:
+                evaluation = json.load(stream)
+        except (OSError, ValueError):
+            return False
+        return (
+            evaluation.get('truth') == os.path.abspath(truth) and
+            evaluation.get('regions') == (None if confident_regions is None else os.path.abspath(confident_regions)) and
+            evaluation.get('contigs') == contigs
+        )
+
+    def completion_command(self, out):
+        """
+        :param out: Folder to store outputs of the configuration.
+        :return: Shell command that marks the configuration as completed (run at the end of its last job).
+        """
+        return "touch {0}\n".format(os.path.abspath(os.path.join(out, self.completed_filename)))
+
+    def array_completion_command(self, out, done_dir, n_tasks):
+        """
+        The configuration is completed when all tasks of its last array job are; the last task to complete marks it.
+        :param out: Folder to store outputs of the configuration.
+        :param done_dir: Folder of markers of completed array tasks.
+        :param n_tasks: Count of array tasks (may be a shell expression).
+        :return: Shell commands to run at the end of each array task.
+        """
+        cmd = "mkdir -p {0}\n".format(done_dir)
+        cmd += "touch {0}\n".format(os.path.join(done_dir, '${SGE_TASK_ID}'))
+        cmd += "if [ $(ls {0} | wc -l) -eq {1} ]; then\n{2}fi\n".format(
+            done_dir, n_tasks, self.completion_command(out)
+        )
+        return cmd
+
     def write_config_file(self, out):
         """
         Write the configuration parameters in a file in the corresponding folder.
@@ -56,7 +219,22 @@ class SinglePairedConfiguration:
                 stream.write("{0}\t{1}\n".format(k, v))
         return None
 
-    def write_MuTect2_script(self, out, exe, ref, file1, file2):
+    def write_shared_stages_file(self, out, stage_dirs):
+        """
+        Write the name and the cache folder (fingerprint) of each shared stage whose outputs the configuration reads,
+        so that the metrics of the stages are counted with those of the configuration (see ResultsStore).
+        :param out: Folder to store outputs of the configuration.
+        :param stage_dirs: List of folders of shared stages (links to their cache folders).
+        :return: None
+        """
+        with open(os.path.join(out, self.shared_stages_filename), 'w') as stream:
+            for stage_dir in stage_dirs:
+                stream.write("{0}\t{1}\n".format(
+                    os.path.basename(stage_dir), os.path.basename(os.path.realpath(stage_dir))
+                ))
+        return None
+
+    def write_MuTect2_script(self, out, exe, ref, file1, file2, regions_dir=None, n_tasks=None):
         """
         Write a script to run the configuration using the Mutect2 program.
         :param out: Folder to store outputs of the program.
@@ -64,35 +242,39 @@ class SinglePairedConfiguration:
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
         :param file2: Input file for target group (e.g. tumour).
+        :param regions_dir: If not None, scatter the genome: folder of region lists, one per array task.
+        :param n_tasks: Count of array tasks (scatter mode only).
         :return: None
         """
         output_dir = os.path.join(out, self.out)
         script_file = os.path.join(output_dir, self.script_filename)
         logging.info("Create script file: {0}".format(script_file))
         output_vcf = os.path.join(out, self.out, 'output.vcf')
-        output_filters = os.path.join(out, self.out, 'filters.txt')
+        label = 'MuTect2'
+        if regions_dir is not None:
+            self.write_gather_script(output_dir, [(output_vcf, self.scatter_output(output_dir, 'output', 'vcf'))], n_tasks)
+            output_vcf = self.scatter_output(output_dir, 'output', 'vcf')
+            label = 'MuTect2.${SGE_TASK_ID}'
         dbsnp = os.path.join(ref_beds_dir, 'known.vcf')
         cosmic = os.path.join(ref_beds_dir, 'Cosmic.vcf')
         lexico = 'ALLOW_SEQ_DICT_INCOMPATIBILITY'
-        cmd = "{0} -Xmx25g -jar {1} -T MuTect2 -R {2} -I:tumor {3} -I:normal {4} --dbsnp {5} --cosmic {6} -o {7} -U {8}".format(
-            java_exe, exe, ref, file2, file1, dbsnp, cosmic, output_vcf, lexico
+        cmd = "{0} {1} -jar {2} -T MuTect2 -R {3} -I:tumor {4} -I:normal {5} --dbsnp {6} --cosmic {7} -o {8} -U {9}".format(
+            java_exe, self.resources.java_options(), exe, ref, file2, file1, dbsnp, cosmic, output_vcf, lexico
         )
         for key in self.params.keys():
             if self.params[key] is None:
                 raise ValueError("MuTect2 does not support flags without value: {0}".format(key))
             cmd += " {0} {1}".format(key, self.params[key])
-        self.write_prolog_script(script_file)
-        cmd += "\n"
-        with open(script_file, 'a') as stream:
+        if '-nct' not in self.params.keys():
+            cmd += " -nct {0}".format(self.resources.n_cores())
+        if regions_dir is not None:
+            cmd += " -L {0}".format(GenomeSplit.region_file(regions_dir, '${SGE_TASK_ID}'))
+        cmd = self.instrument_command(cmd, label, output_dir) + "\n"
+        with ScriptWriter(script_file) as stream:
             # stream.write("cd {0}\n".format(output_dir))
             stream.write(cmd)
-            # Keep the awk command below for later post-processing
-            # stream.write(
-            #     "awk '$0 ~ /^[^#]/ {{nFilters = split($7,filters,\";\"); for (i = 0; i < nFilters; ++i) {{print filters[i+1]}} }}' {0} | sort | uniq -c > {1}".format(
-            #         output_vcf, output_filters
-            #     )
-            # )
-        self.make_script_executable(script_file)
+            if regions_dir is None:
+                stream.write(self.completion_command(output_dir))
         return None
 
     def write_Strelka_script(self, out, exe, ref, file1, file2, template):
@@ -103,7 +285,7 @@ class SinglePairedConfiguration:
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
         :param file2: Input file for target group (e.g. tumour).
-        :param template: Template Strelka configuration file.
+        :param template: ConfigTemplate object of the Strelka configuration file.
         :return: None
         """
         script_file = os.path.join(out, self.out, self.script_filename)
@@ -112,49 +294,72 @@ class SinglePairedConfiguration:
         config_file = os.path.join(config_dir, 'strelka_config.ini')
         output_basedir = 'analysis'
         output_fulldir = os.path.join(config_dir, output_basedir)
-        cmd = "{0} --normal {1} --tumor {2} --ref {3} --config {4} --output-dir {5}\n".format(
+        cmd = "{0} --normal {1} --tumor {2} --ref {3} --config {4} --output-dir {5}".format(
             exe, file1, file2, ref, config_file, output_fulldir
         )
-        self.write_prolog_script(script_file)
-        with open(script_file, 'a') as stream:
+        for key in self.params.keys():
+            if self.params[key] is None:
+                raise ValueError("Strelka does not support flags without value: {0}".format(key))
+        template.render(self.params, config_file)
+        with ScriptWriter(script_file) as stream:
             # stream.write("cd {0}\n".format(config_dir))
-            stream.write("cp {0} {1}\n".format(template, config_file))
-            for key in self.params.keys():
-                if self.params[key] is None:
-                    raise ValueError("Strelka does not support flags without value: {0}".format(key))
-                stream.write("sed -i 's/^{0} = .*$/{0} = {1} # edited/' {2}\n".format(key, self.params[key], config_file))
-            stream.write(cmd)
+            stream.write(self.instrument_command(cmd, 'configure', config_dir) + "\n")
             stream.write("cd {0}\n".format(output_fulldir))
-            stream.write("make\n")
-        self.make_script_executable(script_file)
+            cmd_make = "make -j {0}".format(self.resources.n_cores())
+            stream.write(self.instrument_command(cmd_make, 'make', config_dir) + "\n")
+            stream.write(self.completion_command(config_dir))
         return None
 
-    def write_Virmid_script(self, out, exe, ref, file1, file2):
+    def write_Virmid_script(self, out, exe, ref, file1, file2, regions_dir=None, n_tasks=None):
         """
         Write a script to run the configuration using the Mutect2 program.
+        Virmid has no option to restrict the analysis to regions: in scatter mode, each array task runs Virmid
+        on input files subset to the regions of the task.
         :param out: Folder to store outputs of the program.
         :param exe: Path to executable of the program.
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
         :param file2: Input file for target group (e.g. tumour).
+        :param regions_dir: If not None, scatter the genome: folder of region lists, one per array task.
+        :param n_tasks: Count of array tasks (scatter mode only).
         :return: None
         """
         output_dir = os.path.join(out, self.out)
         script_file = os.path.join(output_dir, self.script_filename)
         logging.info("Create script file: {0}".format(script_file))
-        cmd = "{0} -Xmx25g -jar {1} -R {2} -D {3} -N {4} -w {5}".format(
-            java_exe, exe, ref, file2, file1, output_dir
+        work_dir = output_dir
+        label = 'Virmid'
+        cmd_subset = None
+        if regions_dir is not None:
+            work_dir = os.path.join(output_dir, self.scatter_dirname, 'task_${SGE_TASK_ID}')
+            task_dirs = [
+                os.path.join(output_dir, self.scatter_dirname, "task_{0}".format(task)) for task in range(1, n_tasks + 1)
+            ]
+            self.write_gather_script(output_dir, [(output_dir, task_dirs)], n_tasks)
+            label = 'Virmid.${SGE_TASK_ID}'
+            regions = "$(cat {0})".format(GenomeSplit.region_file(regions_dir, '${SGE_TASK_ID}'))
+            cmd_subset = "mkdir -p {0}".format(work_dir)
+            for bam in (file1, file2):
+                subset_bam = os.path.join(work_dir, os.path.basename(bam))
+                cmd_subset += " && {0} view -b -o {1} {2} {3} && {0} index {1}".format(
+                    samtools_exe, subset_bam, bam, regions
+                )
+            (file1, file2) = (os.path.join(work_dir, os.path.basename(bam)) for bam in (file1, file2))
+        cmd = "{0} {1} -jar {2} -R {3} -D {4} -N {5} -w {6}".format(
+            java_exe, self.resources.java_options(), exe, ref, file2, file1, work_dir
         )
         for key in self.params.keys():
             if self.params[key] is None:
                 raise ValueError("Virmid does not support flags without value: {0}".format(key))
             cmd += " {0} {1}".format(key, self.params[key])
-        cmd += "\n"
-        self.write_prolog_script(script_file)
-        with open(script_file, 'a') as stream:
+        cmd = self.instrument_command(cmd, label, output_dir) + "\n"
+        with ScriptWriter(script_file) as stream:
             # stream.write("cd {0}\n".format(output_dir))
+            if cmd_subset is not None:
+                stream.write(self.instrument_command(cmd_subset, 'subset.${SGE_TASK_ID}', output_dir) + " || exit $?\n")
             stream.write(cmd)
-        self.make_script_executable(script_file)
+            if regions_dir is None:
+                stream.write(self.completion_command(output_dir))
         return None
 
     def write_EBCall_script(self, out, exe, ref, file1, file2, template, normal_list):
@@ -162,7 +367,7 @@ class SinglePairedConfiguration:
         Write a script to run the configuration using the Mutect2 program.
         :param out: Folder to store outputs of the program.
         :param exe: Path to executable of the program.
-        :param template: Template EBcall configuration script.
+        :param template: ConfigTemplate object of the EBcall configuration script.
         :param normal_list: List of paths to .bam files for non-paired normal reference samples.
         :param ref: Reference genome Fasta file.
         :param file1: Input file for reference group (e.g. normal).
@@ -174,34 +379,31 @@ class SinglePairedConfiguration:
         config_dir = os.path.join(out, self.out)
         config_script = os.path.join(config_dir, 'EBcall_config.sh')
         output_dir = os.path.join(config_dir, 'analysis')
-        cmd = "sh {0} {1} {2} {3} {4} {5}\n".format(
+        cmd = "sh {0} {1} {2} {3} {4} {5}".format(
             exe, file2, file1, output_dir, normal_list, config_script,
         )
-        self.write_prolog_script(script_file)
-        with open(script_file, 'a') as stream:
+        cmd = self.instrument_command(cmd, 'EBCall', config_dir) + "\n"
+        values = {'PATH_TO_REF': ref, 'PATH_TO_SAMTOOLS': samtools_dir, 'PATH_TO_R': R_dir}
+        for key in self.params.keys():
+            if self.params[key] is None:
+                raise ValueError("EBCall does not support flags without value: {0}".format(key))
+            values[key] = self.params[key]
+        template.render(values, config_script)
+        with ScriptWriter(script_file) as stream:
             # stream.write("cd {0}\n".format(output_dir))
-            stream.write("cp {0} {1}\n".format(template, config_script))
-            stream.write("sed -i 's|^PATH_TO_REF=.*$|PATH_TO_REF={0} # edited|' {1}\n".format(ref, config_script))
-            stream.write("sed -i 's|^PATH_TO_SAMTOOLS=.*$|PATH_TO_SAMTOOLS={0} # edited|' {1}\n".format(
-                samtools_dir, config_script)
-            )
-            stream.write("sed -i 's|^PATH_TO_R=.*$|PATH_TO_R={0} # edited|' {1}\n".format(R_dir, config_script))
-            for key in self.params.keys():
-                if self.params[key] is None:
-                    raise ValueError("EBCall does not support flags without value: {0}".format(key))
-                stream.write("sed -i 's/^{0}=.*$/{0}={1} # edited/' {2}\n".format(key, self.params[key], config_script))
             stream.write(cmd)
-        self.make_script_executable(script_file)
+            stream.write(self.completion_command(config_dir))
         return None
 
-    def write_VarScan_script(self, out, exe, ref, file1, file2):
+    def write_VarScan_script(self, out, exe, pileup_dir, regions_dir=None, n_tasks=None):
         """
         Write a script to run the configuration using the VarScan program.
+        The pileup of the input files is read from the shared pileup stage of the program (see SharedStage).
         :param out: Folder to store outputs of the program.
         :param exe: Path to executable of the program.
-        :param ref: Reference genome Fasta file.
-        :param file1: Input file for reference group (e.g. normal).
-        :param file2: Input file for target group (e.g. tumour).
+        :param pileup_dir: Folder of the shared pileup stage.
+        :param regions_dir: If not None, scatter the genome: folder of region lists, one per array task.
+        :param n_tasks: Count of array tasks (scatter mode only).
         :return: None
         """
         output_dir = os.path.join(out, self.out)
@@ -209,97 +411,178 @@ class SinglePairedConfiguration:
         output_snp = os.path.join(output_dir, 'output.snp')
         output_indel = os.path.join(output_dir, 'output.indel')
         logging.info("Create script file: {0}".format(script_file))
-        cmd_samtools = "{0} mpileup -f {1} {2} {3}".format(samtools_exe, ref, file1, file2)
-        cmd_VarScan = "{0} -Xmx25g -jar {1} somatic --output-snp {2} --output-indel {3} --mpileup 1".format(
-            java_exe, exe, output_snp, output_indel
+        self.write_shared_stages_file(output_dir, [pileup_dir])
+        cmd_pileup = "gzip -dc {0}".format(SharedStage.pileup_file(pileup_dir))
+        label = 'VarScan'
+        if regions_dir is not None:
+            self.write_gather_script(output_dir, [
+                (output_snp, self.scatter_output(output_dir, 'output', 'snp')),
+                (output_indel, self.scatter_output(output_dir, 'output', 'indel'))
+            ], n_tasks)
+            (output_snp, output_indel) = (self.scatter_output(output_dir, 'output', ext) for ext in ('snp', 'indel'))
+            cmd_pileup = "gzip -dc {0}".format(SharedStage.pileup_file(pileup_dir, '${SGE_TASK_ID}'))
+            label = 'VarScan.${SGE_TASK_ID}'
+        cmd_VarScan = "{0} {1} -jar {2} somatic --output-snp {3} --output-indel {4} --mpileup 1".format(
+            java_exe, self.resources.java_options(), exe, output_snp, output_indel
         )
         for key in self.params.keys():
             if self.params[key] is None:
                 raise ValueError("VarScan does not support flags without value: {0}".format(key))
             cmd_VarScan += " {0} {1}".format(key, self.params[key])
-            self.write_prolog_script(script_file)
-        cmd = "{0} | {1}\n".format(cmd_samtools, cmd_VarScan)
-        with open(script_file, 'a') as stream:
+        cmd = "set -o pipefail; {0} | {1}".format(cmd_pileup, cmd_VarScan)
+        cmd = self.instrument_command(cmd, label, output_dir) + "\n"
+        with ScriptWriter(script_file) as stream:
             # stream.write("cd {0}\n".format(output_dir))
             stream.write(cmd)
-        self.make_script_executable(script_file)
+            if regions_dir is None:
+                stream.write(self.completion_command(output_dir))
         return None
 
-    def write_CaVEMan_scripts(
-            self, out, exe, qsub_base, config_file_base, mstep_base, merge_base, cov_base, prob_base, estep_base):
+    def write_CaVEMan_model_scripts(
+            self, out, exe, qsub_base, config_file_base, mstep_base, merge_base, cov_base, prob_base,
+            genome_split, split_base, task_base, setup_base, ref_fai, file1, file2):
         """
-        Write a script to run the configuration using the VarScan program.
+        Write the scripts of the CaVEMan steps that build the model of the data (setup, Mstep, merge).
+        Only 'setup:' and 'mstep:' parameters are used: the model is shared by configurations that differ in Estep.
         """
         output_dir = os.path.join(out, self.out)
+        split_file = os.path.join(output_dir, split_base)
+        task_file = os.path.join(output_dir, task_base)
+        setup_script_file = os.path.join(output_dir, setup_base)
         mstep_script_file = os.path.join(output_dir, mstep_base)
         merge_script_file = os.path.join(output_dir, merge_base)
-        estep_script_file = os.path.join(output_dir, estep_base)
         qsub_dir = os.path.join(output_dir, qsub_base)
         config_file = os.path.join(output_dir, config_file_base)
         cov_file = os.path.join(output_dir, cov_base)
         prob_file = os.path.join(output_dir, prob_base)
         logging.info("Create qsub output folder: {0}".format(qsub_dir))
         os.mkdir(qsub_dir)
-        self.write_prolog_script(mstep_script_file)
-        self.write_CaVEMan_mstep_script(mstep_script_file, exe, config_file, qsub_dir)
-        self.write_prolog_script(merge_script_file)
-        self.write_CaVEMan_merge_script(merge_script_file, exe, config_file, cov_file, prob_file)
-        self.write_prolog_script(estep_script_file)
-        self.write_CaVEMan_estep_script(estep_script_file, exe, config_file, qsub_dir, cov_file, prob_file)
+        logging.info("Make split list: {0}".format(split_file))
+        genome_split.write_split_list(split_file, task_file)
+        self.write_CaVEMan_setup_script(setup_script_file, exe, ref_fai, file1, file2, config_file, split_file, output_dir)
+        self.write_CaVEMan_mstep_script(mstep_script_file, exe, config_file, qsub_dir, task_file, output_dir)
+        self.write_CaVEMan_merge_script(merge_script_file, exe, config_file, cov_file, prob_file, output_dir)
+        return None
+
+    def write_CaVEMan_scripts(
+            self, out, exe, model_dir, qsub_base, config_file_base, cov_base, prob_base, estep_base, task_base):
+        """
+        Write the script to run the configuration using the CaVEMan program (Estep), from a shared model.
+        :param out: Folder to store outputs of the program.
+        :param exe: Path to executable of the program.
+        :param model_dir: Folder of the model (setup, Mstep, merge) shared by configurations with the same
+        'setup:' and 'mstep:' parameters.
+        :return: None
+        """
+        output_dir = os.path.join(out, self.out)
+        estep_script_file = os.path.join(output_dir, estep_base)
+        qsub_dir = os.path.join(output_dir, qsub_base)
+        logging.info("Create qsub output folder: {0}".format(qsub_dir))
+        os.mkdir(qsub_dir)
+        self.write_shared_stages_file(output_dir, [model_dir])
+        self.write_CaVEMan_estep_script(
+            estep_script_file, exe, os.path.join(model_dir, config_file_base), os.path.join(output_dir, config_file_base),
+            qsub_dir, os.path.join(model_dir, task_base),
+            os.path.join(model_dir, cov_base), os.path.join(model_dir, prob_base), output_dir
+        )
+        return None
+
+    def write_CaVEMan_setup_script(self, script, exe, ref_fai, file1, file2, config_file, split_file, out):
+        """
+        Write the script of the setup step, which writes the CaVEMan configuration file of the later steps.
+        :param script: Filename of the script file to write.
+        :param exe: Path to executable of the program.
+        :param ref_fai: Fasta index (.fai) file of the reference genome.
+        :param file1: Input file for reference group (e.g. normal).
+        :param file2: Input file for target group (e.g. tumour).
+        :param config_file: CaVEMan configuration file.
+        :param split_file: Split list file.
+        :param out: Folder to store outputs of the configuration.
+        :return: None
+        """
+        cmd_setup = [
+            exe, 'setup',
+            '--tumour-bam', file2,
+            '--normal-bam', file1,
+            '--reference-index', ref_fai,
+            '--config-file', config_file,
+            '--results-folder', os.path.join(out, 'results'),
+            '--split-file', split_file,
+            '--alg-bean-file', os.path.join(out, 'alg_bean')
+        ]
+        for key in self.params.keys():
+            if key.startswith('setup:'):
+                cmd_setup.append(key.replace('setup:', ''))
+                if not self.params[key] is None:
+                    cmd_setup.append(self.params[key])
+        cmd_setup = self.instrument_command(' '.join(cmd_setup), 'setup', out) + "\n"
+        with ScriptWriter(script) as stream:
+            stream.write('cd $SGE_O_WORKDIR\n')
+            stream.write(cmd_setup)
         return None
 
-    def write_CaVEMan_mstep_script(self, script, exe, config_file, qsub_dir):
+    def write_CaVEMan_mstep_script(self, script, exe, config_file, qsub_dir, task_file, out):
         """
 
         :param script:
         :param exe:
         :param config_file:
+        :param task_file: File that lists the split indices processed by each array task.
+        :param out: Folder to store outputs of the configuration.
         :return:
         """
-        stdout_file = os.path.join(qsub_dir, 'mstep.out.${SGE_TASK_ID}')
-        stderr_file = os.path.join(qsub_dir, 'mstep.err.${SGE_TASK_ID}')
-        cmd_Mstep = "{0} mstep --config-file {1} --index $SGE_TASK_ID".format(exe, config_file)
+        stdout_file = os.path.join(qsub_dir, 'mstep.out.${SPLIT_INDEX}')
+        stderr_file = os.path.join(qsub_dir, 'mstep.err.${SPLIT_INDEX}')
+        cmd_Mstep = "{0} mstep --config-file {1} --index $SPLIT_INDEX".format(exe, config_file)
         for key in self.params.keys():
             if key.startswith('mstep:'):
                 cmd_Mstep += " {0}".format(key.replace('mstep:', ''))
                 if self.params[key] is None:
                     raise ValueError("CaVEMan Mstep step does not support flags without value: {0}".format(key))
                 cmd_Mstep += " {0}".format(self.params[key])
-        cmd_Mstep += " 1>{0} 2>{1}\n".format(stdout_file, stderr_file)
-        with open(script, 'a') as stream:
+        cmd_Mstep += " 1>{0} 2>{1}".format(stdout_file, stderr_file)
+        cmd_Mstep = self.instrument_command(cmd_Mstep, 'mstep.${SPLIT_INDEX}', out)
+        with ScriptWriter(script) as stream:
             stream.write('cd $SGE_O_WORKDIR\n')
-            stream.write(cmd_Mstep)
-        self.make_script_executable(script)
+            stream.write(self.split_loop(task_file, cmd_Mstep))
         return None
 
-    def write_CaVEMan_merge_script(self, script, exe, config_file, cov_file, prob_file):
+    def write_CaVEMan_merge_script(self, script, exe, config_file, cov_file, prob_file, out):
         """
 
         :param script:
         :param exe:
         :param config_file:
+        :param out: Folder to store outputs of the configuration.
         :return:
         """
-        cmd_merge = "{0} merge --config-file {1} --covariate-file {2} --probabilities-file {3}\n".format(
+        cmd_merge = "{0} merge --config-file {1} --covariate-file {2} --probabilities-file {3}".format(
             exe, config_file, cov_file, prob_file
         )
-        with open(script, 'a') as stream:
+        cmd_merge = self.instrument_command(cmd_merge, 'merge', out) + "\n"
+        with ScriptWriter(script) as stream:
             stream.write('cd $SGE_O_WORKDIR\n')
             stream.write(cmd_merge)
-        self.make_script_executable(script)
+            stream.write(self.completion_command(out))
         return None
 
-    def write_CaVEMan_estep_script(self, script, exe, config_file, qsub_dir, cov_file, prob_file):
+    def write_CaVEMan_estep_script(
+            self, script, exe, model_config_file, config_file, qsub_dir, task_file, cov_file, prob_file, out):
         """
-
+        Write the script of the Estep step.
+        The CaVEMan configuration file of the model is copied with its RESULTS folder set to the configuration folder,
+        so that configurations sharing a model write their calls separately.
         :param script:
         :param exe:
-        :param config_file:
+        :param model_config_file: CaVEMan configuration file written by the setup step of the model.
+        :param config_file: CaVEMan configuration file of the configuration.
+        :param task_file: File that lists the split indices processed by each array task.
+        :param out: Folder to store outputs of the configuration.
         :return:
         """
-        stdout_file = os.path.join(qsub_dir, 'estep.out.${SGE_TASK_ID}')
-        stderr_file = os.path.join(qsub_dir, 'estep.err.${SGE_TASK_ID}')
-        cmd_Mstep = "{0} estep --index $SGE_TASK_ID --config-file {1} -g {2} -o {3}".format(
+        stdout_file = os.path.join(qsub_dir, 'estep.out.${SPLIT_INDEX}')
+        stderr_file = os.path.join(qsub_dir, 'estep.err.${SPLIT_INDEX}')
+        cmd_Mstep = "{0} estep --index $SPLIT_INDEX --config-file {1} -g {2} -o {3}".format(
             exe, config_file, cov_file, prob_file
         )
         for key in self.params.keys():
@@ -308,152 +591,319 @@ class SinglePairedConfiguration:
                 if self.params[key] is None:
                     raise ValueError("CaVEMan Estep step does not support flags without value: {0}".format(key))
                 cmd_Mstep += " {0}".format(self.params[key])
-        cmd_Mstep += " 1>{0} 2>{1}\n".format(stdout_file, stderr_file)
-        with open(script, 'a') as stream:
+        cmd_Mstep += " 1>{0} 2>{1}".format(stdout_file, stderr_file)
+        cmd_Mstep = self.instrument_command(cmd_Mstep, 'estep.${SPLIT_INDEX}', out)
+        # Every task writes the same file: write to a temporary file of the task, then rename it atomically
+        tmp_config_file = "{0}.${{SGE_TASK_ID}}.tmp".format(config_file)
+        with ScriptWriter(script) as stream:
             stream.write('cd $SGE_O_WORKDIR\n')
-            stream.write(cmd_Mstep)
-        self.make_script_executable(script)
+            stream.write("sed 's|^RESULTS=.*$|RESULTS={0}|' {1} > {2}\n".format(
+                os.path.join(out, 'results'), model_config_file, tmp_config_file
+            ))
+            stream.write("mv {0} {1}\n".format(tmp_config_file, config_file))
+            stream.write(self.split_loop(task_file, cmd_Mstep))
+            stream.write(self.array_completion_command(
+                out, os.path.join(qsub_dir, 'estep.done'), "$(wc -l < {0})".format(task_file)
+            ))
         return None
 
-    @staticmethod
-    def write_prolog_script(script):
+    def write_postprocess_script(self, out, ref, vcf_outputs=None, truth=None, confident_regions=None, contigs=None):
         """
-        Write common prolog of benchmark scripts.
-        :param script: Filename of the script file to write.
+        Write a script to count the values of the FILTER field of the VCF outputs of the configuration
+        ('filters.txt', 'filters.json'), to score its calls against a truth set ('evaluation.json'), and to add
+        its calls to the call matrix of the benchmark. The post-processing has its own completion marker, so that
+        it runs again when the benchmark is resumed if it failed, or to score the calls against another truth set
+        (see PairedProgramConfiguration); FILTER values are only counted again if their counts are missing.
+        :param out: Folder to store outputs of the program.
+        :param ref: Reference genome.
+        :param vcf_outputs: Glob patterns of VCF outputs, relative to the folder of the configuration (None if none).
+        :param truth: VCF file of true variants (None: no evaluation).
+        :param confident_regions: BED file of confident regions (optional).
+        :param contigs: List of contigs to score calls on (default: all), e.g. those of a tier (see InputTier).
+        :return: None
+        """
+        output_dir = os.path.join(out, self.out)
+        script_file = os.path.join(output_dir, self.postprocess_script_filename)
+        logging.info("Create script file: {0}".format(script_file))
+        with ScriptWriter(script_file) as stream:
+            if vcf_outputs is not None:
+                # Large VCF files are split across the cores of the job ($NSLOTS is set by SGE and the local executor)
+                cmd = "{0} {1} --glob --processes ${{NSLOTS:-1}} {2} {3}".format(
+                    python_exe, filters_exe, output_dir,
+                    ' '.join([shlex.quote(os.path.join(output_dir, pattern)) for pattern in vcf_outputs])
+                )
+                # 'filters.json' is written atomically: it exists only if the counts are complete
+                stream.write("[ -e {0} ] || {1}\n".format(
+                    os.path.join(output_dir, 'filters.json'), self.instrument_command(cmd, 'filters', output_dir)
+                ))
+            if truth is not None:
+                # Absolute paths are recorded in 'evaluation.json', to detect another truth set on resume
+                cmd = "{0} {1} {2} {3} {4} {5}".format(
+                    python_exe, evaluation_exe, os.path.basename(out), ref, os.path.abspath(truth), output_dir
+                )
+                if confident_regions is not None:
+                    cmd += " --bed {0}".format(os.path.abspath(confident_regions))
+                if contigs is not None:
+                    cmd += " --contigs {0}".format(shlex.quote(','.join(contigs)))
+                stream.write(self.instrument_command(cmd, 'evaluation', output_dir) + "\n")
+            # The matrix adds all configurations completed so far (including those of earlier runs);
+            # it is shared by all configurations, so that its failure does not fail the job
+            cmd = "{0} {1} update {2} {3}".format(python_exe, matrix_exe, os.path.dirname(out), ref)
+            stream.write("{0} || echo 'Call matrix not updated' >&2\n".format(
+                self.instrument_command(cmd, 'matrix', output_dir)
+            ))
+            stream.write("touch {0}\n".format(
+                os.path.abspath(os.path.join(output_dir, self.postprocess_completed_filename))
+            ))
+        return None
+
+    def add_postprocess_stage(self, out, graph, stage=None):
+        """
+        :param out: Folder to store outputs of the program.
+        :param graph: StageGraph object.
+        :param stage: Last stage of the configuration (None: completed in a previous run).
+        :return: Stage object.
+        """
+        output_dir = os.path.join(out, self.out)
+        script = os.path.join(output_dir, self.postprocess_script_filename)
+        return graph.add(
+            script, script, "postprocess_{0}_{1}".format(os.path.basename(out), self.index),
+            os.path.join(output_dir, self.postprocess_stdout), os.path.join(output_dir, self.postprocess_stderr),
+            Resources.default('postprocess'),
+            depends=None if stage is None else [stage]  # hold until the configuration completed
+        )
+
+    def scatter_output(self, out, basename, extension, task='${SGE_TASK_ID}'):
+        """
+        :param out: Folder to store outputs of the configuration.
+        :param basename: Basename of the gathered output file.
+        :param extension: Extension of the output file.
+        :param task: Array task index (default: shell variable of the current task).
+        :return: Path to the output file of an array task.
+        """
+        return os.path.join(out, self.scatter_dirname, "{0}.{1}.{2}".format(basename, task, extension))
+
+    def write_gather_script(self, out, outputs, n_tasks):
+        """
+        Write the script that merges the outputs of all array tasks of a scattered configuration.
         :param out: Folder to store outputs of the configuration.
+        :param outputs: List of (gathered output, scattered outputs) pairs. If the gathered output is a folder,
+        scattered outputs are task folders of which VCF files are merged by name.
+        :param n_tasks: Count of array tasks.
         :return: None
         """
-        with open(script, 'w') as stream:
-            stream.write("#!/bin/bash\n")
+        script_file = os.path.join(out, self.gather_script_filename)
+        logging.info("Create script file: {0}".format(script_file))
+        os.makedirs(os.path.join(out, self.scatter_dirname), exist_ok=True)
+        with ScriptWriter(script_file) as stream:
+            for (gathered, scattered) in outputs:
+                if isinstance(scattered, str):
+                    scattered = [scattered.replace('${SGE_TASK_ID}', str(task)) for task in range(1, n_tasks + 1)]
+                cmd = "{0} {1} {2}{3} {4}".format(
+                    python_exe, gather_exe, '--dirs ' if gathered == out else '', gathered, ' '.join(scattered)
+                )
+                label = "gather.{0}".format('vcf' if gathered == out else os.path.basename(gathered))
+                stream.write(self.instrument_command(cmd, label, out) + " || exit $?\n")
+            stream.write(self.completion_command(out))
         return None
 
     @staticmethod
-    def make_script_executable(script):
+    def split_loop(task_file, cmd):
+        """
+        Repeat a command for each split index processed by the current array task.
+        :param task_file: File that lists the split indices processed by each array task (one line per task).
+        :param cmd: Shell command that refers to the split index as $SPLIT_INDEX.
+        :return: Shell code.
+        """
+        return (
+            "for SPLIT_INDEX in $(sed -n \"${{SGE_TASK_ID}}p\" {0}); do\n"
+            "export SPLIT_INDEX\n"
+            "{1} || exit $?\n"
+            "done\n"
+        ).format(task_file, cmd)
+
+    def instrument_command(self, cmd, label, out):
         """
-        Make script executable.
-        :return:
+        Wrap a shell command to record its wall time, CPU times, peak RSS and I/O in the metrics file.
+        :param cmd: Shell command to instrument (without trailing newline).
+        :param label: Label of the command in the metrics file (may refer to shell variables, e.g. $SGE_TASK_ID).
+        :param out: Folder to store outputs of the configuration.
+        :return: Instrumented shell command.
         """
-        subprocess.call(["chmod", "+x", script])
-        return None
+        return "{0} {1}".format(self.metrics_command(label, out), shlex.quote(cmd))
 
-    def submit_script(self, out):
+    def metrics_command(self, label, out):
+        """
+        Build the call to the metrics helper (without the command to instrument).
+        If sampling is enabled, the time series is written in the samples folder of the configuration.
+        :param label: Label of the command in the metrics file (may refer to shell variables, e.g. $SGE_TASK_ID).
+        :param out: Folder to store outputs of the configuration.
+        :return: Shell command.
+        """
+        # Absolute paths: scripts may change directory before running a command (e.g. Strelka)
+        metrics_file = os.path.abspath(os.path.join(out, self.metrics_filename))
+        cmd = "{0} {1}".format(python_exe, metrics_exe)
+        if self.sample_interval is not None:
+            samples_file = os.path.abspath(os.path.join(out, self.samples_dirname, "{0}.json".format(label)))
+            cmd += " --samples \"{0}\" --sample-interval {1} --sample-budget {2}".format(
+                samples_file, self.sample_interval, self.sample_budget
+            )
+        return "{0} {1} \"{2}\"".format(cmd, metrics_file, label)
+
+    def add_stages(self, out, graph, n_tasks=None, depends=None):
         """
         :param out: Folder to store outputs of the program.
-        :return: None
+        :param graph: StageGraph object.
+        :param n_tasks: If not None, run the script as an array job of this many tasks (scatter mode),
+        followed by the gather script.
+        :param depends: List of stages that must complete before the job starts (e.g. shared stages).
+        :return: Last Stage object of the configuration (the gather stage in scatter mode).
         """
         output_dir = os.path.join(out, self.out)
         script = os.path.join(output_dir, self.script_filename)
         stdout_file = os.path.join(output_dir, self.job_stdout)
         stderr_file = os.path.join(output_dir, self.job_stderr)
         job_name = "{0}_{1}".format(os.path.basename(out), self.index)
-        qsub_cmd_args = [
-            'qsub',
-            '-o', stdout_file,
-            '-e', stderr_file,
-            '-pe', 'shmem', str(self.n_cores),
-            '-N', job_name,
-            '-q', 'short.qc',
-            script
-        ]
-        qsub_cmd_str = ' '.join(qsub_cmd_args)
-        logging.info("Submit command: {0}".format(qsub_cmd_str))
-        subprocess.call(qsub_cmd_args)
-        return None
+        stage = graph.add(script, script, job_name, stdout_file, stderr_file, self.resources, n_tasks, depends)
+        if n_tasks is None:
+            return stage
+        # Gather
+        gather_script = os.path.join(output_dir, self.gather_script_filename)
+        return graph.add(
+            gather_script, gather_script, "gather_{0}".format(job_name),
+            os.path.join(output_dir, self.gather_stdout), os.path.join(output_dir, self.gather_stderr),
+            depends=[stage]  # hold until all regions completed
+        )
 
-    def submit_CaVEMan_scripts(
-            self, out, exe, ref_fai, file1, file2, config_base, qsub_base, mstep_base, merge_base, estep_base
-    ):
+    def add_CaVEMan_model_stages(
+            self, out, qsub_base, setup_base, mstep_base, merge_base, n_tasks, graph, depends=None):
         """
+        Add the chain of CaVEMan stages that build the model: setup, Mstep (array job), merge.
+        Each stage is held until the previous one has completed; configurations that share the model share its stages.
+        :param out: Folder to store outputs of the program.
+        :param n_tasks: Count of array tasks for the Mstep step.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the setup job starts (e.g. tier).
+        :return: Stage object of the merge step.
+        """
+        model_dir = os.path.join(out, self.out)
+        qsub_dir = os.path.join(model_dir, qsub_base)
+        setup_script_file = os.path.join(model_dir, setup_base)
+        mstep_script_file = os.path.join(model_dir, mstep_base)
+        merge_script_file = os.path.join(model_dir, merge_base)
+        # Setup
+        setup_stage = graph.add(
+            setup_script_file, setup_script_file, "setup_{0}".format(self.out),
+            os.path.join(model_dir, 'setup.out'), os.path.join(model_dir, 'setup.err'), self.resources,
+            depends=depends
+        )
+        # Mstep
+        mstep_stage = graph.add(
+            mstep_script_file, mstep_script_file, "Mstep_{0}".format(self.out),
+            os.path.join(qsub_dir, 'mstep.out.job'), os.path.join(qsub_dir, 'mstep.err.job'), self.resources,
+            n_tasks=n_tasks, depends=[setup_stage]  # hold until setup completed
+        )
+        # Merge
+        return graph.add(
+            merge_script_file, merge_script_file, "merge_{0}".format(self.out),
+            os.path.join(qsub_dir, 'merge.out.job'), os.path.join(qsub_dir, 'merge.err.job'), self.resources,
+            depends=[mstep_stage]  # hold until Mstep completed
+        )
 
+    def add_CaVEMan_stages(self, out, qsub_base, estep_base, n_tasks, graph, depends=None):
+        """
+        Add the Estep array job of the configuration.
         :param out: Folder to store outputs of the program.
-        :return: None
+        :param n_tasks: Count of array tasks for the Estep step.
+        :param graph: StageGraph object.
+        :param depends: List of stages that must complete before the job starts (merge stage of the model).
+        :return: Stage object.
         """
         config_dir = os.path.join(out, self.out)
-        config_file = os.path.join(config_dir, config_base)
-        setup_out = os.path.join(config_dir, 'setup.out')
-        setup_err = os.path.join(config_dir, 'setup.err')
         qsub_dir = os.path.join(config_dir, qsub_base)
-        result_folder = os.path.join(config_dir, 'results')
-        split_file = os.path.join(config_dir, 'splitList')
-        alg_bean_file = os.path.join(config_dir, 'alg_bean')
-        mstep_script_file = os.path.join(config_dir, mstep_base)
-        merge_script_file = os.path.join(config_dir, merge_base)
         estep_script_file = os.path.join(config_dir, estep_base)
-        pattern_job_id = re.compile('.* (\d+)[ .].*')
-        # Setup
-        cmd_setup = [
-            exe, 'setup',
-            '--tumour-bam', file2,
-            '--normal-bam', file1,
-            '--reference-index', ref_fai,
-            '--config-file', config_file,
-            '--results-folder', result_folder,
-            '--split-file', split_file,
-            '--alg-bean-file', alg_bean_file
-        ]
-        for key in self.params.keys():
-            if key.startswith('setup:'):
-                cmd_setup.append(key.replace('setup:', ''))
-                if not self.params[key] is None:
-                    cmd_setup.append(self.params[key])
-        logging.info("Submit command: {0}".format(' '.join(cmd_setup)))
-        subprocess.call(cmd_setup, stdout=open(setup_out, 'w'), stderr=open(setup_err, 'w'))
-        # Split
-        if ref_fai is None:
-            raise ValueError("ref_fai not set! please contact maintainer.")
-        logging.info("Parse FAI index: {0}".format(ref_fai))
-        logging.info("Make split list: {0}".format(split_file))
-        with open(ref_fai) as stream_in, open(split_file, 'w') as stream_out:
-            for fai_entry in stream_in:
-                fai_fields = fai_entry.strip().split('\t')
-                stream_out.write("{0}\t0\t{1}\n".format(fai_fields[0], fai_fields[1]))
-        # Mstep
-        with open(split_file) as stream:
-            split_entries = len(stream.readlines())
-            logging.info("# split_entries: {0}".format(split_entries))
-        mstep_cmd_args = [
-            'qsub',
-            '-t', "1-{0}".format(split_entries),
-            '-o', os.path.join(qsub_dir, 'mstep.out.job'),
-            '-e', os.path.join(qsub_dir, 'mstep.err.job'),
-            '-N', "Mstep_{0}".format(self.index),
-            '-q', 'short.qc',
-            mstep_script_file
-        ]
-        logging.info("Submit command: {0}".format(' '.join(mstep_cmd_args)))
-        mstep_stdout, err = subprocess.Popen(mstep_cmd_args, stdout=subprocess.PIPE).communicate()
-        logging.info(mstep_stdout.decode("utf-8").strip())
-        mstep_job_id = pattern_job_id.match(mstep_stdout.decode("utf-8")).group(1)
-        logging.info("Mstep_{0} JOB_ID: {1}".format(self.index, mstep_job_id))
-        # Merge
-        merge_cmd_args = [
-            'qsub',
-            '-hold_jid', mstep_job_id,  # hold until Mstep completed
-            '-o', os.path.join(qsub_dir, 'merge.out.job'),
-            '-e', os.path.join(qsub_dir, 'merge.err.job'),
-            '-N', "merge_{0}".format(self.index),
-            '-q', 'short.qc',
-            merge_script_file
-        ]
-        logging.info("Submit command: {0}".format(' '.join(merge_cmd_args)))
-        merge_stdout, err = subprocess.Popen(merge_cmd_args, stdout=subprocess.PIPE).communicate()
-        logging.info(merge_stdout.decode("utf-8").strip())
-        merge_job_id = pattern_job_id.match(merge_stdout.decode("utf-8")).group(1)
-        logging.info("Mstep_{0} JOB_ID: {1}".format(self.index, merge_job_id))
-        # Mstep
-        estep_cmd_args = [
-            'qsub',
-            '-t', "1-{0}".format(split_entries),
-            '-hold_jid', merge_job_id,  # hold until Merge completed
-            '-o', os.path.join(qsub_dir, 'estep.out.job'),
-            '-e', os.path.join(qsub_dir, 'estep.err.job'),
-            '-N', "Estep_{0}".format(self.index),
-            '-q', 'short.qc',
-            estep_script_file
-        ]
-        logging.info("Submit command: {0}".format(' '.join(estep_cmd_args)))
-        estep_stdout, err = subprocess.Popen(estep_cmd_args, stdout=subprocess.PIPE).communicate()
-        logging.info(estep_stdout.decode("utf-8").strip())
-        estep_job_id = pattern_job_id.match(estep_stdout.decode("utf-8")).group(1)
-        logging.info("Estep_{0} JOB_ID: {1}".format(self.index, estep_job_id))
+        return graph.add(
+            estep_script_file, estep_script_file, "Estep_{0}".format(self.index),
+            os.path.join(qsub_dir, 'estep.out.job'), os.path.join(qsub_dir, 'estep.err.job'), self.resources,
+            n_tasks=n_tasks, depends=depends  # hold until the model is merged
+        )
+
+
+class SharedStage(SinglePairedConfiguration):
+    """
+    A stage computed once for several configurations of a program, and cached like a configuration
+    (e.g. VarScan pileup, CaVEMan model). Jobs of the configurations are held until the stage has completed.
+    """
+
+    pileup_basename = 'mpileup'
+
+    def __init__(self, name, params=None):
+        """
+        Initialise a SharedStage object.
+        :param name: Name of the folder of the stage in the program folder (e.g. 'pileup').
+        :param params: Dictionary of parameter flags and values of the stage (default: none).
+        """
+        super().__init__({} if params is None else params, 0)
+        self.out = name
+
+    @classmethod
+    def pileup_file(cls, out, task=None):
+        """
+        :param out: Folder of the pileup stage.
+        :param task: Array task index (scatter mode), or None.
+        :return: Path to the compressed pileup file (of the regions of the task, in scatter mode).
+        """
+        if task is None:
+            return os.path.join(out, "{0}.gz".format(cls.pileup_basename))
+        return os.path.join(out, "{0}.{1}.gz".format(cls.pileup_basename, task))
+
+    def write_pileup_script(self, out, ref, file1, file2, regions_dir=None, n_tasks=None):
+        """
+        Write a script to compute the pileup of the input files once, compressed with a fast setting (gzip -1).
+        In scatter mode, each array task computes the pileup of its regions, in genome order.
+        :param out: Folder to store outputs of the program.
+        :param ref: Reference genome Fasta file.
+        :param file1: Input file for reference group (e.g. normal).
+        :param file2: Input file for target group (e.g. tumour).
+        :param regions_dir: If not None, scatter the genome: folder of region lists, one per array task.
+        :param n_tasks: Count of array tasks (scatter mode only).
+        :return: None
+        """
+        output_dir = os.path.join(out, self.out)
+        script_file = os.path.join(output_dir, self.script_filename)
+        logging.info("Create script file: {0}".format(script_file))
+        cmd_samtools = "{0} mpileup -f {1} {2} {3}".format(samtools_exe, ref, file1, file2)
+        pileup_file = self.pileup_file(output_dir)
+        label = 'mpileup'
+        if regions_dir is not None:
+            cmd_samtools = "(for REGION in $(cat {0}); do {1} -r $REGION || exit $?; done)".format(
+                GenomeSplit.region_file(regions_dir, '${SGE_TASK_ID}'), cmd_samtools
+            )
+            pileup_file = self.pileup_file(output_dir, '${SGE_TASK_ID}')
+            label = 'mpileup.${SGE_TASK_ID}'
+        # Write to a temporary file, so that an interrupted job never leaves a truncated pileup
+        cmd = "set -o pipefail; {0} | gzip -1 > {1}.tmp".format(cmd_samtools, pileup_file)
+        with ScriptWriter(script_file) as stream:
+            stream.write(self.instrument_command(cmd, label, output_dir) + "\n")
+            stream.write("mv {0}.tmp {0}\n".format(pileup_file))
+            if regions_dir is None:
+                stream.write(self.completion_command(output_dir))
+            else:
+                stream.write(self.array_completion_command(output_dir, os.path.join(output_dir, 'done'), n_tasks))
         return None
+
+    def add_stage(self, out, graph, n_tasks=None, depends=None):
+        """
+        :param out: Folder to store outputs of the program.
+        :param graph: StageGraph object.
+        :param n_tasks: If not None, run the script as an array job of this many tasks (scatter mode).
+        :param depends: List of stages that must complete before the job starts (e.g. tier).
+        :return: Stage object.
+        """
+        output_dir = os.path.join(out, self.out)
+        script = os.path.join(output_dir, self.script_filename)
+        return graph.add(
+            script, script, "{0}_{1}".format(os.path.basename(out), self.out),
+            os.path.join(output_dir, self.job_stdout), os.path.join(output_dir, self.job_stderr),
+            self.resources, n_tasks, depends
+        )
@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+
+
+class Stage:
+    """
+    A class to store one job of a StageGraph: its script, submission options and the stages it depends on.
+    """
+
+    def __init__(self, key, script, job_name, stdout, stderr, resources=None, n_tasks=None, depends=None,
+                 max_running=None, task_depends=None):
+        """
+        Initialise a Stage object.
+        :param key: Identifier of the stage in the graph; stages added with the same key are submitted once.
+        :param script: Script to run.
+        :param job_name: Name of the job.
+        :param stdout: File to store the standard output of the job.
+        :param stderr: File to store the standard error of the job.
+        :param resources: Resources object of the job (or of each task of an array job); None for a light job.
+        :param n_tasks: If not None, submit an array job of this many tasks.
+        :param depends: List of Stage objects that must complete before the stage starts.
+        :param max_running: Maximal count of tasks of an array job that run concurrently (default: no limit).
+        :param task_depends: List of array Stage objects of the same count of tasks, whose task i must complete before
+        task i of the stage starts (e.g. post-processing of each configuration of an array job).
+        """
+        self.key = key
+        self.script = script
+        self.job_name = job_name
+        self.stdout = stdout
+        self.stderr = stderr
+        self.resources = resources
+        self.n_tasks = n_tasks
+        self.depends = [] if depends is None else list(depends)
+        self.max_running = max_running
+        self.task_depends = [] if task_depends is None else list(task_depends)
+        self.dependents = [] # Set by StageGraph.add()
+        self.job_id = None # Set by StageGraph.submit()
+
+
+class StageGraph:
+    """
+    A class to store the stages (jobs) of a benchmark as a directed acyclic graph, and to submit them.
+    Stages are added after the stages they depend on (the graph is acyclic by construction); a stage added again with
+    the same key (e.g. the model shared by several CaVEMan configurations) is the same node.
+    Each stage is submitted as soon as the stages it depends on have been submitted, held on their jobs (or task by
+    task, on array jobs of the same width);
+    independent branches are submitted concurrently, in a pool of threads, to overlap the latency of the scheduler.
+    """
+
+    def __init__(self):
+        """
+        Initialise a StageGraph object.
+        """
+        self.stages = {} # Stages by key, in the order of addition (a topological order)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def add(self, key, script, job_name, stdout, stderr, resources=None, n_tasks=None, depends=None,
+            max_running=None, task_depends=None):
+        """
+        Add a stage, unless a stage with the same key exists (see Stage.__init__() for parameters).
+        :return: Stage object (the existing one, if any).
+        """
+        if key in self.stages:
+            return self.stages[key]
+        stage = Stage(key, script, job_name, stdout, stderr, resources, n_tasks, depends, max_running, task_depends)
+        for upstream in stage.task_depends:
+            if upstream.n_tasks != n_tasks:
+                raise ValueError("Stage {0} is held task by task on a stage of another width: {1}".format(
+                    key, upstream.key
+                ))
+        for upstream in stage.depends + stage.task_depends:
+            if self.stages.get(upstream.key) is not upstream:
+                raise ValueError("Stage {0} depends on a stage outside the graph: {1}".format(key, upstream.key))
+            upstream.dependents.append(stage)
+        self.stages[key] = stage
+        return stage
+
+    def submit(self, executor, n_threads=1):
+        """
+        Submit all stages in topological order: each stage is held on the jobs of the stages it depends on.
+        :param executor: Executor object that runs jobs.
+        :param n_threads: Count of stages submitted concurrently.
+        :return: None
+        """
+        if not self.stages:
+            return None
+        logging.info("Submit {0} stages ({1} threads)".format(len(self.stages), n_threads))
+        ready = queue.Queue()
+        lock = threading.Lock()
+        remaining = {}
+        state = {'submitted': 0, 'error': None}
+        for stage in self.stages.values():
+            remaining[stage.key] = len(stage.depends) + len(stage.task_depends)
+            if not remaining[stage.key]:
+                ready.put(stage)
+
+        def submit_ready():
+            while True:
+                stage = ready.get()
+                if stage is None:
+                    return
+                try:
+                    stage.job_id = executor.submit(
+                        stage.script, stage.job_name, stage.stdout, stage.stderr, stage.resources, stage.n_tasks,
+                        [upstream.job_id for upstream in stage.depends], stage.max_running,
+                        [upstream.job_id for upstream in stage.task_depends]
+                    )
+                except Exception as err:  # Any error: other threads must stop, or they would wait forever
+                    with lock:
+                        state['error'] = err
+                    for _ in range(n_threads):
+                        ready.put(None)  # stop all threads
+                    return
+                with lock:
+                    state['submitted'] += 1
+                    for dependent in stage.dependents:
+                        remaining[dependent.key] -= 1
+                        if not remaining[dependent.key]:
+                            ready.put(dependent)
+                    if state['submitted'] == len(self.stages):
+                        for _ in range(n_threads):
+                            ready.put(None)
+
+        threads = [threading.Thread(target=submit_ready) for _ in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if state['error'] is not None:
+            raise state['error']
+        return None
@@ -0,0 +1,157 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Span:
+    """
+    A class to time a block of code (see Tracer.span()).
+    """
+
+    def __init__(self, tracer, name, phase, attrs):
+        """
+        Initialise a Span object.
+        :param tracer: Tracer object that records the span.
+        :param name: Name of the span (e.g. 'qsub').
+        :param phase: Phase of the span, summarised together (e.g. 'submit').
+        :param attrs: Dictionary of attributes (e.g. program, index of the configuration).
+        """
+        self.tracer = tracer
+        self.name = name
+        self.phase = phase
+        self.attrs = attrs
+        self.start = None
+
+    def set(self, key, value):
+        """
+        Set an attribute of the span (e.g. a job identifier known at its end).
+        :return: None
+        """
+        self.attrs[key] = value
+        return None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self, time.perf_counter())
+        return False
+
+
+class NullSpan:
+    """
+    A class of span that records nothing, used when tracing is disabled.
+    """
+
+    def set(self, key, value):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Tracer:
+    """
+    A class to record timed spans of the driver (parsing, folders, scripts, submission), exported as
+    Chrome trace events (chrome://tracing, Perfetto) and summarised by phase.
+    When disabled (the default), span() returns a shared span that records nothing.
+    """
+
+    null_span = NullSpan()
+
+    def __init__(self):
+        """
+        Initialise a Tracer object (disabled).
+        """
+        self.enabled = False
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def enable(self):
+        """
+        Start recording spans.
+        :return: None
+        """
+        self.enabled = True
+        self.origin = time.perf_counter()
+        return None
+
+    def span(self, name, phase, **attrs):
+        """
+        :param name: Name of the span.
+        :param phase: Phase of the span.
+        :param attrs: Attributes of the span.
+        :return: Span object, to use as a context manager ('with tracer.span(...):').
+        """
+        if not self.enabled:
+            return self.null_span
+        return Span(self, name, phase, attrs)
+
+    def record(self, span, end):
+        """
+        :param span: Span object that ended.
+        :param end: Value of time.perf_counter() at the end of the span.
+        :return: None
+        """
+        # Tuples rather than trace events, to keep the memory of large benchmarks low (see self.trace_events())
+        self.events.append((span.name, span.phase, span.start, end, threading.get_ident(), span.attrs))
+        return None
+
+    def trace_events(self):
+        """
+        :return: Generator of Chrome trace events ('complete' events, times in microseconds).
+        """
+        for (name, phase, start, end, thread, attrs) in self.events:
+            yield {
+                'name': name, 'cat': phase, 'ph': 'X', 'ts': round((start - self.origin) * 1e6, 1),
+                'dur': round((end - start) * 1e6, 1), 'pid': self.pid, 'tid': thread, 'args': attrs
+            }
+
+    def write(self, trace_file):
+        """
+        Write the spans as Chrome trace events (JSON).
+        :param trace_file: Output file.
+        :return: None
+        """
+        logging.info("Write trace file: {0} ({1} spans)".format(trace_file, len(self.events)))
+        with open(trace_file, 'w') as stream:
+            stream.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+            for (index, event) in enumerate(self.trace_events()):
+                if index:
+                    stream.write(",\n")
+                json.dump(event, stream, default=str)
+            stream.write("\n]}\n")
+        return None
+
+    def summary(self):
+        """
+        :return: Table (string) of the count, total, mean and maximal duration of spans by phase and name,
+        in the order of phases. Spans of a phase nest (e.g. 'qsub' spans within the 'submit_scripts' span):
+        totals of different names are not additive.
+        """
+        durations = collections.OrderedDict()
+        for (name, phase, start, end, thread, attrs) in self.events:
+            durations.setdefault((phase, name), []).append(end - start)
+        phase_rank = {}
+        for (phase, name) in durations.keys():
+            phase_rank.setdefault(phase, len(phase_rank))
+        lines = ["{0:<10} {1:<20} {2:>8} {3:>10} {4:>10} {5:>10}".format(
+            'phase', 'span', 'count', 'total_s', 'mean_ms', 'max_ms'
+        )]
+        for ((phase, name), times) in sorted(durations.items(), key=lambda item: phase_rank[item[0][0]]):
+            lines.append("{0:<10} {1:<20} {2:>8d} {3:>10.3f} {4:>10.3f} {5:>10.3f}".format(
+                phase, name, len(times), sum(times), 1000 * sum(times) / len(times), 1000 * max(times)
+            ))
+        return "\n".join(lines) + "\n"
+
+
+# Tracer shared by all modules of the driver; enabled by benchmark_somatic_callers.py --trace
+tracer = Tracer()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Official
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Custom
+from BenchmarkConfiguration import *
+import ProgramConfiguration
+
+# Baselines of the phases of the framework, by count of configurations (see --update-baselines)
+baselines_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_framework_baselines.json')
+
+# Parameters of generated configurations: one value per configuration, programs in turn
+program_params = [
+    ('MuTect2', '--normal_lod={0}'),
+    ('Strelka', 'maxInputDepth={0}'),
+    ('Virmid', '-c1={0}'),
+    ('EBCall', 'MIN_MINUS_LOG10_PV={0}'),
+    ('VarScan', '--min-coverage={0}'),
+    ('CaVEMan', 'estep:--min-tum-coverage={0}')
+]
+
+# Emulates SGE qsub: increasing job identifiers, array jobs (-t) and dependencies (-hold_jid, -hold_jid_ad), logged
+# for checks
+fake_qsub = r"""#!/bin/bash
+state_dir=$(dirname "$0")
+exec 9>>"$state_dir/job_id.lock"
+flock 9  # jobs are submitted concurrently (see StageGraph)
+id=$(( $(cat "$state_dir/job_id" 2>/dev/null || echo 0) + 1 ))
+echo $id > "$state_dir/job_id"
+name=job; tasks=; hold=
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -N) name=$2; shift ;;
+        -t) tasks=$2; shift ;;
+        -hold_jid|-hold_jid_ad) hold=${hold:+$hold,}$2; shift ;;
+        -o|-e|-q|-tc|-l) shift ;;
+        -pe) shift 2 ;;
+    esac
+    shift
+done
+printf '%s\t%s\t%s\t%s\n' "$id" "$name" "$tasks" "$hold" >> "$state_dir/submissions.tsv"
+if [ -n "$tasks" ]; then
+    echo "Your job-array $id.$tasks:1 (\"$name\") has been submitted"
+else
+    echo "Your job $id (\"$name\") has been submitted"
+fi
+"""
+
+
+class FrameworkBenchmark:
+    """
+    A class to measure the time and peak memory of the phases of the framework (parse the configuration file,
+    create folders, write scripts, submit jobs) for a count of configurations, in a temporary folder,
+    with fake tools, reference genome, input files and qsub. Nothing runs on a scheduler.
+    """
+
+    phases = ('parse', 'make_dir', 'write', 'submit')
+    n_contigs = 25
+    contig_length = 10000000
+
+    def __init__(self, work_dir, n_configurations, array_jobs=True):
+        """
+        Initialise a FrameworkBenchmark object.
+        :param work_dir: Temporary folder (emptied by the caller).
+        :param n_configurations: Count of configurations, across all programs.
+        :param array_jobs: Submit configurations as array jobs (see benchmark_somatic_callers.py --array).
+        """
+        self.work_dir = work_dir
+        self.n_configurations = n_configurations
+        self.array_jobs = array_jobs
+        self.bin_dir = os.path.join(work_dir, 'bin')
+        self.config_file = os.path.join(work_dir, 'config.txt')
+        self.ref = os.path.join(work_dir, 'genome.fa')
+        self.file1 = os.path.join(work_dir, 'normal.bam')
+        self.file2 = os.path.join(work_dir, 'tumour.bam')
+        self.out = os.path.join(work_dir, 'benchmark')
+        self.results = {}
+
+    def setup(self):
+        """
+        Write the configuration file, the fake reference genome, input files, templates of tools and qsub.
+        :return: None
+        """
+        with open(self.config_file, 'w') as stream:
+            for index in range(self.n_configurations):
+                (program, param) = program_params[index % len(program_params)]
+                stream.write("{0}\t{1}\n".format(program, param.format(index // len(program_params) + 1)))
+        with open("{0}.fai".format(self.ref), 'w') as stream:
+            for index in range(self.n_contigs):
+                stream.write("chr{0}\t{1}\t{2}\t60\t61\n".format(
+                    index + 1, self.contig_length, 6 + index * (self.contig_length // 60 * 61 + 10)
+                ))
+        for path in (self.ref, self.file1, self.file2):
+            open(path, 'w').close()
+        tools_dir = os.path.join(self.work_dir, 'tools')
+        ProgramConfiguration.Strelka_dir = os.path.join(tools_dir, 'strelka')
+        ProgramConfiguration.EBCall_dir = os.path.join(tools_dir, 'EBCall')
+        strelka_etc = os.path.join(ProgramConfiguration.Strelka_dir, 'strelka_workflow-1.0.14', 'etc')
+        os.makedirs(strelka_etc)
+        with open(os.path.join(strelka_etc, 'strelka_config_bwa_default.ini'), 'w') as stream:
+            stream.write("[user]\nisSkipDepthFilters = 0\nmaxInputDepth = 10000\n")
+        os.makedirs(ProgramConfiguration.EBCall_dir)
+        with open(os.path.join(ProgramConfiguration.EBCall_dir, 'config.sh'), 'w') as stream:
+            stream.write("PATH_TO_REF=\nPATH_TO_SAMTOOLS=\nPATH_TO_R=\nMIN_MINUS_LOG10_PV=3\n")
+        os.makedirs(self.bin_dir)
+        qsub = os.path.join(self.bin_dir, 'qsub')
+        with open(qsub, 'w') as stream:
+            stream.write(fake_qsub)
+        os.chmod(qsub, 0o755)
+        os.environ['PATH'] = "{0}{1}{2}".format(self.bin_dir, os.pathsep, os.environ['PATH'])
+        return None
+
+    def measure(self, phase, function):
+        """
+        Run a phase, and record its time and the peak memory of the process at its end.
+        :param phase: Name of the phase.
+        :param function: Function that runs the phase.
+        :return: Result of the function.
+        """
+        start = time.perf_counter()
+        result = function()
+        self.results[phase] = {
+            'time_s': round(time.perf_counter() - start, 4),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }
+        logging.warning("{0} configurations, {1}: {2[time_s]:.3f} s, {2[max_rss_kb]} KB".format(
+            self.n_configurations, phase, self.results[phase]
+        ))
+        return result
+
+    def run(self):
+        """
+        Run all phases, then check the submitted jobs.
+        :return: Dictionary of results by phase.
+        """
+        self.setup()
+        cwd = os.getcwd()
+        os.chdir(self.work_dir)
+        try:
+            bc = self.measure('parse', lambda: PairedBenchmarkConfiguration(self.config_file, self.out))
+            self.measure('make_dir', lambda: bc.make_dir_structure(self.ref, self.file1, self.file2))
+            self.measure('write', lambda: bc.write_scripts(self.ref, self.file1, self.file2))
+            self.measure('submit', lambda: bc.submit_scripts(SGEExecutor(default_queue), self.array_jobs))
+        finally:
+            os.chdir(cwd)
+        self.check_submissions()
+        return self.results
+
+    def check_submissions(self):
+        """
+        Check that jobs were submitted, and only held on jobs submitted before them.
+        :return: None
+        """
+        submitted = set()
+        with open(os.path.join(self.bin_dir, 'submissions.tsv')) as stream:
+            for line in stream:
+                (job_id, name, tasks, hold) = line.rstrip('\n').split('\t')
+                for held_id in [held_id for held_id in hold.split(',') if held_id]:
+                    if held_id not in submitted:
+                        raise ValueError("Job {0} ({1}) held on unknown job {2}".format(job_id, name, held_id))
+                submitted.add(job_id)
+        if not submitted:
+            raise ValueError('No job submitted')
+        self.results['jobs'] = len(submitted)
+        return None
+
+
+def compare(results, baselines, tolerance, min_time_s):
+    """
+    :param results: Dictionary of results by count of configurations and phase.
+    :param baselines: Dictionary of baselines, in the same format.
+    :param tolerance: Fraction by which a phase may exceed its baseline (time or memory).
+    :param min_time_s: Time (seconds) by which a phase may always exceed its baseline (timer noise).
+    :return: List of regressions (strings).
+    """
+    regressions = []
+    for (size, phases) in sorted(results.items(), key=lambda item: int(item[0])):
+        for phase in FrameworkBenchmark.phases:
+            if size not in baselines or phase not in baselines[size]:
+                logging.warning("No baseline for {0} configurations, {1}".format(size, phase))
+                continue
+            (result, baseline) = (phases[phase], baselines[size][phase])
+            if result['time_s'] > max(baseline['time_s'] * (1 + tolerance), baseline['time_s'] + min_time_s):
+                regressions.append("{0} configurations, {1}: {2} s (baseline: {3} s)".format(
+                    size, phase, result['time_s'], baseline['time_s']
+                ))
+            if result['max_rss_kb'] > baseline['max_rss_kb'] * (1 + tolerance):
+                regressions.append("{0} configurations, {1}: {2} KB (baseline: {3} KB)".format(
+                    size, phase, result['max_rss_kb'], baseline['max_rss_kb']
+                ))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the framework itself: time and peak memory of parsing, folder creation, script '
+                    'writing and submission (with a fake qsub), compared with stored baselines.'
+    )
+    parser.add_argument(
+        '-n', '--sizes', metavar='N,N,...', default='10,1000,100000',
+        help='Counts of configurations, across all six programs (default: 10,1000,100000).'
+    )
+    parser.add_argument(
+        '--no-array', action='store_true',
+        help='Submit one job per configuration, instead of one array job per program.'
+    )
+    parser.add_argument(
+        '--tolerance', metavar='FRACTION', type=float, default=0.5,
+        help='Fraction by which a phase may exceed its baseline before it is reported (default: 0.5).'
+    )
+    parser.add_argument(
+        '--min-time', metavar='SECONDS', type=float, default=0.1,
+        help='Time by which a phase may always exceed its baseline (default: 0.1).'
+    )
+    parser.add_argument(
+        '--update-baselines', action='store_true',
+        help="Store the results as the baselines of their counts of configurations."
+    )
+    parser.add_argument(
+        '--keep', action='store_true',
+        help='Keep the temporary folders.'
+    )
+    parser.add_argument(
+        '--run-size', metavar='N', type=int,
+        help=argparse.SUPPRESS  # Run one count of configurations, in a child process, and print its results
+    )
+    args = parser.parse_args()
+    # The framework logs every folder and script: keep warnings only, so that logging is not benchmarked
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.run_size is not None:
+        work_dir = tempfile.mkdtemp(prefix='benchmark_framework_')
+        try:
+            results = FrameworkBenchmark(work_dir, args.run_size, not args.no_array).run()
+        finally:
+            if not args.keep:
+                shutil.rmtree(work_dir)
+        sys.stdout.write(json.dumps(results) + "\n")
+        sys.exit(0)
+    results = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        # Each count runs in a fresh process, so that peak memory is not inherited from smaller counts
+        cmd = [sys.executable, os.path.abspath(__file__), '--run-size', str(size)]
+        if args.no_array:
+            cmd.append('--no-array')
+        if args.keep:
+            cmd.append('--keep')
+        child = subprocess.run(cmd, stdout=subprocess.PIPE)
+        if child.returncode != 0:
+            logging.error("Benchmark of {0} configurations failed".format(size))
+            sys.exit(1)
+        results[str(size)] = json.loads(child.stdout.decode('utf-8').splitlines()[-1])
+    baselines = {}
+    if os.path.exists(baselines_file):
+        with open(baselines_file) as stream:
+            baselines = json.load(stream)
+    if args.update_baselines:
+        baselines.update(results)
+        with open(baselines_file, 'w') as stream:
+            json.dump(baselines, stream, indent=1, sort_keys=True)
+            stream.write("\n")
+        logging.warning("Baselines updated: {0}".format(baselines_file))
+        sys.exit(0)
+    regressions = compare(results, baselines, args.tolerance, args.min_time)
+    for regression in regressions:
+        logging.error("Regression: {0}".format(regression))
+    sys.exit(1 if regressions else 0)
@@ -26,7 +26,8 @@ if __name__ == '__main__':
     )
     parser.add_argument(
         'out', metavar='./benchmark', type=str,
-        help='Overall output folder for the benchmark.'
+        help='Overall output folder for the benchmark. If it exists, the benchmark is resumed:'
+             ' only configurations that have not completed are run again.'
     )
     parser.add_argument(
         'ref', metavar='reference.fa',
@@ -44,11 +45,109 @@ if __name__ == '__main__':
         '-d', '--dry-run', action='store_true',
         help='Do not submit scripts as jobs.'
     )
+    parser.add_argument(
+        '-e', '--executor', choices=['sge', 'local'], default='sge',
+        help='Submit jobs to SGE with qsub, or run them on the local machine (default: sge).'
+    )
+    parser.add_argument(
+        '--local-cores', metavar='N', type=int,
+        help='Count of cores available to jobs run by the local executor (default: all cores).'
+    )
+    parser.add_argument(
+        '-s', '--sample-interval', metavar='SECONDS', type=float,
+        help='Sample CPU, memory, I/O and thread count of each job at this interval (default: no sampling).'
+    )
+    parser.add_argument(
+        '--sample-budget', metavar='FRACTION', type=float, default=0.01,
+        help='Maximal fraction of one core used by the sampler; the interval doubles when exceeded (default: 0.01).'
+    )
+    parser.add_argument(
+        '-a', '--array', action='store_true',
+        help='Submit the configurations of each program as a single array job'
+             ' (except CaVEMan, and programs run with --scatter).'
+    )
+    parser.add_argument(
+        '--array-limit', metavar='N', type=int,
+        help='Maximal count of configurations of each program that run concurrently, with --array (qsub -tc).'
+    )
+    parser.add_argument(
+        '--scatter', action='store_true',
+        help='Run each configuration of MuTect2, VarScan and Virmid as an array job of one task per chunk'
+             ' of the genome (see --split-size, --split-tasks), followed by a job that gathers outputs.'
+    )
+    parser.add_argument(
+        '-r', '--resources', metavar='PROGRAM:SPEC', action='append', default=[],
+        help='Resources of the jobs of a program, e.g. "Strelka:cores=8;memory=16G;queue=long.qc;walltime=24:00:00"'
+             ' (any subset; may be repeated). Resources set the qsub requests and the threads and memory of the'
+             ' tools. They override the defaults in LocalSettings.py, and are overridden by the optional third'
+             ' column of the configuration file.'
+    )
+    split_group = parser.add_mutually_exclusive_group()
+    split_group.add_argument(
+        '--split-size', metavar='BP', type=int,
+        help='Split the genome into balanced chunks of about this size for array jobs (default: one chunk per contig).'
+    )
+    split_group.add_argument(
+        '--split-tasks', metavar='N', type=int,
+        help='Split the genome into at most N balanced chunks for array jobs (default: one chunk per contig).'
+    )
+    parser.add_argument(
+        '--tier', metavar='SPEC',
+        help='Run all configurations on a tier of the input files, created once and cached: the reads of some'
+             ' contigs (comma-separated, e.g. "chr22"), or a random fraction of the reads (e.g. "0.05").'
+             ' Genome splits only cover the contigs of the tier.'
+    )
+    parser.add_argument(
+        '-t', '--truth', metavar='truth.vcf',
+        help='Score the calls of each configuration against this VCF file of true somatic variants (evaluation.json).'
+    )
+    parser.add_argument(
+        '--confident-regions', metavar='regions.bed',
+        help='BED file of confident regions of the truth set; calls and true variants outside are not scored.'
+    )
+    parser.add_argument(
+        '--trace', metavar='trace.json',
+        help='Record timed spans of parsing, folder creation, script writing and submission (e.g. each qsub call)'
+             ' as Chrome trace events (chrome://tracing, Perfetto), and a summary table by phase in'
+             ' trace.json.summary.txt.'
+    )
     args = parser.parse_args()
+    if args.trace is not None:
+        tracer.enable()
+    if args.confident_regions is not None and args.truth is None:
+        parser.error('--confident-regions requires --truth')
+    for truth_file in (args.truth, args.confident_regions):
+        if truth_file is not None and not os.path.isfile(truth_file):
+            parser.error("File not found: {0}".format(truth_file))
+    if args.tier is not None:
+        try:
+            InputTier.parse(args.tier)
+        except ValueError as err:
+            parser.error(str(err))
     logging.info("Current working directory: {0}".format(os.getcwd()))
+    resources_by_program = {}
+    for program_spec in args.resources:
+        if ':' not in program_spec:
+            parser.error("Invalid --resources (expected PROGRAM:SPEC): {0}".format(program_spec))
+        (program, spec) = program_spec.split(':', 1)
+        resources_by_program[program] = Resources.parse(spec)
     bc = PairedBenchmarkConfiguration(args.config, args.out)
-    bc.make_dir_structure()
-    bc.write_scripts(args.ref, args.file1, args.file2)
+    bc.set_resources(resources_by_program)
+    bc.make_dir_structure(args.ref, args.file1, args.file2, args.tier)
+    bc.write_scripts(
+        args.ref, args.file1, args.file2, args.sample_interval, args.sample_budget, args.split_size, args.split_tasks,
+        args.scatter, args.truth, args.confident_regions
+    )
     if not args.dry_run:
-        bc.submit_scripts()
+        if args.executor == 'local':
+            executor = LocalExecutor(args.local_cores)
+        else:
+            executor = SGEExecutor(default_queue)
+        bc.submit_scripts(executor, args.array, args.array_limit)
+    if args.trace is not None:
+        tracer.write(args.trace)
+        summary = tracer.summary()
+        with open("{0}.summary.txt".format(args.trace), 'w') as stream:
+            stream.write(summary)
+        logging.info("Trace summary:\n{0}".format(summary))
     logging.info('Main script completed.')